@@ -1,3 +1,11 @@
+"""
+Command line interface.
+
+Command implementations are imported inside each command so that parsing arguments, `--help` and
+`route_cmd` don't pay for importing black, pathspec, requests etc. Keep it that way:
+tests/test_cli_startup.py fails if a command's startup gets slow.
+"""
+# pylint: disable=import-outside-toplevel
 import os.path
 import sys
 from pathlib import Path
@@ -5,9 +13,6 @@ from pathlib import Path
 import click
 
 from hasty_coder.log_utils import configure_logging
-from hasty_coder.main import write_file, write_project
-from hasty_coder.tasklib.add_comments import add_comments_to_all_code_in_path
-from hasty_coder.tasklib.generate_software_project_plan import generate_project_plan
 
 
 @click.group()
@@ -26,9 +31,24 @@ def cli():
 
 @cli.command("comments")
 @click.argument("path", type=click.Path(exists=True))
-def add_docstrings(path):
+@click.option(
+    "--enqueue",
+    "queue_path",
+    type=click.Path(dir_okay=False),
+    help="Add the work to this queue for `hc worker` instead of doing it now.",
+)
+def add_docstrings(path, queue_path):
     """Add docstrings to all python files in PATH."""
+    from hasty_coder.tasklib.add_comments import add_comments_to_all_code_in_path
+
     path = os.path.abspath(path)
+    if queue_path:
+        from hasty_coder.workqueue import enqueue_comments
+
+        job_count = enqueue_comments(queue_path, path)
+        print(f"Queued {job_count} snippets in {queue_path}")
+        return
+
     if click.confirm(
         f"This is gonna edit all the python files in `{path}` Are you sure?"
     ):
@@ -36,28 +56,176 @@ def add_docstrings(path):
 
 
 @cli.command("project")
-@click.argument("description")
+@click.argument("description", default="")
 @click.argument("path", type=click.Path(exists=True), default=".")
-def make_project(description, path):
+@click.option(
+    "--resume",
+    "resume_path",
+    type=click.Path(exists=True, file_okay=False),
+    help="Finish an interrupted run in this project folder, skipping finished files.",
+)
+@click.option(
+    "--plan",
+    "plan_path",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Build the plan in this json file, like one written by `hc project-plan`.",
+)
+@click.option(
+    "--fast-plan",
+    is_flag=True,
+    help="Generate the plan in one completion instead of one per section.",
+)
+@click.option(
+    "--llm-file",
+    "llm_files",
+    multiple=True,
+    envvar="HASTY_CODER_LLM_FILES",
+    help="Generate this file with the LLM even if there is a template for it, like `Makefile`. Repeatable.",
+)
+@click.option(
+    "--batch",
+    "batch_path",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Create a project for each description in this jsonl file, all at once.",
+)
+@click.option(
+    "--out",
+    "out_path",
+    type=click.Path(file_okay=False),
+    help="Where to create the batch's projects. Defaults to PATH.",
+)
+@click.option(
+    "--max-projects", default=4, help="How many batch projects to work on at once."
+)
+@click.option(
+    "--max-concurrency",
+    default=8,
+    help="How many completions a batch makes at once, across all its projects.",
+)
+def make_project(  # pylint: disable=too-many-arguments
+    description,
+    path,
+    resume_path,
+    plan_path,
+    fast_plan,
+    llm_files,
+    batch_path,
+    out_path,
+    max_projects,
+    max_concurrency,
+):
     """Create a project with the given description."""
-    write_project(Path(path), description, show_work=True)
+    if resume_path:
+        from hasty_coder.main import finish_project
+
+        finish_project(os.path.abspath(resume_path), llm_files=llm_files)
+        return
+
+    if batch_path:
+        from hasty_coder.main import write_projects
+
+        out_path = Path(out_path or path)
+        out_path.mkdir(parents=True, exist_ok=True)
+        write_projects(
+            batch_path,
+            out_path,
+            max_projects=max_projects,
+            max_concurrent_completions=max_concurrency,
+            fast_plan=fast_plan,
+            llm_files=llm_files,
+        )
+        return
+
+    from hasty_coder.main import write_project
+
+    write_project(
+        Path(path),
+        description,
+        show_work=True,
+        plan_path=plan_path,
+        fast_plan=fast_plan,
+        llm_files=llm_files,
+    )
 
 
 @cli.command("project-plan")
 @click.argument("description", required=False)
-def make_project_plan(description):
-    """Generate and write a project plan to a markdown file."""
-    project_description = generate_project_plan(description)
+@click.option(
+    "--fast-plan",
+    is_flag=True,
+    help="Generate the plan in one completion instead of one per section.",
+)
+def make_project_plan(description, fast_plan):
+    """Generate and write a project plan to markdown and json files."""
+    from hasty_coder.tasklib.generate_software_project_plan import (
+        generate_project_plan,
+        generate_project_plan_fast,
+    )
+
+    if fast_plan:
+        project_description = generate_project_plan_fast(description)
+    else:
+        project_description = generate_project_plan(description)
     filename = f"{project_description.slug}-plan.md"
     with open(filename, "w", encoding="utf-8") as f:
         f.write(project_description.as_markdown())
-    print(f"\n\nProject plan written to {filename}")
+    json_filename = f"{project_description.slug}-plan.json"
+    with open(json_filename, "wb") as f:
+        f.write(project_description.to_json())
+    print(f"\n\nProject plan written to {filename} and {json_filename}")
+    print(f"Build it with `hc project --plan {json_filename}`")
 
 
 @cli.command("lint")
 @click.argument("path", type=click.Path(exists=True), default=".")
-def lint(path):
-    """AI linting of a file or path"""
+@click.option("--max-tokens", type=int, help="Stop after using this many tokens.")
+@click.option("--max-seconds", type=float, help="Stop after this many seconds.")
+@click.option("--max-cost", type=float, help="Stop after spending this many dollars.")
+@click.option(
+    "--enqueue",
+    "queue_path",
+    type=click.Path(dir_okay=False),
+    help="Add the work to this queue for `hc worker` instead of doing it now.",
+)
+def lint(path, max_tokens, max_seconds, max_cost, queue_path):
+    """AI linting of a file or path. Riskiest code is reviewed first."""
+    from hasty_coder.tasklib.review_scheduler import (
+        ReviewBudget,
+        ReviewCoverage,
+        review_path_prioritized,
+    )
+
+    if queue_path:
+        from hasty_coder.workqueue import enqueue_review
+
+        job_count = enqueue_review(queue_path, path)
+        print(f"Queued {job_count} snippets in {queue_path}")
+        return
+
+    budget = ReviewBudget(
+        max_tokens=max_tokens, max_seconds=max_seconds, max_cost=max_cost
+    )
+    coverage = ReviewCoverage()
+    for snippet, comments in review_path_prioritized(path, budget, coverage):
+        for line_no, comment in comments:
+            print(f"{snippet.filepath}:{line_no} - {comment}")
+    print(coverage.summary())
+
+
+@cli.command("gitignore-pack")
+@click.argument("mirror_path", type=click.Path(exists=True, file_okay=False))
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False),
+    help="Where to write the pack. Defaults to the pack shipped with hasty-coder.",
+)
+def gitignore_pack(mirror_path, output):
+    """Rebuild the offline gitignore template pack from a local checkout of github/gitignore."""
+    from hasty_coder.gitignore_pack import DEFAULT_PACK_PATH, build_gitignore_pack
+
+    output = output or DEFAULT_PACK_PATH
+    template_count = build_gitignore_pack(mirror_path, output)
+    print(f"Packed {template_count} templates into {output}")
 
 
 @cli.command("file")
@@ -65,26 +233,105 @@ def lint(path):
 @click.argument("description", required=False)
 def mkfile(path, description):
     """Write a single file"""
+    from hasty_coder.main import write_file
+
     write_file(Path(path).absolute(), description=description)
 
 
 @cli.command("test")
 @click.argument("path", type=click.Path(exists=True), default=".")
-@click.argument("description", required=False)
-def test(path):
-    """Write tests"""
+@click.option(
+    "--output-dir",
+    type=click.Path(file_okay=False),
+    help="Where to write the tests. Defaults to tests/generated in the project.",
+)
+@click.option("--workers", default=4, help="How many tests to generate at once.")
+@click.option("--max-attempts", default=3, help="Tries per function.")
+@click.option(
+    "--timeout", "per_test_timeout", default=10, help="Seconds each test may run."
+)
+@click.option(
+    "--coverage-threshold",
+    type=click.FloatRange(0, 1),
+    help="Run the existing tests under coverage first and only target functions covered less than this.",
+)
+def test(path, output_dir, workers, max_attempts, per_test_timeout, coverage_threshold):
+    """Write passing tests for the functions in PATH."""
+    from hasty_coder.main import write_tests
+
+    write_tests(
+        path,
+        output_dir=output_dir,
+        max_generation_workers=workers,
+        max_attempts=max_attempts,
+        per_test_timeout=per_test_timeout,
+        coverage_threshold=coverage_threshold,
+    )
+
+
+@cli.command("worker")
+@click.argument("queue_path", type=click.Path(dir_okay=False))
+@click.option("--wait", is_flag=True, help="Keep waiting for new jobs when idle.")
+def worker(queue_path, wait):
+    """Process jobs from a queue made with `--enqueue`."""
+    from hasty_coder.workqueue import run_worker
+
+    processed = run_worker(queue_path, wait=wait)
+    print(f"Processed {processed} jobs")
+
+
+@cli.command("apply")
+@click.argument("queue_path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--yes", is_flag=True, help="Don't ask for confirmation.")
+def apply_queue_results(queue_path, yes):
+    """Apply the results of a queue once the workers are done."""
+    from hasty_coder.tasklib.add_comments import apply_comment_edits
+    from hasty_coder.workqueue import WorkQueue, review_comments
+
+    with WorkQueue(queue_path) as queue:
+        counts = queue.counts()
+        comment_results = [
+            tuple(row) for _, rows in queue.results("comments") for row in rows
+        ]
+        review_results = queue.results("review")
+    if counts.get("pending") or counts.get("leased"):
+        print(f"Warning: the queue isn't finished yet: {counts}")
+    if counts.get("failed"):
+        print(f"Warning: {counts['failed']} jobs failed")
+
+    for payload, comments in review_results:
+        for filepath, line_no, comment in review_comments(payload, comments):
+            print(f"{filepath}:{line_no} - {comment}")
+
+    if comment_results and (
+        yes or click.confirm(f"Apply {len(comment_results)} docstring edits?")
+    ):
+        applied = apply_comment_edits(comment_results)
+        if applied < len(comment_results):
+            print(
+                f"Warning: skipped {len(comment_results) - applied} edits to files that changed since they were queued"
+            )
+
+
+@cli.command("serve")
+@click.option("--socket", "socket_path", help="Unix socket to listen on.")
+def serve(socket_path):
+    """Keep hc warm in the background. Other hc commands are forwarded to it."""
+    from hasty_coder.daemon import serve as serve_daemon
+
+    serve_daemon(socket_path)
 
 
 def route_cmd():
     """Route command line arguments to appropriate subcommand"""
+    from hasty_coder.daemon import forward_to_daemon
+
     configure_logging()
     if len(sys.argv) == 2:
         subcommands = set(cli.commands.keys())
         if sys.argv[1] in subcommands:
-            cli()
-            return
-
-        if sys.argv[1].lower().startswith("yolo"):
+            pass
+        elif sys.argv[1].lower().startswith("yolo"):
             print("YOLO! 😎🤘🏼👊")
             sys.argv[1] = "project"
             sys.argv.append("")
@@ -93,6 +340,10 @@ def route_cmd():
 
         # else:
         #     sys.argv.insert(1, "project")
+
+    exit_code = forward_to_daemon(sys.argv[1:])
+    if exit_code is not None:
+        sys.exit(exit_code)
     cli()
 
 
@@ -0,0 +1,248 @@
+"""
+Keep a warm `hc` process around and forward commands to it over a unix socket.
+
+`hc serve` imports everything once and then runs forwarded commands in-process, so the parse cache, the
+gitignore spec cache, the pooled HTTP connections and the completion cache survive between commands.
+`route_cmd` forwards to the daemon whenever its socket exists.
+
+Protocol: the client sends one json line `{"argv": [...], "cwd": "...", "env_digest": "..."}`. The server answers
+with json lines `{"output": "..."}` as the command prints, then `{"exit_code": N}`. Settings come from
+HASTY_CODER_* and OPENAI_* env vars, so if the client's differ from the daemon's (compared by digest, so keys
+never cross the socket) the server answers `{"run_locally": true}` and the client runs the command itself.
+
+Both ends check that the other is run by the same user, with SO_PEERCRED where the OS has it and otherwise by
+requiring the socket's folder to be private.
+
+This module is imported by `route_cmd` on every invocation so it must stay cheap to import.
+"""
+import hashlib
+import json
+import os
+import socket
+import struct
+import sys
+import tempfile
+
+# commands that never get forwarded. `comments` and `apply` ask for confirmation on stdin.
+LOCAL_ONLY_COMMANDS = {"serve", "comments", "apply", "worker"}
+
+
+SETTINGS_ENV_PREFIXES = ("HASTY_CODER_", "OPENAI_")
+# env vars that only matter for reaching the daemon
+DAEMON_ENV_VARS = {"HASTY_CODER_SOCKET", "HASTY_CODER_NO_DAEMON"}
+
+
+def get_socket_path():
+    if os.getenv("HASTY_CODER_SOCKET"):
+        return os.getenv("HASTY_CODER_SOCKET")
+    if os.getenv("XDG_RUNTIME_DIR"):
+        return os.path.join(
+            os.getenv("XDG_RUNTIME_DIR"), f"hasty-coder-{os.getuid()}.sock"
+        )
+    # the shared temp dir needs a private folder
+    return get_default_tempdir_socket_path()
+
+
+def settings_env_digest(environ=None):
+    """Return a digest of the env vars that change how commands behave."""
+    environ = os.environ if environ is None else environ
+    settings = sorted(
+        (name, value)
+        for name, value in environ.items()
+        if name.startswith(SETTINGS_ENV_PREFIXES) and name not in DAEMON_ENV_VARS
+    )
+    return hashlib.sha256(json.dumps(settings).encode("utf-8")).hexdigest()
+
+
+def is_private_dir(path):
+    """Return whether path is a folder only the current user can get into."""
+    try:
+        stat = os.lstat(path)
+    except FileNotFoundError:
+        return False
+    return stat.st_uid == os.getuid() and not stat.st_mode & 0o077
+
+
+def make_private_dir(path):
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if not is_private_dir(path):
+        raise PermissionError(
+            f"{path} must be a folder owned by you that nobody else can access"
+        )
+
+
+def is_same_user(sock, socket_path):
+    """Return whether the process at the other end of a unix socket is run by the current user."""
+    if hasattr(socket, "SO_PEERCRED"):
+        creds = struct.Struct("3i")
+        _, uid, _ = creds.unpack(
+            sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, creds.size)
+        )
+        return uid == os.getuid()
+    return is_private_dir(os.path.dirname(os.path.abspath(socket_path)))
+
+
+def forward_to_daemon(argv, socket_path=None, stdout=None):
+    """
+    Run a command in the daemon, streaming its output to stdout.
+
+    Returns the exit code, or None if no daemon is listening.
+    """
+    socket_path = socket_path or get_socket_path()
+    stdout = stdout or sys.stdout
+    if os.getenv("HASTY_CODER_NO_DAEMON") or not os.path.exists(socket_path):
+        return None
+    if argv and argv[0] in LOCAL_ONLY_COMMANDS:
+        return None
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+    except OSError:
+        client.close()
+        return None
+
+    with client:
+        if not is_same_user(client, socket_path):
+            return None
+        request = {
+            "argv": list(argv),
+            "cwd": os.getcwd(),
+            "env_digest": settings_env_digest(),
+        }
+        client.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        for line in client.makefile("r", encoding="utf-8"):
+            message = json.loads(line)
+            if message.get("run_locally"):
+                return None
+            if "output" in message:
+                stdout.write(message["output"])
+                stdout.flush()
+            elif "exit_code" in message:
+                return message["exit_code"]
+    # the daemon went away mid-command
+    return 1
+
+
+class _SocketWriter:
+    """File-like object that streams writes to the client as json lines."""
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, text):
+        if not isinstance(text, str):
+            # behave like a text stream so click doesn't send us bytes
+            raise TypeError(f"write() argument must be str, not {type(text).__name__}")
+        if text:
+            self.send({"output": text})
+        return len(text)
+
+    def send(self, message):
+        self.wfile.write(json.dumps(message).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+def serve(socket_path=None):
+    """Run the daemon until interrupted."""
+    socket_path = socket_path or get_socket_path()
+    server = make_server(socket_path)
+    with server:
+        print(f"Serving hc at {socket_path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+
+
+def make_server(socket_path):
+    """Warm up and return a server listening on socket_path."""
+    # pylint: disable=import-outside-toplevel
+    import contextlib
+    import io
+    import logging
+    import socketserver
+
+    import click
+
+    from hasty_coder.cli import cli
+
+    warm_up()
+    make_private_dir_for_socket(socket_path)
+    if os.path.exists(socket_path):
+        if forward_to_daemon(["--help"], socket_path, stdout=io.StringIO()) == 0:
+            raise click.ClickException(f"hc is already being served at {socket_path}")
+        os.remove(socket_path)
+
+    class CommandHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            if not is_same_user(self.request, socket_path):
+                return
+            request = json.loads(self.rfile.readline())
+            writer = _SocketWriter(self.wfile)
+            if request.get("env_digest") != settings_env_digest():
+                writer.send({"run_locally": True})
+                return
+            log_handler = logging.StreamHandler(writer)
+            log_handler.setFormatter(logging.Formatter("%(message)s"))
+            hasty_logger = logging.getLogger("hasty_coder")
+            previous_cwd = os.getcwd()
+            exit_code = 0
+            hasty_logger.addHandler(log_handler)
+            try:
+                os.chdir(request["cwd"])
+                with contextlib.redirect_stdout(writer), contextlib.redirect_stderr(
+                    writer
+                ):
+                    try:
+                        exit_code = cli.main(
+                            args=request["argv"], prog_name="hc", standalone_mode=False
+                        )
+                    except click.ClickException as e:
+                        e.show(file=writer)
+                        exit_code = e.exit_code
+                    except click.Abort:
+                        print("Aborted!")
+                        exit_code = 1
+                    except SystemExit as e:
+                        exit_code = e.code if isinstance(e.code, int) else 1
+                    except Exception as e:  # pylint: disable=broad-except
+                        hasty_logger.exception("Command failed: %s", e)
+                        exit_code = 1
+                writer.send({"exit_code": exit_code or 0})
+            except BrokenPipeError:
+                pass
+            finally:
+                hasty_logger.removeHandler(log_handler)
+                os.chdir(previous_cwd)
+
+    # commands run one at a time since they share the working directory and stdout
+    return socketserver.UnixStreamServer(socket_path, CommandHandler)
+
+
+def make_private_dir_for_socket(socket_path):
+    """Create the folder of the default socket in the shared temp dir so only the current user can use it."""
+    socket_dir = os.path.dirname(os.path.abspath(socket_path))
+    if socket_dir == os.path.dirname(get_default_tempdir_socket_path()):
+        make_private_dir(socket_dir)
+
+
+def get_default_tempdir_socket_path():
+    return os.path.join(tempfile.gettempdir(), f"hasty-coder-{os.getuid()}", "hc.sock")
+
+
+def warm_up():
+    """Import the modules commands need so the first forwarded command is fast too."""
+    # pylint: disable=import-outside-toplevel,unused-import
+    import hasty_coder.main
+    import hasty_coder.tasklib.add_comments
+    import hasty_coder.tasklib.review_scheduler  # noqa
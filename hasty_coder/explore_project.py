@@ -1,4 +1,5 @@
 import os.path
+import subprocess
 
 PROJECT_ROOT_FILES = ("pyproject.toml", "setup.py", ".git")
 
@@ -16,3 +17,43 @@ def find_project_root(starting_path, trigger_files=PROJECT_ROOT_FILES, max_depth
             return None
         current_path = parent_path
     return None
+
+
+def get_git_file_churn(path, since="1 year ago"):
+    """
+    Return git churn for every file changed under a path.
+
+    The result maps absolute file paths to `(commit_count, last_commit_timestamp)`. Returns an empty dict if
+    the path is not inside a git repository or git is not installed.
+    """
+    path = os.path.abspath(path)
+    cwd = path if os.path.isdir(path) else os.path.dirname(path)
+    try:
+        repo_root = subprocess.run(
+            ["git", "rev-parse", "--show-toplevel"],
+            cwd=cwd,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        log_output = subprocess.run(
+            ["git", "log", f"--since={since}", "--format=%x00%ct", "--name-only"],
+            cwd=repo_root,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return {}
+
+    churn = {}
+    for commit_chunk in log_output.split("\x00"):
+        lines = [line for line in commit_chunk.splitlines() if line.strip()]
+        if not lines:
+            continue
+        timestamp = int(lines[0])
+        for rel_path in lines[1:]:
+            abs_path = os.path.join(repo_root, rel_path)
+            commit_count, last_timestamp = churn.get(abs_path, (0, 0))
+            churn[abs_path] = (commit_count + 1, max(last_timestamp, timestamp))
+    return churn
@@ -1,43 +1,392 @@
+import atexit
+import gzip
+import logging
 import os.path
 import tempfile
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from hashlib import md5
 
+import orjson
 import requests
 
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
 
-def get_cached_url_contents(url, cache_duration_seconds=60 * 60 * 24 * 7):
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DURATION_SECONDS = 60 * 60 * 24 * 7
+MAX_CACHE_BYTES = 200 * 1024 * 1024
+MAX_CACHE_ENTRIES = 2000
+MAX_MEMORY_CACHE_BYTES = 32 * 1024 * 1024
+INDEX_FILENAME = "index.json"
+# temp files older than this were left behind by a crashed writer
+ORPHANED_TEMP_FILE_SECONDS = 60 * 60
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# in-memory layer in front of the disk cache, least recently used first. key -> (contents, fetched_at)
+_memory_cache = OrderedDict()
+_memory_cache_bytes = 0
+# requests currently being downloaded. key -> Future
+_inflight = {}
+# sidecar index of the disk cache. key -> metadata dict
+_index = None
+_index_dirty = False
+_lock = threading.RLock()
+_background_executor = None
+# reuse connections across downloads
+_session = requests.Session()
+
+
+def get_cache_dir():
+    return os.path.join(tempfile.gettempdir(), "hasty-coder/filecache/")
+
+
+def get_cached_url_contents(
+    url,
+    cache_duration_seconds=DEFAULT_CACHE_DURATION_SECONDS,
+    stale_while_revalidate=True,
+):
     """
     Return the contents of a url
 
-    Cache responses for `cache_duration_seconds` in files in the os-appropriate temp dir in
-    a subfolder `hasty-coder/filecache/`. They key should be an md5 of the url.
+    Cache responses for `cache_duration_seconds` in memory and in compressed files in the os-appropriate temp
+    dir in a subfolder `hasty-coder/filecache/`. They key should be an md5 of the url.
 
-    If the cached file is older than cache_duration_seconds it should be replaced with a new one in
-    an atomic fashion.
+    Concurrent requests for the same url share a single download. If the cached contents are older than
+    cache_duration_seconds they are returned anyway while the url is revalidated in the background
+    (unless `stale_while_revalidate` is False). Revalidation is a conditional request, so an unchanged url
+    only refreshes the entry's timestamp. The disk cache is kept under MAX_CACHE_BYTES and MAX_CACHE_ENTRIES
+    and the memory cache under MAX_MEMORY_CACHE_BYTES by evicting the least recently used entries.
     """
     key = md5(url.encode("utf-8")).hexdigest()
-    cache_dir = os.path.join(tempfile.gettempdir(), "hasty-coder/filecache/")
-    cache_file = os.path.join(cache_dir, key)
+    cached = _read_cache(key)
+    if cached is not None:
+        contents, fetched_at = cached
+        if fetched_at > time.time() - cache_duration_seconds:
+            return contents
+        if stale_while_revalidate:
+            _get_background_executor().submit(_refresh_in_background, url, key)
+            return contents
+
+    return _fetch_singleflight(url, key)
+
+
+def prefetch_urls(urls, cache_duration_seconds=DEFAULT_CACHE_DURATION_SECONDS):
+    """Warm the cache for urls in background threads. Returns a list of futures."""
+    return [
+        _get_background_executor().submit(
+            get_cached_url_contents, url, cache_duration_seconds
+        )
+        for url in urls
+    ]
+
+
+def clear_memory_cache():
+    """Forget everything held in memory, including the loaded index."""
+    global _index, _index_dirty, _memory_cache_bytes  # pylint: disable=global-statement
+    with _lock:
+        _memory_cache.clear()
+        _memory_cache_bytes = 0
+        _index = None
+        _index_dirty = False
+
+
+def _read_cache(key):
+    """Return (contents, fetched_at) from memory or disk, or None if the key isn't cached."""
+    with _lock:
+        cached = _memory_cache.get(key)
+        if cached is not None:
+            _memory_cache.move_to_end(key)
+            _touch(key)
+            return cached
+        entry = _get_index().get(key)
+        if entry is None:
+            # maybe written by another process (like `hc serve`) since we loaded the index
+            entry = _load_index_file().get(key)
+            if entry is not None:
+                _get_index()[key] = entry
+
+    cache_file = os.path.join(get_cache_dir(), key)
+    try:
+        with open(cache_file, "rb") as f:
+            data = f.read()
+        if entry is None:
+            # written by an older version or a process that hasn't saved its index yet
+            entry = {
+                "codec": _detect_codec(data),
+                "fetched_at": os.path.getmtime(cache_file),
+            }
+        contents = _decompress(entry.get("codec"), data)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, EOFError):
+        logger.warning("Discarding corrupt cache entry %s", cache_file)
+        _remove_entry(key)
+        return None
+
+    with _lock:
+        _remember(key, contents, entry["fetched_at"])
+        _touch(key)
+    return contents, entry["fetched_at"]
+
+
+def _fetch_singleflight(url, key):
+    """Download a url, making concurrent callers for the same key wait on a single request."""
+    with _lock:
+        future = _inflight.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = Future()
+            _inflight[key] = future
+
+    if is_leader:
+        try:
+            future.set_result(_download(url, key))
+        except BaseException as e:  # pylint: disable=broad-except
+            future.set_exception(e)
+        finally:
+            with _lock:
+                _inflight.pop(key, None)
+
+    return future.result()
+
+
+def _refresh_in_background(url, key):
+    try:
+        _fetch_singleflight(url, key)
+    except Exception:  # pylint: disable=broad-except
+        logger.warning("Background refresh of %s failed", url, exc_info=True)
+
+
+def _download(url, key):
+    """Download a url into the cache, revalidating with a conditional request if we already have a copy."""
+    with _lock:
+        entry = dict(_get_index().get(key) or {})
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+
+    response = _session.get(url, headers=headers, timeout=60)
+    if response.status_code == 304:
+        cached = _read_cache(key)
+        if cached is not None:
+            logger.debug("Not modified: %s", url)
+            contents, _ = cached
+            now = time.time()
+            with _lock:
+                _remember(key, contents, now)
+                _update_index(key, fetched_at=now, last_access=now)
+            _save_index()
+            return contents
+        # our copy disappeared, ask again without conditions
+        response = _session.get(url, timeout=60)
+    response.raise_for_status()
+    contents = response.content
 
     # Ensure the cache folder exists
+    cache_dir = get_cache_dir()
     os.makedirs(cache_dir, exist_ok=True)
+    codec, data = _compress(contents)
+    with tempfile.NamedTemporaryFile(mode="wb", dir=cache_dir, delete=False) as f:
+        f.write(data)
+
+    # Atomically rename the temporary file to the cache file
+    os.replace(f.name, os.path.join(cache_dir, key))
+
+    now = time.time()
+    with _lock:
+        _remember(key, contents, now)
+        _update_index(
+            key,
+            url=url,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+            codec=codec,
+            size=len(data),
+            fetched_at=now,
+            last_access=now,
+        )
+    _evict()
+    _save_index()
+    return contents
+
+
+def _remember(key, contents, fetched_at):
+    """Hold contents in memory, forgetting the least recently used beyond MAX_MEMORY_CACHE_BYTES. Needs the lock."""
+    global _memory_cache_bytes  # pylint: disable=global-statement
+    _forget(key)
+    _memory_cache[key] = (contents, fetched_at)
+    _memory_cache_bytes += len(contents)
+    while _memory_cache_bytes > MAX_MEMORY_CACHE_BYTES and len(_memory_cache) > 1:
+        _forget(next(iter(_memory_cache)))
 
-    if (
-        os.path.exists(cache_file)
-        and os.path.getmtime(cache_file) > time.time() - cache_duration_seconds
+
+def _forget(key):
+    """Drop a key from memory. Needs the lock."""
+    global _memory_cache_bytes  # pylint: disable=global-statement
+    cached = _memory_cache.pop(key, None)
+    if cached is not None:
+        _memory_cache_bytes -= len(cached[0])
+
+
+def _compress(contents):
+    """Return (codec, compressed_bytes) using zstd if it is installed, otherwise gzip."""
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor().compress(contents)
+    return "gzip", gzip.compress(contents, compresslevel=6)
+
+
+def _detect_codec(data):
+    """Guess how cache file data was compressed from its magic bytes."""
+    if data.startswith(ZSTD_MAGIC):
+        return "zstd"
+    if data.startswith(GZIP_MAGIC):
+        return "gzip"
+    return None
+
+
+def _decompress(codec, data):
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "gzip":
+        return gzip.decompress(data)
+    return data
+
+
+def _get_index():
+    """Load the sidecar index. Must be called while holding the lock."""
+    global _index  # pylint: disable=global-statement
+    if _index is None:
+        _index = _load_index_file()
+    return _index
+
+
+def _load_index_file():
+    index_path = os.path.join(get_cache_dir(), INDEX_FILENAME)
+    try:
+        with open(index_path, "rb") as f:
+            return orjson.loads(f.read())
+    except FileNotFoundError:
+        return {}
+    except orjson.JSONDecodeError:
+        logger.warning("Ignoring corrupt cache index %s", index_path)
+        return {}
+
+
+def _update_index(key, **metadata):
+    global _index_dirty  # pylint: disable=global-statement
+    entry = _get_index().setdefault(key, {"codec": None})
+    entry.update(metadata)
+    _index_dirty = True
+
+
+def _touch(key):
+    if key in _get_index():
+        _update_index(key, last_access=time.time())
+
+
+def _remove_entry(key):
+    global _index_dirty  # pylint: disable=global-statement
+    with _lock:
+        _forget(key)
+        _get_index().pop(key, None)
+        _index_dirty = True
+    _remove_file(os.path.join(get_cache_dir(), key))
+
+
+def _evict():
+    """
+    Remove the least recently used entries until the cache fits its limits.
+
+    The cache folder is scanned rather than trusting the index, so files written by other processes are counted
+    (and evicted) too. Temp files left behind by crashed writers are removed. The scan happens without the lock
+    so reads and downloads aren't blocked by it.
+    """
+    cache_dir = get_cache_dir()
+    now = time.time()
+    # key -> stat
+    stats = {}
+    try:
+        dir_entries = list(os.scandir(cache_dir))
+    except FileNotFoundError:
+        dir_entries = []
+    for dir_entry in dir_entries:
+        if not dir_entry.is_file() or dir_entry.name == INDEX_FILENAME:
+            continue
+        try:
+            stat = dir_entry.stat()
+        except FileNotFoundError:
+            continue
+        if dir_entry.name.startswith("tmp"):
+            if stat.st_mtime < now - ORPHANED_TEMP_FILE_SECONDS:
+                _remove_file(dir_entry.path)
+            continue
+        stats[dir_entry.name] = stat
+
+    # key -> (last_access, size)
+    entries = {}
+    with _lock:
+        index = _get_index()
+        for key, stat in stats.items():
+            entry = index.get(key) or {}
+            entries[key] = (entry.get("last_access", stat.st_mtime), stat.st_size)
+    entries = sorted(entries.items(), key=lambda item: item[1][0])
+    total_bytes = sum(size for _, (_, size) in entries)
+    while entries and (
+        total_bytes > MAX_CACHE_BYTES or len(entries) > MAX_CACHE_ENTRIES
     ):
-        with open(cache_file, "rb") as f:
-            contents = f.read()
-    else:
-        response = requests.get(url, timeout=60)
-        response.raise_for_status()
-        contents = response.content
+        key, (_, size) = entries.pop(0)
+        total_bytes -= size
+        logger.debug("Evicting %s from the cache", key)
+        _remove_entry(key)
 
-        with tempfile.NamedTemporaryFile(mode="wb", delete=False) as tmp_file:
-            tmp_file.write(contents)
 
-        # Atomically rename the temporary file to the cache file
-        os.replace(tmp_file.name, cache_file)
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
 
-    return contents
+
+def _save_index():
+    """Atomically write the index, merging in entries written by other processes."""
+    global _index_dirty  # pylint: disable=global-statement
+    cache_dir = get_cache_dir()
+    with _lock:
+        if not _index_dirty:
+            return
+        index = _get_index()
+        on_disk = _load_index_file()
+        for key, entry in on_disk.items():
+            if key in index:
+                continue
+            if os.path.exists(os.path.join(cache_dir, key)):
+                index[key] = entry
+        os.makedirs(cache_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(mode="wb", dir=cache_dir, delete=False) as f:
+            f.write(orjson.dumps(index))
+        os.replace(f.name, os.path.join(cache_dir, INDEX_FILENAME))
+        _index_dirty = False
+
+
+atexit.register(_save_index)
+
+
+def _get_background_executor():
+    global _background_executor  # pylint: disable=global-statement
+    with _lock:
+        if _background_executor is None:
+            _background_executor = ThreadPoolExecutor(
+                max_workers=4, thread_name_prefix="filecache"
+            )
+    return _background_executor
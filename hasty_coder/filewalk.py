@@ -10,22 +10,19 @@ def find_project_root(start_path):
 
     The project root is identified by the presence of a '.git' directory inside it.
     """
-    current_path = Path(start_path)
+    current_path = Path(start_path).absolute()
 
-    while current_path != current_path.root:
-        if (current_path / ".git").is_dir():
+    while True:
+        if (current_path / ".git").is_dir() or (current_path / ".hg").is_dir():
             return str(current_path)
 
-        if (current_path / ".hg").is_dir():
-            return current_path, ".hg directory"
-
         if (current_path / "pyproject.toml").is_file():
-            return current_path, "pyproject.toml"
+            return str(current_path)
 
+        if current_path.parent == current_path:
+            return None
         current_path = current_path.parent
 
-    return None
-
 
 ALWAYS_IGNORE = """
 .git
@@ -48,19 +45,34 @@ dist
 __pypackages__
 """
 
+ALWAYS_IGNORE_NAMES = frozenset(ALWAYS_IGNORE.split())
+
+# gitignore path -> (mtime, spec). Kept warm between commands by `hc serve`.
+_gitignore_spec_cache = {}
+
 
 def load_gitignore_spec_at_path(path):
     gitignore_path = os.path.join(path, ".gitignore")
-    if os.path.exists(gitignore_path):
+    try:
+        mtime = os.stat(gitignore_path).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    cached = _gitignore_spec_cache.get(gitignore_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    if mtime is not None:
         with open(gitignore_path, "r", encoding="utf-8") as f:
             patterns = f.read().split("\n")
         ignore_spec = pathspec.PathSpec.from_lines("gitwildmatch", patterns)
     else:
         ignore_spec = pathspec.PathSpec.from_lines("gitwildmatch", [])
+    _gitignore_spec_cache[gitignore_path] = (mtime, ignore_spec)
     return ignore_spec
 
 
 def get_nonignored_file_paths(directory, gitignore_dict=None, extensions=tuple()):
+    """Return paths of files that aren't gitignored, optionally only those ending in one of `extensions`."""
     return_relative = False
     if gitignore_dict is None:
         gitignore_dict = {}
@@ -73,18 +85,20 @@ def get_nonignored_file_paths(directory, gitignore_dict=None, extensions=tuple()
     file_paths = []
 
     for entry in os.scandir(directory):
+        if entry.name in ALWAYS_IGNORE_NAMES:
+            continue
         if path_is_ignored(Path(entry.path), gitignore_dict):
             continue
 
         if entry.is_file():
-            if any(entry.path.endswith(ext) for ext in extensions):
+            if extensions and not any(entry.path.endswith(ext) for ext in extensions):
                 continue
 
             file_paths.append(entry.path)
 
         elif entry.is_dir():
             subdir_file_paths = get_nonignored_file_paths(
-                entry.path, gitignore_dict=gitignore_dict
+                entry.path, gitignore_dict=gitignore_dict, extensions=extensions
             )
             file_paths.extend(subdir_file_paths)
     if return_relative:
@@ -0,0 +1,137 @@
+"""
+A single-file pack of gitignore templates so `.gitignore` files can be generated without the network.
+
+Pack layout:
+    MAGIC | uint32 index length | index json | template bytes...
+
+The index maps lowercased template names and aliases to `[offset, length]` of the template bytes, so a
+lookup is a dict access plus a slice of the memory-mapped file.
+"""
+import logging
+import mmap
+import os
+import struct
+import tempfile
+from functools import lru_cache
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"HCGITIGNORE1"
+_HEADER = struct.Struct("<I")
+
+DEFAULT_PACK_PATH = os.path.join(
+    os.path.dirname(__file__), "data", "gitignore-templates.pack"
+)
+
+# extra names people (and the project planner) use for languages
+TEMPLATE_ALIASES = {
+    "python3": "Python",
+    "py": "Python",
+    "javascript": "Node",
+    "js": "Node",
+    "typescript": "Node",
+    "ts": "Node",
+    "nodejs": "Node",
+    "golang": "Go",
+    "c#": "VisualStudio",
+    "csharp": "VisualStudio",
+    ".net": "VisualStudio",
+    "cpp": "C++",
+    "kotlin": "Java",
+    "bash": "Global/Linux",
+}
+
+
+def normalize_template_name(name):
+    return name.lower().strip().replace(" ", "")
+
+
+class GitignorePack:
+    """Read-only, memory-mapped gitignore template pack."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[: len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a gitignore template pack")
+        index_start = len(MAGIC) + _HEADER.size
+        (index_length,) = _HEADER.unpack_from(self._mmap, len(MAGIC))
+        index = orjson.loads(self._mmap[index_start : index_start + index_length])
+        self._data_start = index_start + index_length
+        self.template_names = index["templates"]
+        self._offsets = index["offsets"]
+
+    def __contains__(self, name):
+        return normalize_template_name(name) in self._offsets
+
+    def get(self, name, default=None):
+        """Return the contents of a template by name or alias."""
+        location = self._offsets.get(normalize_template_name(name))
+        if location is None:
+            return default
+        offset, length = location
+        start = self._data_start + offset
+        return self._mmap[start : start + length].decode("utf-8")
+
+    def close(self):
+        self._mmap.close()
+
+
+def build_gitignore_pack(mirror_path, output_path=DEFAULT_PACK_PATH):
+    """
+    Build a template pack from a local checkout of https://github.com/github/gitignore
+
+    Returns the number of templates packed.
+    """
+    templates = {}
+    for dirpath, dirnames, filenames in os.walk(mirror_path):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for filename in sorted(filenames):
+            if not filename.endswith(".gitignore"):
+                continue
+            full_path = os.path.join(dirpath, filename)
+            rel_path = os.path.relpath(full_path, mirror_path).replace(os.sep, "/")
+            with open(full_path, "rb") as f:
+                templates[rel_path[: -len(".gitignore")]] = f.read()
+    if not templates:
+        raise ValueError(f"No .gitignore templates found in {mirror_path}")
+
+    data = bytearray()
+    offsets = {}
+    # top-level templates win name collisions with ones in subfolders like `community/`
+    for name in sorted(templates, key=lambda n: (n.count("/"), n)):
+        contents = templates[name]
+        location = [len(data), len(contents)]
+        data.extend(contents)
+        offsets.setdefault(normalize_template_name(name), location)
+        offsets.setdefault(normalize_template_name(name.rsplit("/", 1)[-1]), location)
+    for alias, name in TEMPLATE_ALIASES.items():
+        location = offsets.get(normalize_template_name(name))
+        if location:
+            offsets.setdefault(normalize_template_name(alias), location)
+
+    index = orjson.dumps({"templates": sorted(templates), "offsets": offsets})
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(output_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile(mode="wb", dir=output_dir, delete=False) as f:
+        f.write(MAGIC)
+        f.write(_HEADER.pack(len(index)))
+        f.write(index)
+        f.write(data)
+    os.replace(f.name, output_path)
+    get_gitignore_pack.cache_clear()
+    logger.info("Packed %d gitignore templates into %s", len(templates), output_path)
+    return len(templates)
+
+
+@lru_cache(maxsize=None)
+def get_gitignore_pack(path=None):
+    """Return the installed template pack, or None if there isn't one."""
+    path = path or os.getenv("HASTY_CODER_GITIGNORE_PACK") or DEFAULT_PACK_PATH
+    if not os.path.exists(path):
+        return None
+    return GitignorePack(path)
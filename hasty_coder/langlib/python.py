@@ -1,14 +1,21 @@
 import ast
+import hashlib
+import keyword
+import logging
 import os.path
+import random
 import textwrap
+import threading
 import tokenize
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future
 from dataclasses import dataclass
-from io import BytesIO
-
-from black import FileMode, format_str
+from io import BytesIO, StringIO
 
 from hasty_coder.filewalk import get_nonignored_file_paths
 
+logger = logging.getLogger(__name__)
+
 
 def extract_first_docstring(code_text):
     """
@@ -73,14 +80,65 @@ def add_docstring(code_text, docstring_text):
     return code_text
 
 
-def get_file_docstring(path):
-    """Return the docstring of a given Python file."""
+PARSE_CACHE_SIZE = 256
+
+# path -> ((mtime, size), sourcecode, ast), least recently used first. Kept warm between commands by `hc serve`.
+_parsed_file_cache = OrderedDict()
+
+
+def parse_python_file(path):
+    """Return (sourcecode, ast) for a python file, reusing the last parse if the file hasn't changed."""
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    cached = _parsed_file_cache.get(path)
+    if cached is not None and cached[0] == version:
+        _parsed_file_cache.move_to_end(path)
+        return cached[1], cached[2]
+
     with open(path, "r", encoding="utf-8") as f:
         file_sourcecode = f.read()
-    mod_ast = ast.parse(file_sourcecode)
+    tree = ast.parse(file_sourcecode)
+    _parsed_file_cache[path] = (version, file_sourcecode, tree)
+    _parsed_file_cache.move_to_end(path)
+    while len(_parsed_file_cache) > PARSE_CACHE_SIZE:
+        _parsed_file_cache.popitem(last=False)
+    return file_sourcecode, tree
+
+
+def get_file_docstring(path):
+    """Return the docstring of a given Python file."""
+    _, mod_ast = parse_python_file(path)
     return ast.get_docstring(mod_ast)
 
 
+def format_signature(node):
+    """Return the `def`/`class` line of a function or class node, without decorators or body."""
+    if isinstance(node, ast.ClassDef):
+        bases = ", ".join(ast.unparse(base) for base in node.bases)
+        return f"class {node.name}({bases})" if bases else f"class {node.name}"
+    prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+    return f"{prefix} {node.name}({ast.unparse(node.args)})"
+
+
+def get_top_level_signatures(tree):
+    """Return signatures of the public functions and classes at the top of a module, and their public methods."""
+    signatures = []
+    for node in tree.body:
+        if getattr(node, "name", "").startswith("_"):
+            continue
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            signatures.append(format_signature(node))
+        elif isinstance(node, ast.ClassDef):
+            signatures.append(format_signature(node))
+            for child in node.body:
+                if not isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    continue
+                if child.name.startswith("_") and child.name != "__init__":
+                    continue
+                signatures.append(f"    {format_signature(child)}")
+    return signatures
+
+
 def add_docstring_to_file(filename, docstring):
     with open(filename, "r", encoding="utf-8") as f:
         file_sourcecode = f.read()
@@ -149,9 +207,10 @@ def validate_python_ast_equal(code_text_a, code_text_b):
         raise ValueError("ASTs are not equal")
 
 
-def get_func_and_class_snippets(code: str, filepath: str = None):
+def get_func_and_class_snippets(code: str, filepath: str = None, tree=None):
     """Return snippets of functions and classes from a given code string."""
-    tree = ast.parse(code)
+    if tree is None:
+        tree = ast.parse(code)
     lines = code.splitlines()
     snippets = []
     for node in ast.walk(tree):
@@ -175,7 +234,58 @@ def get_func_and_class_snippets(code: str, filepath: str = None):
     return snippets
 
 
+def cyclomatic_complexity(tree):
+    """Return the McCabe cyclomatic complexity of an ast node."""
+    complexity = 1
+    for node in ast.walk(tree):
+        if isinstance(
+            node,
+            (
+                ast.If,
+                ast.IfExp,
+                ast.For,
+                ast.AsyncFor,
+                ast.While,
+                ast.ExceptHandler,
+                ast.Assert,
+                ast.comprehension,
+            ),
+        ):
+            complexity += 1
+        elif isinstance(node, ast.BoolOp):
+            complexity += len(node.values) - 1
+        elif isinstance(node, getattr(ast, "match_case", ())):
+            complexity += 1
+    return complexity
+
+
+NESTING_NODES = (
+    ast.If,
+    ast.For,
+    ast.AsyncFor,
+    ast.While,
+    ast.With,
+    ast.AsyncWith,
+    ast.Try,
+    ast.FunctionDef,
+    ast.AsyncFunctionDef,
+    ast.ClassDef,
+)
+
+
+def max_nesting_depth(tree, depth=0):
+    """Return how deeply blocks are nested inside an ast node."""
+    max_depth = depth
+    for child in ast.iter_child_nodes(tree):
+        child_depth = depth + 1 if isinstance(child, NESTING_NODES) else depth
+        max_depth = max(max_depth, max_nesting_depth(child, child_depth))
+    return max_depth
+
+
 def format_code(code_text):
+    # black takes a while to import and most commands never format anything
+    from black import FileMode, format_str  # pylint: disable=import-outside-toplevel
+
     return format_str(code_text, mode=FileMode())
 
 
@@ -196,6 +306,10 @@ class CodeSnippet:
         code_text = textwrap.dedent(self.code_text)
         return format_code(code_text)
 
+    @property
+    def ast_tree(self):
+        return ast.parse(textwrap.dedent(self.code_text))
+
     @property
     def assigned_variables(self):
         """
@@ -213,13 +327,34 @@ class CodeSnippet:
     def references(self):
         """
         Use ast to find all references in the function body
+
+        Attribute chains like `os.path.join` are returned whole. Each name is returned once, in order of first use.
         """
-        tree = ast.parse(self.code_text)
-        refs = []
-        for node in ast.walk(tree):
-            if isinstance(node, ast.Name):
-                refs.append(node.id)
-        return refs
+        refs = {}
+        inner_nodes = set()
+        for node in ast.walk(self.ast_tree):
+            if id(node) in inner_nodes:
+                continue
+            if isinstance(node, (ast.Name, ast.Attribute)):
+                name = dotted_name(node)
+                if name:
+                    refs.setdefault(name, None)
+                while isinstance(node, ast.Attribute):
+                    node = node.value
+                    inner_nodes.add(id(node))
+        return list(refs)
+
+
+def dotted_name(node):
+    """Return `a.b.c` for a chain of attribute lookups on a name, otherwise None."""
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None
+    parts.append(node.id)
+    return ".".join(reversed(parts))
 
 
 def walk_python_files(path):
@@ -230,8 +365,196 @@ def get_func_and_class_snippets_in_path(path):
     """Return snippets of functions and classes from a given path"""
     for rel_path in get_nonignored_file_paths(path, extensions=[".py"]):
         full_path = os.path.join(path, rel_path)
-        with open(full_path, "r", encoding="utf-8") as f:
-            file_sourcecode = f.read()
+        file_sourcecode, tree = parse_python_file(full_path)
 
-        for snippet in get_func_and_class_snippets(file_sourcecode, filepath=full_path):
+        for snippet in get_func_and_class_snippets(
+            file_sourcecode, filepath=full_path, tree=tree
+        ):
             yield snippet
+
+
+def normalized_code_tokens(code_text, canonicalize_identifiers=False):
+    """
+    Return the tokens of some code, ignoring comments, indentation width and trailing whitespace.
+
+    Line breaks are kept so code with the same tokens also has the same line numbering. With
+    `canonicalize_identifiers` every name is replaced by its order of appearance, so renamed copies match.
+    """
+    code_text = textwrap.dedent(code_text)
+    identifiers = {}
+    normalized = []
+    try:
+        for token in tokenize.generate_tokens(StringIO(code_text).readline):
+            if token.type in (tokenize.COMMENT, tokenize.ENDMARKER):
+                continue
+            if token.type in (tokenize.NEWLINE, tokenize.NL):
+                normalized.append("\n")
+            elif token.type == tokenize.INDENT:
+                normalized.append("<indent>")
+            elif token.type == tokenize.DEDENT:
+                normalized.append("<dedent>")
+            elif (
+                canonicalize_identifiers
+                and token.type == tokenize.NAME
+                and not keyword.iskeyword(token.string)
+            ):
+                normalized.append(
+                    identifiers.setdefault(token.string, f"<name{len(identifiers)}>")
+                )
+            else:
+                normalized.append(token.string)
+    except (tokenize.TokenError, IndentationError):
+        # not valid python on its own. fall back to comparing words
+        return code_text.split()
+    return normalized
+
+
+def code_fingerprint(code_text, canonicalize_identifiers=False):
+    """Return a hash that is the same for code that differs only in comments and whitespace."""
+    tokens = normalized_code_tokens(code_text, canonicalize_identifiers)
+    return hashlib.sha1("\x1f".join(tokens).encode("utf-8")).hexdigest()
+
+
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16
+SHINGLE_SIZE = 4
+_MERSENNE_PRIME = (1 << 61) - 1
+_minhash_rng = random.Random(1)
+_MINHASH_PARAMS = [
+    (
+        _minhash_rng.randrange(1, _MERSENNE_PRIME),
+        _minhash_rng.randrange(_MERSENNE_PRIME),
+    )
+    for _ in range(MINHASH_PERMUTATIONS)
+]
+
+
+def minhash_signature(tokens, shingle_size=SHINGLE_SIZE):
+    """Return a MinHash signature of the token shingles. Similar signatures mean similar code."""
+    shingles = {
+        "\x1f".join(tokens[i : i + shingle_size])
+        for i in range(max(len(tokens) - shingle_size + 1, 1))
+    }
+    shingle_hashes = [
+        int.from_bytes(
+            hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little"
+        )
+        for shingle in shingles
+    ]
+    return tuple(
+        min((a * h + b) % _MERSENNE_PRIME for h in shingle_hashes)
+        for a, b in _MINHASH_PARAMS
+    )
+
+
+def estimate_similarity(signature_a, signature_b):
+    """Estimate the jaccard similarity of the shingles behind two MinHash signatures."""
+    matches = sum(1 for a, b in zip(signature_a, signature_b) if a == b)
+    return matches / len(signature_a)
+
+
+class SnippetDeduplicator:
+    """
+    Share one result between code snippets that are the same, or nearly the same.
+
+    Snippets are grouped by `code_fingerprint`. If `similarity_threshold` is set, snippets whose estimated
+    similarity to an earlier snippet is at least that high join its group too. Near-duplicates are found by
+    locality-sensitive hashing of MinHash signatures, so each lookup only compares against a few candidates.
+    """
+
+    def __init__(self, canonicalize_identifiers=False, similarity_threshold=None):
+        self.canonicalize_identifiers = canonicalize_identifiers
+        self.similarity_threshold = similarity_threshold
+        self.calls_saved = 0
+        self._lock = threading.Lock()
+        # fingerprint -> representative fingerprint
+        self._groups = {}
+        # representative fingerprint -> (code_text, signature)
+        self._representatives = {}
+        # (band number, band of signature) -> representative fingerprints
+        self._lsh_buckets = defaultdict(list)
+        # representative fingerprint -> Future of the result
+        self._results = {}
+
+    def representative(self, code_text):
+        """Return `(key, code_text)` of the first snippet seen that code_text duplicates."""
+        tokens = normalized_code_tokens(code_text, self.canonicalize_identifiers)
+        fingerprint = hashlib.sha1("\x1f".join(tokens).encode("utf-8")).hexdigest()
+        with self._lock:
+            key = self._groups.get(fingerprint)
+            if key is not None:
+                return key, self._representatives[key][0]
+
+        signature = None
+        if self.similarity_threshold is not None:
+            signature = minhash_signature(tokens)
+        with self._lock:
+            key = self._groups.get(fingerprint) or self._find_similar(signature)
+            if key is None:
+                key = fingerprint
+                self._representatives[key] = (code_text, signature)
+                if signature is not None:
+                    for band in self._bands(signature):
+                        self._lsh_buckets[band].append(key)
+            self._groups[fingerprint] = key
+            return key, self._representatives[key][0]
+
+    def run(self, code_text, func):
+        """
+        Return `func(representative_code_text)` for the group code_text belongs to.
+
+        func is only called once per group. Calls for duplicates of a snippet that is still being worked on
+        wait for its result.
+        """
+        key, representative_code = self.representative(code_text)
+        with self._lock:
+            future = self._results.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = self._results[key] = Future()
+            else:
+                self.calls_saved += 1
+        if is_leader:
+            try:
+                future.set_result(func(representative_code))
+            except BaseException as e:  # pylint: disable=broad-except
+                future.set_exception(e)
+                # let a later duplicate try again
+                with self._lock:
+                    self._results.pop(key, None)
+        return future.result()
+
+    def _find_similar(self, signature):
+        if signature is None:
+            return None
+        candidates = {
+            key
+            for band in self._bands(signature)
+            for key in self._lsh_buckets.get(band, ())
+        }
+        best_key, best_similarity = None, self.similarity_threshold
+        for key in sorted(candidates):
+            similarity = estimate_similarity(signature, self._representatives[key][1])
+            if similarity >= best_similarity:
+                best_key, best_similarity = key, similarity
+        return best_key
+
+    @staticmethod
+    def _bands(signature):
+        rows = len(signature) // MINHASH_BANDS
+        return [
+            (band, signature[band * rows : (band + 1) * rows])
+            for band in range(MINHASH_BANDS)
+        ]
+
+
+def group_duplicate_snippets(
+    code_texts, canonicalize_identifiers=False, similarity_threshold=None
+):
+    """Group the indexes of duplicate code texts. The first index of each group is its representative."""
+    deduplicator = SnippetDeduplicator(canonicalize_identifiers, similarity_threshold)
+    groups = {}
+    for i, code_text in enumerate(code_texts):
+        key, _ = deduplicator.representative(code_text)
+        groups.setdefault(key, []).append(i)
+    return list(groups.values())
@@ -0,0 +1,317 @@
+"""
+An index of the python symbols in a project: where they are defined, what they import and who calls them.
+
+Every module is parsed once into a record of its definitions, imports and call sites. Records are saved in
+the temp dir keyed by the file's content hash, so a refresh only re-parses files that changed. Calls are
+resolved through the calling module's imports into fully qualified names, which gives O(1) lookups of a
+function's signature and of the places it is called from.
+"""
+import ast
+import gzip
+import logging
+import os.path
+import tempfile
+from collections import defaultdict
+from dataclasses import dataclass
+from hashlib import md5
+from typing import List
+
+import orjson
+
+from hasty_coder.langlib.python import dotted_name, format_signature
+from hasty_coder.project_map import get_project_map
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+MAX_CALLER_EXAMPLES = 3
+
+# root path -> SymbolIndex. Kept warm between commands by `hc serve`.
+_symbol_indexes = {}
+
+
+def get_index_dir():
+    return os.path.join(tempfile.gettempdir(), "hasty-coder/symbol-index/")
+
+
+@dataclass
+class SymbolDefinition:
+    name: str
+    signature: str
+    filepath: str
+    line: int
+    docstring: str = ""
+    module: str = ""
+
+
+@dataclass
+class CallSite:
+    caller: str
+    filepath: str
+    line: int
+    code: str
+
+
+@dataclass
+class SnippetContext:
+    definition: SymbolDefinition = None
+    callees: List[SymbolDefinition] = None
+    callers: List[CallSite] = None
+
+
+def module_name_for_path(rel_path):
+    """Return the dotted module name of a python file, like `pkg.mod` for `pkg/mod.py`."""
+    parts = rel_path[: -len(".py")].split(os.sep)
+    if parts[-1] == "__init__":
+        parts.pop()
+    return ".".join(parts)
+
+
+def extract_module_symbols(source, module_name, is_package=False):
+    """Return a json-friendly record of the definitions, imports and calls in a module."""
+    tree = ast.parse(source)
+    lines = source.splitlines()
+    record = {"module": module_name, "defs": [], "imports": {}, "calls": []}
+
+    def resolve_relative(module, level):
+        if not level:
+            return module
+        package = module_name.split(".")
+        package = package[: len(package) - level + (1 if is_package else 0)]
+        return ".".join(package + ([module] if module else []))
+
+    def visit(node, scope):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                qualname = ".".join(scope + [child.name])
+                start_line = min(
+                    [child.lineno] + [d.lineno for d in child.decorator_list]
+                )
+                docstring = (ast.get_docstring(child) or "").strip().split("\n", 1)[0]
+                record["defs"].append(
+                    [
+                        qualname,
+                        format_signature(child),
+                        start_line,
+                        child.lineno,
+                        docstring,
+                    ]
+                )
+                visit(child, scope + [child.name])
+                continue
+            if isinstance(child, ast.Import) and not scope:
+                for alias in child.names:
+                    if alias.asname:
+                        record["imports"][alias.asname] = alias.name
+                    else:
+                        head = alias.name.split(".", 1)[0]
+                        record["imports"][head] = head
+            elif isinstance(child, ast.ImportFrom) and not scope:
+                module = resolve_relative(child.module, child.level)
+                for alias in child.names:
+                    target = f"{module}.{alias.name}" if module else alias.name
+                    record["imports"][alias.asname or alias.name] = target
+            elif isinstance(child, ast.Call):
+                callee = dotted_name(child.func)
+                if callee:
+                    code = (
+                        lines[child.lineno - 1].strip()
+                        if child.lineno <= len(lines)
+                        else ""
+                    )
+                    record["calls"].append(
+                        [".".join(scope), callee, child.lineno, code]
+                    )
+            visit(child, scope)
+
+    visit(tree, [])
+    return record
+
+
+class SymbolIndex:
+    """Definitions, imports and resolved call sites of every python file in a `ProjectMap`."""
+
+    def __init__(self, project_map, index_path=None):
+        self.project_map = project_map
+        self.index_path = index_path or os.path.join(
+            get_index_dir(),
+            md5(project_map.root_path.encode("utf-8")).hexdigest() + ".json.gz",
+        )
+        # relative path -> module record (with the content hash it was built from)
+        self.records = self._load()
+        # fully qualified name -> SymbolDefinition
+        self.definitions = {}
+        # fully qualified name -> [CallSite]
+        self.callers = defaultdict(list)
+        # (relative path, start line) -> fully qualified name
+        self._definitions_by_location = {}
+        self._generation = None
+
+    def refresh(self):
+        """Re-parse python files whose contents changed. Returns the number re-parsed."""
+        if self._generation == self.project_map.generation and self.definitions:
+            return 0
+        files = self.project_map.files
+        reparsed = 0
+        for rel_path, info in files.items():
+            if not rel_path.endswith(".py"):
+                continue
+            record = self.records.get(rel_path)
+            if record is not None and record["hash"] == info.content_hash:
+                continue
+            full_path = os.path.join(self.project_map.root_path, rel_path)
+            try:
+                with open(full_path, "r", encoding="utf-8", errors="replace") as f:
+                    source = f.read()
+                record = extract_module_symbols(
+                    source,
+                    module_name_for_path(rel_path),
+                    is_package=rel_path.endswith("__init__.py"),
+                )
+            except (OSError, SyntaxError, ValueError):
+                record = {
+                    "module": module_name_for_path(rel_path),
+                    "defs": [],
+                    "imports": {},
+                    "calls": [],
+                }
+            record["hash"] = info.content_hash
+            self.records[rel_path] = record
+            reparsed += 1
+        removed = [p for p in self.records if p not in files]
+        for rel_path in removed:
+            del self.records[rel_path]
+        if reparsed or removed:
+            self._save()
+        self._link()
+        self._generation = self.project_map.generation
+        return reparsed
+
+    def resolve(self, rel_path, name, caller=""):
+        """Return the fully qualified name that `name`, used in `caller` in a file, refers to, or None."""
+        record = self.records.get(rel_path)
+        if record is None:
+            return None
+        module = record["module"]
+        head, _, rest = name.partition(".")
+        candidates = []
+        if head == "self" and rest and "." in caller:
+            # a method calling another method of its class
+            class_name = caller.rsplit(".", 1)[0]
+            candidates.append(f"{module}.{class_name}.{rest}")
+        # names defined in enclosing functions, innermost first. Class bodies aren't enclosing scopes.
+        scope = caller.split(".") if caller else []
+        while scope:
+            enclosing = self.definitions.get(f"{module}.{'.'.join(scope)}")
+            if enclosing and not enclosing.signature.startswith("class "):
+                candidates.append(f"{enclosing.name}.{name}")
+            scope.pop()
+        candidates.append(f"{module}.{name}")
+        imported = record["imports"].get(head)
+        if imported:
+            candidates.append(f"{imported}.{rest}" if rest else imported)
+        for candidate in candidates:
+            if candidate in self.definitions:
+                return candidate
+        return None
+
+    def definition_at(self, filepath, start_line):
+        """Return the definition that starts at a line of a file, or None."""
+        rel_path = self._relative_path(filepath)
+        name = self._definitions_by_location.get((rel_path, start_line))
+        return self.definitions.get(name)
+
+    def snippet_context(self, snippet, max_callers=MAX_CALLER_EXAMPLES):
+        """Return the definitions a snippet refers to and examples of where it is called."""
+        definition = self.definition_at(snippet.filepath, snippet.start_line)
+        context = SnippetContext(definition=definition, callees=[], callers=[])
+        if definition is None:
+            return context
+        rel_path = definition.filepath
+        caller = definition.name[len(self.records[rel_path]["module"]) + 1 :]
+        seen = {definition.name}
+        for reference in snippet.references:
+            name = self.resolve(rel_path, reference, caller=caller)
+            if name and name not in seen:
+                seen.add(name)
+                context.callees.append(self.definitions[name])
+        context.callers = self.callers.get(definition.name, [])[:max_callers]
+        return context
+
+    def _link(self):
+        """Rebuild the global lookups from the module records."""
+        self.definitions = {}
+        self._definitions_by_location = {}
+        for rel_path, record in self.records.items():
+            module = record["module"]
+            for qualname, signature, start_line, _, docstring in record["defs"]:
+                name = f"{module}.{qualname}" if module else qualname
+                self.definitions[name] = SymbolDefinition(
+                    name=name,
+                    signature=signature,
+                    filepath=rel_path,
+                    line=start_line,
+                    docstring=docstring,
+                    module=module,
+                )
+                self._definitions_by_location[(rel_path, start_line)] = name
+                if module.startswith("src."):
+                    # src layout: the package is imported without the `src.` prefix
+                    self.definitions.setdefault(
+                        name[len("src.") :], self.definitions[name]
+                    )
+
+        self.callers = defaultdict(list)
+        for rel_path, record in self.records.items():
+            for caller, callee, line, code in record["calls"]:
+                name = self.resolve(rel_path, callee, caller=caller)
+                if name is None:
+                    continue
+                name = self.definitions[name].name
+                self.callers[name].append(
+                    CallSite(
+                        caller=f"{record['module']}.{caller}"
+                        if caller
+                        else record["module"],
+                        filepath=rel_path,
+                        line=line,
+                        code=code,
+                    )
+                )
+
+    def _relative_path(self, filepath):
+        if filepath and os.path.isabs(filepath):
+            return os.path.relpath(filepath, self.project_map.root_path)
+        return filepath
+
+    def _load(self):
+        try:
+            with gzip.open(self.index_path, "rb") as f:
+                data = orjson.loads(f.read())
+        except FileNotFoundError:
+            return {}
+        except (OSError, EOFError, orjson.JSONDecodeError):
+            logger.warning("Ignoring corrupt symbol index %s", self.index_path)
+            return {}
+        if data.get("version") != INDEX_VERSION:
+            return {}
+        return data["records"]
+
+    def _save(self):
+        index_dir = os.path.dirname(self.index_path)
+        os.makedirs(index_dir, exist_ok=True)
+        data = {"version": INDEX_VERSION, "records": self.records}
+        with tempfile.NamedTemporaryFile(mode="wb", dir=index_dir, delete=False) as f:
+            f.write(gzip.compress(orjson.dumps(data), compresslevel=6))
+        os.replace(f.name, self.index_path)
+
+
+def get_symbol_index(root_path):
+    """Return the refreshed symbol index of a project."""
+    root_path = os.path.abspath(root_path)
+    project_map = get_project_map(root_path)
+    index = _symbol_indexes.get(root_path)
+    if index is None or index.project_map is not project_map:
+        index = _symbol_indexes[root_path] = SymbolIndex(project_map)
+    index.refresh()
+    return index
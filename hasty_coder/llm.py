@@ -0,0 +1,645 @@
+"""
+Text completion backends.
+
+Every task calls `complete()`, which handles retries, JSON parsing and token accounting. The actual requests
+are made by a pluggable backend:
+
+  - `OpenAIHTTPBackend` talks to the OpenAI API or any OpenAI-compatible server (set OPENAI_API_BASE).
+  - `BackendPool` spreads requests over several API keys or servers and fails over between them.
+  - `FakeBackend` answers in-process. Useful for tests and benchmarks.
+
+The default backend is chosen with the HASTY_CODER_BACKEND env var ("openai", "pool" or "fake").
+
+Completions can be tagged with a group (like the project they are for) by setting `completion_group`. Tokens
+are counted per group, and a `FairLimiter` set with `set_limiter` caps concurrent requests across all groups
+while taking turns between them.
+
+High temperature prompts can opt in to reusing earlier answers by naming their `reuse_family`. Reuse only
+happens when a `prompt_reuse.ReuseCache` is set with `set_reuse_cache` or HASTY_CODER_REUSE_PROMPTS=1.
+"""
+import contextvars
+import copy
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+
+from hasty_coder.utils import estimate_tokens, extract_json
+
+logger = logging.getLogger(__name__)
+
+OPENAI_API_BASE = "https://api.openai.com/v1"
+DEFAULT_MODEL = "text-davinci-003"
+RATE_LIMIT_PAUSE_SECONDS = 15
+MAX_ATTEMPTS = 6
+COMPLETION_CACHE_SIZE = 1000
+# statuses that reject the request itself, like a prompt that is too long. Others, like a revoked key (401) or a
+# model one server doesn't have (404), are about the backend.
+BAD_REQUEST_STATUS_CODES = (400, 413, 422)
+
+
+class CompletionError(Exception):
+    """The backend failed to produce a completion."""
+
+
+class RateLimitError(CompletionError):
+    pass
+
+
+class CompletionTimeout(CompletionError):
+    pass
+
+
+class BadRequestError(CompletionError):
+    """The backend rejected the request itself, like a prompt that is too long, so retrying it won't help."""
+
+
+@dataclass
+class CompletionResult:
+    text: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+class CompletionBackend:
+    """Turn a prompt into a `CompletionResult`."""
+
+    # completions are only cached for backends that give the same answer for the same request.
+    # Backends that do should return a string identifying where the answers come from.
+    cache_namespace = None
+
+    def complete(
+        self,
+        prompt,
+        max_tokens=2000,
+        temperature=0.0,
+        top_p=1,
+        frequency_penalty=0.0,
+        presence_penalty=0.0,
+        stop=None,
+        timeout=30,
+        model=DEFAULT_MODEL,
+    ) -> CompletionResult:
+        raise NotImplementedError()
+
+
+class OpenAIHTTPBackend(CompletionBackend):
+    """Call the `/completions` endpoint of the OpenAI API or an OpenAI-compatible server."""
+
+    def __init__(self, api_key=None, base_url=None, session=None):
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.base_url = (
+            base_url or os.getenv("OPENAI_API_BASE") or OPENAI_API_BASE
+        ).rstrip("/")
+        self.session = session or requests.Session()
+
+    @property
+    def cache_namespace(self):
+        return self.base_url
+
+    def resize_pool(self, pool_size):
+        """Keep up to `pool_size` connections open so that many concurrent requests reuse them."""
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def complete(
+        self,
+        prompt,
+        max_tokens=2000,
+        temperature=0.0,
+        top_p=1,
+        frequency_penalty=0.0,
+        presence_penalty=0.0,
+        stop=None,
+        timeout=30,
+        model=DEFAULT_MODEL,
+    ):
+        if not self.api_key and self.base_url == OPENAI_API_BASE:
+            raise CompletionError(
+                "No API key provided. Set the OPENAI_API_KEY environment variable."
+            )
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "top_p": top_p,
+            "frequency_penalty": frequency_penalty,
+            "presence_penalty": presence_penalty,
+        }
+        if stop:
+            payload["stop"] = stop
+        try:
+            response = self.session.post(
+                f"{self.base_url}/completions",
+                data=orjson.dumps(payload),
+                headers=headers,
+                timeout=timeout,
+            )
+        except requests.Timeout as e:
+            raise CompletionTimeout(str(e)) from e
+        except requests.ConnectionError as e:
+            raise CompletionError(f"Couldn't connect to {self.base_url}: {e}") from e
+        if response.status_code == 429:
+            raise RateLimitError(response.text)
+        if response.status_code in BAD_REQUEST_STATUS_CODES:
+            raise BadRequestError(
+                f"{response.status_code} error from {self.base_url}: {response.text}"
+            )
+        if response.status_code >= 400:
+            raise CompletionError(
+                f"{response.status_code} error from {self.base_url}: {response.text}"
+            )
+        data = orjson.loads(response.content)
+        usage = data.get("usage") or {}
+        return CompletionResult(
+            text=data["choices"][0]["text"],
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0),
+        )
+
+
+class FakeBackend(CompletionBackend):
+    """
+    Answer prompts in-process.
+
+    `responses` is either a list of strings returned in order or a function that takes the prompt and returns
+    a string. Every prompt is recorded in `prompts`.
+    """
+
+    def __init__(self, responses=None):
+        self.responses = responses if responses is not None else ["fake completion"]
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def complete(self, prompt, max_tokens=2000, stop=None, **kwargs):
+        with self._lock:
+            self.prompts.append(prompt)
+            if callable(self.responses):
+                text = self.responses(prompt)
+            elif len(self.responses) > 1:
+                text = self.responses.pop(0)
+            else:
+                text = self.responses[0]
+        for stop_sequence in stop or []:
+            text = text.split(stop_sequence, 1)[0]
+        return CompletionResult(
+            text=text,
+            prompt_tokens=estimate_tokens(prompt),
+            completion_tokens=estimate_tokens(text),
+        )
+
+
+class PoolMember:
+    """A backend in a `BackendPool`, with its own concurrency limit and health."""
+
+    def __init__(self, backend, weight=1, max_concurrent=None, name=None):
+        self.backend = backend
+        self.weight = weight
+        self.max_concurrent = max_concurrent
+        self.name = name or getattr(backend, "base_url", type(backend).__name__)
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0
+
+    def __repr__(self):
+        return f"PoolMember({self.name!r})"
+
+    def is_full(self):
+        return self.max_concurrent is not None and self.in_flight >= self.max_concurrent
+
+    def is_ejected(self, now):
+        return self.ejected_until > now
+
+
+class BackendPool(CompletionBackend):
+    """
+    Spread completions over several backends, like API keys or OpenAI-compatible servers.
+
+    Requests go to the healthy member with the fewest requests in flight for its weight, or with
+    `routing="weighted"` to a random member picked by weight. Members that are at their `max_concurrent` limit are
+    skipped, and requests wait when every member is. A request that fails is tried again on another member,
+    unless the backend rejected the request itself (a `BadRequestError`, like a prompt that is too long), which is
+    raised right away without counting against the member. Members are ejected for `ejection_seconds` when they rate limit or after `max_failures` errors in a row.
+    If every member is ejected the one that comes back soonest is tried anyway.
+    """
+
+    ROUTINGS = ("least_loaded", "weighted")
+
+    def __init__(
+        self,
+        members,
+        routing="least_loaded",
+        max_failures=3,
+        ejection_seconds=30,
+        rng=None,
+    ):
+        # pylint: disable=too-many-arguments
+        if not members:
+            raise ValueError("A backend pool needs at least one member")
+        if routing not in self.ROUTINGS:
+            raise ValueError(f"Unknown routing {routing!r}. Use one of {self.ROUTINGS}")
+        self.members = [
+            m if isinstance(m, PoolMember) else PoolMember(m) for m in members
+        ]
+        self.routing = routing
+        self.max_failures = max_failures
+        self.ejection_seconds = ejection_seconds
+        self._rng = rng or random.Random()
+        self._member_freed = threading.Condition()
+
+    @classmethod
+    def from_env(cls):
+        """
+        Build a pool of OpenAI-compatible backends from env vars.
+
+        HASTY_CODER_POOL is a json list of members like `{"api_key": ..., "base_url": ..., "weight": 1,
+        "max_concurrent": 4}`. Without it, OPENAI_API_KEYS is a comma separated list of keys for OPENAI_API_BASE.
+        """
+        pool_config = os.getenv("HASTY_CODER_POOL")
+        if pool_config:
+            members = [
+                PoolMember(
+                    OpenAIHTTPBackend(
+                        api_key=member.get("api_key"), base_url=member.get("base_url")
+                    ),
+                    weight=member.get("weight", 1),
+                    max_concurrent=member.get("max_concurrent"),
+                    name=member.get("name"),
+                )
+                for member in orjson.loads(pool_config)
+            ]
+        else:
+            api_keys = [
+                key.strip()
+                for key in os.getenv("OPENAI_API_KEYS", "").split(",")
+                if key.strip()
+            ]
+            members = [
+                PoolMember(OpenAIHTTPBackend(api_key=key), name=f"key #{i + 1}")
+                for i, key in enumerate(api_keys)
+            ]
+        if not members:
+            raise CompletionError(
+                "No pool members. Set HASTY_CODER_POOL or OPENAI_API_KEYS."
+            )
+        return cls(members)
+
+    @property
+    def cache_namespace(self):
+        namespaces = [m.backend.cache_namespace for m in self.members]
+        if None in namespaces:
+            return None
+        return "pool:" + ",".join(sorted(set(namespaces)))
+
+    def resize_pool(self, pool_size):
+        for member in self.members:
+            if hasattr(member.backend, "resize_pool"):
+                member.backend.resize_pool(pool_size)
+
+    def complete(self, prompt, **kwargs):
+        tried = set()
+        error = None
+        while len(tried) < len(self.members):
+            member = self._checkout(tried)
+            tried.add(member)
+            try:
+                result = member.backend.complete(prompt, **kwargs)
+            except BadRequestError as e:
+                # every member would reject it too
+                self._checkin(member, e)
+                raise
+            except CompletionError as e:
+                self._checkin(member, e)
+                logger.warning("%s failed, trying another backend: %r", member, e)
+                error = e
+                continue
+            self._checkin(member)
+            return result
+        raise error
+
+    def _checkout(self, tried):
+        """Wait for a member that hasn't been tried, and count a request in flight to it."""
+        with self._member_freed:
+            while True:
+                member = self._pick(tried)
+                if member is not None:
+                    member.in_flight += 1
+                    member.requests += 1
+                    return member
+                self._member_freed.wait()
+
+    def _pick(self, tried):
+        now = time.monotonic()
+        untried = [m for m in self.members if m not in tried]
+        candidates = [m for m in untried if not m.is_ejected(now)]
+        if not candidates:
+            # everything is ejected. better to try one early than to fail
+            candidates = [min(untried, key=lambda m: m.ejected_until)]
+        available = [m for m in candidates if not m.is_full()]
+        if not available:
+            return None
+        if self.routing == "weighted":
+            return self._rng.choices(available, weights=[m.weight for m in available])[
+                0
+            ]
+        return min(available, key=lambda m: ((m.in_flight + 1) / m.weight, m.requests))
+
+    def _checkin(self, member, error=None):
+        with self._member_freed:
+            member.in_flight -= 1
+            if error is None:
+                member.consecutive_failures = 0
+            # a rejected request says nothing about the member's health
+            elif not isinstance(error, BadRequestError):
+                member.failures += 1
+                member.consecutive_failures += 1
+                if (
+                    isinstance(error, RateLimitError)
+                    or member.consecutive_failures >= self.max_failures
+                ):
+                    logger.warning("Ejecting %s for %ss", member, self.ejection_seconds)
+                    member.ejected_until = time.monotonic() + self.ejection_seconds
+                    member.consecutive_failures = 0
+            self._member_freed.notify_all()
+
+
+class TokenUsage:
+    """Keep a thread-safe running total of tokens used by completions."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def add(self, prompt_tokens=0, completion_tokens=0):
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+
+token_usage = TokenUsage()
+
+# what completions are for, like a project in a batch. Executors copy it into their threads.
+completion_group = contextvars.ContextVar("completion_group", default=None)
+_group_token_usage = defaultdict(TokenUsage)
+_group_token_usage_lock = threading.Lock()
+
+
+def group_token_usage(group):
+    """Return the `TokenUsage` of the completions made in a group."""
+    with _group_token_usage_lock:
+        return _group_token_usage[group]
+
+
+class FairLimiter:
+    """
+    Limit how many completions run at once.
+
+    When all slots are taken, waiting requests are let in round-robin by completion group, so a group that
+    queues a lot of requests can't starve the others.
+    """
+
+    def __init__(self, max_concurrent):
+        self.max_concurrent = max_concurrent
+        self.active = 0
+        self._lock = threading.Lock()
+        # group -> waiting events, in the order the groups take turns
+        self._waiting = OrderedDict()
+
+    @contextmanager
+    def slot(self, group=None):
+        self.acquire(group)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def acquire(self, group=None):
+        with self._lock:
+            if self.active < self.max_concurrent and not self._waiting:
+                self.active += 1
+                return
+            event = threading.Event()
+            self._waiting.setdefault(group, deque()).append(event)
+        # the slot is handed over by `release`
+        event.wait()
+
+    def release(self):
+        with self._lock:
+            if not self._waiting:
+                self.active -= 1
+                return
+            group, events = next(iter(self._waiting.items()))
+            event = events.popleft()
+            del self._waiting[group]
+            if events:
+                # back of the line
+                self._waiting[group] = events
+            event.set()
+
+
+_limiter = None
+
+
+def set_limiter(limiter):
+    """Limit concurrent completions with a `FairLimiter`, or None for no limit. Returns the previous one."""
+    global _limiter  # pylint: disable=global-statement
+    previous, _limiter = _limiter, limiter
+    return previous
+
+
+def _limited(group):
+    limiter = _limiter
+    if limiter is None:
+        return nullcontext()
+    return limiter.slot(group)
+
+
+# deterministic (temperature 0) completions. Kept warm between commands by `hc serve`.
+_completion_cache = OrderedDict()
+_completion_cache_lock = threading.Lock()
+
+
+def _get_cached_completion(key):
+    with _completion_cache_lock:
+        if key not in _completion_cache:
+            return None
+        _completion_cache.move_to_end(key)
+        # json answers are copied both ways so a caller editing its plan can't change what later callers get
+        return copy.deepcopy(_completion_cache[key])
+
+
+def _set_cached_completion(key, value):
+    with _completion_cache_lock:
+        _completion_cache[key] = copy.deepcopy(value)
+        while len(_completion_cache) > COMPLETION_CACHE_SIZE:
+            _completion_cache.popitem(last=False)
+
+
+def clear_completion_cache():
+    with _completion_cache_lock:
+        _completion_cache.clear()
+
+
+BACKENDS = {
+    "openai": OpenAIHTTPBackend,
+    "pool": BackendPool.from_env,
+    "fake": FakeBackend,
+}
+_backend = None
+
+
+def get_backend():
+    global _backend  # pylint: disable=global-statement
+    if _backend is None:
+        backend_name = os.getenv("HASTY_CODER_BACKEND", "openai")
+        _backend = BACKENDS[backend_name]()
+    return _backend
+
+
+def set_backend(backend):
+    """Use a different backend for all completions. Returns the previous one."""
+    global _backend  # pylint: disable=global-statement
+    previous, _backend = _backend, backend
+    return previous
+
+
+_reuse_cache = None
+_reuse_cache_checked = False
+
+
+def get_reuse_cache():
+    """Return the cache of reusable answers, or None if reuse isn't enabled."""
+    global _reuse_cache, _reuse_cache_checked  # pylint: disable=global-statement
+    if not _reuse_cache_checked:
+        _reuse_cache_checked = True
+        if _reuse_cache is None and os.getenv("HASTY_CODER_REUSE_PROMPTS") in (
+            "1",
+            "true",
+        ):
+            # imported here since the MinHash helpers bring in pathspec
+            from hasty_coder.prompt_reuse import (  # pylint: disable=import-outside-toplevel
+                ReuseCache,
+            )
+
+            _reuse_cache = ReuseCache()
+    return _reuse_cache
+
+
+def set_reuse_cache(reuse_cache):
+    """Reuse answers of high temperature prompts from a `ReuseCache`, or None to stop. Returns the previous one."""
+    global _reuse_cache, _reuse_cache_checked  # pylint: disable=global-statement
+    previous, _reuse_cache = _reuse_cache, reuse_cache
+    _reuse_cache_checked = True
+    return previous
+
+
+def complete(
+    prompt,
+    max_tokens=2000,
+    temperature=0.0,
+    top_p=1,
+    frequency_penalty=0.0,
+    presence_penalty=0.0,
+    stop=None,
+    timeout=30,
+    as_json=False,
+    model=DEFAULT_MODEL,
+    backend=None,
+    reuse_family=None,
+):
+    """
+    Complete a prompt, retrying on rate limits, timeouts and (if `as_json`) unparseable JSON.
+
+    Deterministic (temperature 0) completions are cached in memory. Sampled completions with a `reuse_family`
+    may be answered from earlier answers to the same or nearly the same prompt if reuse is enabled.
+    """
+    backend = backend or get_backend()
+    prompt = prompt.strip()
+    reuse_cache = None
+    if reuse_family is not None and temperature > 0:
+        reuse_cache = get_reuse_cache()
+    if reuse_cache is not None:
+        if as_json:
+            reuse_family += "-json"
+        reused = reuse_cache.get(reuse_family, prompt)
+        if reused is not None:
+            return reused
+    cache_key = None
+    if temperature == 0 and backend.cache_namespace is not None:
+        cache_key = (
+            backend.cache_namespace,
+            prompt,
+            max_tokens,
+            top_p,
+            frequency_penalty,
+            presence_penalty,
+            tuple(stop or ()),
+            as_json,
+            model,
+        )
+        cached = _get_cached_completion(cache_key)
+        if cached is not None:
+            return cached
+
+    group = completion_group.get()
+    total_response = ""
+    for _ in range(MAX_ATTEMPTS):
+        logger.debug("STARTPROMPT\n%s\nENDPROMPT", prompt)
+        try:
+            with _limited(group):
+                result = backend.complete(
+                    prompt + total_response,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    top_p=top_p,
+                    frequency_penalty=frequency_penalty,
+                    presence_penalty=presence_penalty,
+                    stop=stop,
+                    timeout=timeout,
+                    model=model,
+                )
+        except RateLimitError:
+            logger.warning("Rate limit error, pausing and then retrying")
+            time.sleep(RATE_LIMIT_PAUSE_SECONDS)
+            continue
+        except CompletionTimeout:
+            logger.error("TIMEOUT ERROR")
+            continue
+        token_usage.add(result.prompt_tokens, result.completion_tokens)
+        if group is not None:
+            group_token_usage(group).add(result.prompt_tokens, result.completion_tokens)
+        total_response += result.text
+
+        logger.debug("STARTANSWER:\n%s\nENDANSWER", result.text)
+        try:
+            answer = extract_json(total_response) if as_json else total_response.strip()
+        except orjson.JSONDecodeError:
+            logger.exception("JSON DECODE ERROR: %s", total_response)
+            continue
+        if cache_key is not None:
+            _set_cached_completion(cache_key, answer)
+        if reuse_cache is not None:
+            reuse_cache.add(reuse_family, prompt, answer)
+        return answer
+
+    raise CompletionError("Failed to get valid response")
@@ -1,20 +1,78 @@
+import time
+
+from hasty_coder.models import SoftwareProjectPlan
+from hasty_coder.tasklib.batch_projects import (
+    format_batch_summary,
+    read_batch_descriptions,
+    write_projects_batch,
+)
 from hasty_coder.tasklib.describe_project import fill_in_project_plan_from_path
 from hasty_coder.tasklib.filegen import generate_file_contents
-from hasty_coder.tasklib.generate_software_project_plan import generate_project_plan
-from hasty_coder.tasklib.implement_software_project import implement_project_plan
+from hasty_coder.tasklib.filegen_handlers.gen_gitignore import (
+    prefetch_gitignore_templates,
+)
+from hasty_coder.tasklib.generate_software_project_plan import (
+    generate_project_plan,
+    generate_project_plan_fast,
+)
+from hasty_coder.tasklib.generate_tests import write_tests_for_path
+from hasty_coder.tasklib.implement_software_project import (
+    implement_project_plan,
+    resume_project,
+)
+
 
+def write_project(
+    parent_folder,
+    description="",
+    show_work=True,
+    plan_path=None,
+    fast_plan=False,
+    llm_files=(),
+):
+    """
+    Generate and implement a project plan for a software project in a given parent folder.
 
-def write_project(parent_folder, description="", show_work=True):
-    """Generate and implement a project plan for a software project in a given parent folder."""
+    With `plan_path` the plan is loaded from json (like the one `hc project-plan` writes) and only fields
+    missing from it are generated. With `fast_plan` the plan is generated in a single completion. Files named
+    in `llm_files` are generated by the LLM even if there is a template for them.
+    """
     description = description.strip()
 
-    program_description = generate_project_plan(description)
+    # download the templates while the plan is being generated
+    prefetch_gitignore_templates()
+    project_plan = None
+    if plan_path:
+        with open(plan_path, "rb") as f:
+            project_plan = SoftwareProjectPlan.from_json(f.read())
+    if fast_plan and project_plan is None:
+        program_description = generate_project_plan_fast(description)
+    else:
+        program_description = generate_project_plan(
+            description, project_plan=project_plan
+        )
     if show_work:
         print(program_description.as_markdown())
-    project_path = implement_project_plan(program_description, parent_folder)
+    project_path = implement_project_plan(
+        program_description, parent_folder, llm_files=llm_files
+    )
     print(f"Project '{program_description.software_name}' created at {project_path}")
 
 
+def write_projects(batch_path, parent_folder, **kwargs):
+    """Create a project for each description in a jsonl file and print how long each took and what it cost."""
+    descriptions = read_batch_descriptions(batch_path)
+    started_at = time.perf_counter()
+    results = write_projects_batch(descriptions, parent_folder, **kwargs)
+    print(format_batch_summary(results, time.perf_counter() - started_at))
+
+
+def finish_project(project_path, llm_files=()):
+    """Finish an interrupted project run."""
+    journal = resume_project(project_path, llm_files=llm_files)
+    print(f"Project '{journal.project_plan.software_name}' finished at {project_path}")
+
+
 def make_project_plan(description=None):
     """Generate and print a project plan as markdown."""
     project_description = generate_project_plan(description)
@@ -23,7 +81,11 @@ def make_project_plan(description=None):
 
 def write_file(path, description=""):
     """Write a single file."""
-    project_plan = fill_in_project_plan_from_path(path)
+    # only show the model the parts of the project that look related to this file
+    # the target's path is part of the query, so this works without a description too
+    project_plan = fill_in_project_plan_from_path(path, relevant_to=description or "")
+    if project_plan.project_files is None:
+        project_plan.project_files = {}
     project_plan.project_files[path] = description or ""
     contents = generate_file_contents(path, project_plan)
     print(contents)
@@ -37,8 +99,11 @@ def lint(path):
     """AI linting of a file or path"""
 
 
-def write_tests(path, function_name=None):
+def write_tests(path, **kwargs):
     """Write tests for a file or path"""
+    results = write_tests_for_path(path, **kwargs)
+    passed = sum(1 for r in results if r.passed)
+    print(f"Wrote passing tests for {passed}/{len(results)} functions")
 
 
 # if __name__ == "__main__":
@@ -1,12 +1,83 @@
-from dataclasses import dataclass, fields
+"""
+The project plan and its parts.
+
+Plans are rendered to markdown for nearly every prompt, so renderings are cached. Setting a field bumps the
+object's version, which throws the cached renderings away. Dicts and lists can change in place without a field
+being set, so a hash of their contents is part of the cache key too.
+"""
+from dataclasses import asdict, dataclass, fields
 from textwrap import dedent
 from typing import List
 
+import orjson
+
 from hasty_coder.utils import slugify
 
 
+class VersionedModel:
+    """Count changes to an object's attributes so renderings of it can be cached."""
+
+    _version = 0
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, "_version", self._version + 1)
+        object.__setattr__(self, name, value)
+
+    def to_dict(self):
+        """Return a json-friendly dict of the object."""
+        return asdict(self)
+
+    def to_json(self):
+        """Return the object as json bytes."""
+        return orjson.dumps(self, option=orjson.OPT_INDENT_2)
+
+    @classmethod
+    def from_json(cls, data):
+        """Return an object from json made by `to_json`."""
+        return cls.from_dict(orjson.loads(data))
+
+    @classmethod
+    def from_dict(cls, data):
+        """Return an object from a dict made by `to_dict`. Unknown keys are ignored."""
+        field_names = {f.name for f in fields(cls)}
+        return cls(**{key: value for key, value in data.items() if key in field_names})
+
+    def _render_version(self):
+        """Return a value that changes whenever the object's contents do."""
+        return (self._version, self._mutable_fields_hash())
+
+    def _mutable_fields_hash(self):
+        """Return a hash of the contents of the fields holding dicts and lists."""
+        values = [
+            getattr(self, f.name)
+            for f in fields(self)
+            if isinstance(getattr(self, f.name), (dict, list))
+        ]
+        if not values:
+            return None
+        return hash(
+            orjson.dumps(
+                values,
+                default=repr,
+                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        )
+
+    def _cached_render(self, key, render, dependency_versions=()):
+        """Return `render()`, reusing the last result until the object changes."""
+        cache_version = (self._render_version(), *dependency_versions)
+        cache = self.__dict__.get("_render_cache")
+        if cache is None or cache[0] != cache_version:
+            cache = (cache_version, {})
+            # set directly so caching doesn't count as a change
+            self.__dict__["_render_cache"] = cache
+        if key not in cache[1]:
+            cache[1][key] = render()
+        return cache[1][key]
+
+
 @dataclass
-class SoftwareStack:
+class SoftwareStack(VersionedModel):
     """Define a SoftwareStack class to store software stack information."""
 
     primary_programming_language: str = None
@@ -17,6 +88,9 @@ class SoftwareStack:
 
     def as_markdown(self):
         """Return a markdown string representation of the object."""
+        return self._cached_render("markdown", self._render_markdown)
+
+    def _render_markdown(self):
         md = dedent(
             f"""
     - Programming Languages: **{self.primary_programming_language}**. {", ".join(self.secondary_programming_languages)}
@@ -28,7 +102,7 @@ class SoftwareStack:
 
 
 @dataclass
-class SoftwareProjectPlan:
+class SoftwareProjectPlan(VersionedModel):
     """Define a SoftwareProjectPlan class"""
 
     software_name: str = None
@@ -43,6 +117,35 @@ class SoftwareProjectPlan:
     software_stack: SoftwareStack = None
     project_files: dict = None
 
+    @classmethod
+    def from_dict(cls, data):
+        """Return a plan from a dict made by `to_dict`. Unknown keys are ignored."""
+        plan = super().from_dict(data)
+        stack_fields = {f.name for f in fields(SoftwareStack)}
+        # generated plans hold the stack as a plain dict with other keys, which is kept as is
+        if (
+            isinstance(plan.software_stack, dict)
+            and plan.software_stack
+            and set(plan.software_stack) <= stack_fields
+        ):
+            plan.software_stack = SoftwareStack.from_dict(plan.software_stack)
+        return plan
+
+    def stack_value(self, key):
+        """
+        Return a part of the software stack, like "programming_language", "framework" or "testing_framework".
+
+        Generated plans hold the stack as a dict with those keys while hand-made plans use a `SoftwareStack`.
+        """
+        stack = self.software_stack
+        if isinstance(stack, dict):
+            return stack.get(key)
+        if stack is None:
+            return None
+        if key == "testing_framework":
+            return (stack.testing_tooling or [None])[0]
+        return getattr(stack, f"primary_{key}", None)
+
     @property
     def slug(self):
         """Return a slugified version of the software name."""
@@ -50,6 +153,18 @@ class SoftwareProjectPlan:
 
     def as_markdown(self, excluded_sections=None):
         """Return Markdown representation of Software object"""
+        stack_versions = ()
+        if isinstance(self.software_stack, SoftwareStack):
+            stack_versions = (
+                self.software_stack._render_version(),  # pylint: disable=protected-access
+            )
+        return self._cached_render(
+            tuple(excluded_sections or ()),
+            lambda: self._render_markdown(excluded_sections),
+            stack_versions,
+        )
+
+    def _render_markdown(self, excluded_sections=None):
 
         header = ""
         if self.software_name:
@@ -0,0 +1,238 @@
+"""
+A persistent map of a project's files so describing a large project doesn't mean re-reading all of it.
+
+For every file that isn't ignored the map keeps its size, mtime, content hash, module docstring and top-level
+signatures. It is saved as gzipped json in the temp dir. A refresh only lists directories whose mtime (or
+`.gitignore`) changed and only re-reads files whose size or mtime changed.
+"""
+import ast
+import gzip
+import hashlib
+import logging
+import os.path
+import tempfile
+from dataclasses import dataclass, field
+from hashlib import md5
+from pathlib import Path
+from typing import List
+
+import orjson
+
+from hasty_coder.filewalk import (
+    ALWAYS_IGNORE_NAMES,
+    load_gitignore_spec_at_path,
+    path_is_ignored,
+)
+from hasty_coder.langlib.python import get_top_level_signatures
+
+logger = logging.getLogger(__name__)
+
+MAP_VERSION = 1
+
+# root path -> ProjectMap. Kept warm between commands by `hc serve`.
+_project_maps = {}
+
+
+def get_map_dir():
+    return os.path.join(tempfile.gettempdir(), "hasty-coder/project-map/")
+
+
+@dataclass
+class FileInfo:
+    size: int
+    mtime_ns: int
+    content_hash: str
+    docstring: str = ""
+    symbols: List[str] = field(default_factory=list)
+
+
+class ProjectMap:
+    """The files of a project and what they contain."""
+
+    def __init__(self, root_path, map_path=None):
+        self.root_path = os.path.abspath(root_path)
+        self.map_path = map_path or os.path.join(
+            get_map_dir(), md5(self.root_path.encode("utf-8")).hexdigest() + ".json.gz"
+        )
+        # relative path -> FileInfo
+        self.files = {}
+        # increases whenever a file is added, changed or removed
+        self.generation = 0
+        # relative dir -> [dir mtime, .gitignore mtime, file names, dir names]
+        self._dirs = {}
+        self._dirty = False
+        self._load()
+
+    def refresh(self):
+        """Bring the map up to date. Returns the relative paths of the files that were added or changed."""
+        seen_files, seen_dirs, changed = set(), set(), []
+        self._refresh_dir("", {}, False, seen_files, seen_dirs, changed)
+
+        removed = set(self.files) - seen_files
+        for rel_path in removed:
+            del self.files[rel_path]
+        for rel_dir in set(self._dirs) - seen_dirs:
+            del self._dirs[rel_dir]
+            self._dirty = True
+        if changed or removed:
+            self.generation += 1
+            self._dirty = True
+        if self._dirty:
+            self._save()
+        logger.debug(
+            "Project map of %s: %d changed, %d removed",
+            self.root_path,
+            len(changed),
+            len(removed),
+        )
+        return changed
+
+    def file_paths(self):
+        """Return relative file paths in the same order as `get_nonignored_file_paths`."""
+        return sorted(self.files, key=lambda p: (os.sep in p, p))
+
+    def _refresh_dir(
+        self, rel_dir, gitignore_dict, relist, seen_files, seen_dirs, changed
+    ):
+        abs_dir = os.path.join(self.root_path, rel_dir)
+        try:
+            dir_mtime = os.stat(abs_dir).st_mtime_ns
+        except OSError:
+            return
+        seen_dirs.add(rel_dir)
+        gitignore_mtime = _get_mtime(os.path.join(abs_dir, ".gitignore"))
+        gitignore_dict = {
+            **gitignore_dict,
+            abs_dir: load_gitignore_spec_at_path(abs_dir),
+        }
+
+        cached = self._dirs.get(rel_dir)
+        if cached and not relist and cached[:2] == [dir_mtime, gitignore_mtime]:
+            filenames, dirnames = cached[2], cached[3]
+        else:
+            # ignore rules apply to everything below, so list all the subdirectories again too
+            relist = relist or (cached is not None and cached[1] != gitignore_mtime)
+            filenames, dirnames = [], []
+            for entry in os.scandir(abs_dir):
+                if entry.name in ALWAYS_IGNORE_NAMES:
+                    continue
+                if path_is_ignored(Path(entry.path), gitignore_dict):
+                    continue
+                if entry.is_file():
+                    filenames.append(entry.name)
+                elif entry.is_dir():
+                    dirnames.append(entry.name)
+            filenames.sort()
+            dirnames.sort()
+            self._dirs[rel_dir] = [dir_mtime, gitignore_mtime, filenames, dirnames]
+            self._dirty = True
+
+        for filename in filenames:
+            rel_path = os.path.join(rel_dir, filename)
+            seen_files.add(rel_path)
+            if self._refresh_file(rel_path):
+                changed.append(rel_path)
+        for dirname in dirnames:
+            self._refresh_dir(
+                os.path.join(rel_dir, dirname),
+                gitignore_dict,
+                relist,
+                seen_files,
+                seen_dirs,
+                changed,
+            )
+
+    def _refresh_file(self, rel_path):
+        """Update the entry for a file. Returns True if its contents changed."""
+        full_path = os.path.join(self.root_path, rel_path)
+        try:
+            stat = os.stat(full_path)
+            info = self.files.get(rel_path)
+            if info and (info.size, info.mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+                return False
+            with open(full_path, "rb") as f:
+                contents = f.read()
+        except OSError:
+            return False
+
+        content_hash = hashlib.blake2b(contents, digest_size=16).hexdigest()
+        if info and info.content_hash == content_hash:
+            # touched but not changed
+            info.size, info.mtime_ns = stat.st_size, stat.st_mtime_ns
+            self._dirty = True
+            return False
+
+        docstring, symbols = "", []
+        if rel_path.endswith(".py"):
+            try:
+                tree = ast.parse(contents)
+            except (SyntaxError, ValueError):
+                pass
+            else:
+                docstring = ast.get_docstring(tree) or ""
+                symbols = get_top_level_signatures(tree)
+        self.files[rel_path] = FileInfo(
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns,
+            content_hash=content_hash,
+            docstring=docstring,
+            symbols=symbols,
+        )
+        return True
+
+    def _load(self):
+        try:
+            with gzip.open(self.map_path, "rb") as f:
+                data = orjson.loads(f.read())
+        except FileNotFoundError:
+            return
+        except (OSError, EOFError, orjson.JSONDecodeError):
+            logger.warning("Ignoring corrupt project map %s", self.map_path)
+            return
+        if data.get("version") != MAP_VERSION or data.get("root") != self.root_path:
+            return
+        self.files = {row[0]: FileInfo(*row[1:]) for row in data["files"]}
+        self._dirs = data["dirs"]
+
+    def _save(self):
+        # rows instead of dicts keep the file small
+        rows = [
+            [
+                rel_path,
+                info.size,
+                info.mtime_ns,
+                info.content_hash,
+                info.docstring,
+                info.symbols,
+            ]
+            for rel_path, info in self.files.items()
+        ]
+        data = {
+            "version": MAP_VERSION,
+            "root": self.root_path,
+            "files": rows,
+            "dirs": self._dirs,
+        }
+        map_dir = os.path.dirname(self.map_path)
+        os.makedirs(map_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(mode="wb", dir=map_dir, delete=False) as f:
+            f.write(gzip.compress(orjson.dumps(data), compresslevel=6))
+        os.replace(f.name, self.map_path)
+        self._dirty = False
+
+
+def _get_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def get_project_map(root_path):
+    """Return the refreshed map of a project."""
+    root_path = os.path.abspath(root_path)
+    project_map = _project_maps.get(root_path)
+    if project_map is None:
+        project_map = _project_maps[root_path] = ProjectMap(root_path)
+    project_map.refresh()
+    return project_map
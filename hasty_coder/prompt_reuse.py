@@ -0,0 +1,163 @@
+"""
+Reuse earlier answers to high temperature prompts.
+
+Exact-match caching only helps deterministic completions, but many prompts are asked at a high temperature
+because any of many answers will do: the same author bio for every README, a random project idea. Only prompts
+whose answers are interchangeable between projects should opt in; a plan's install instructions, say, are not,
+even though the prompts for two plans can be nearly the same. When enabled (`llm.set_reuse_cache` or HASTY_CODER_REUSE_PROMPTS=1) those
+prompts are grouped into families (like "hasty_bio") and each family keeps a bounded pool of past prompts and
+their answers:
+
+  - a prompt is matched to the pooled prompt it is the same as, or nearly the same as by MinHash similarity
+    of its word shingles
+  - once a pooled prompt has `min_answers` answers, a random one of them is returned instead of calling the LLM
+  - otherwise the completion is made and its answer added to the pool
+
+Pools are saved in the temp dir so answers are shared between runs.
+"""
+import copy
+import logging
+import os.path
+import random
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import orjson
+
+from hasty_coder.langlib.python import estimate_similarity, minhash_signature
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIMILARITY_THRESHOLD = 0.8
+DEFAULT_MIN_ANSWERS = 3
+DEFAULT_MAX_ANSWERS = 8
+DEFAULT_MAX_PROMPTS = 32
+PROMPT_SHINGLE_SIZE = 3
+
+WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def get_cache_dir():
+    return os.path.join(tempfile.gettempdir(), "hasty-coder/reuse/")
+
+
+def prompt_signature(prompt):
+    return minhash_signature(
+        WORD_PATTERN.findall(prompt.lower()), shingle_size=PROMPT_SHINGLE_SIZE
+    )
+
+
+@dataclass
+class PooledPrompt:
+    prompt: str
+    signature: tuple
+    answers: list = field(default_factory=list)
+
+
+class ReuseCache:
+    """Pools of past answers to prompts, by prompt family."""
+
+    def __init__(
+        self,
+        similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD,
+        min_answers=DEFAULT_MIN_ANSWERS,
+        max_answers=DEFAULT_MAX_ANSWERS,
+        max_prompts=DEFAULT_MAX_PROMPTS,
+        cache_dir=None,
+        rng=None,
+    ):
+        # pylint: disable=too-many-arguments
+        if not 1 <= min_answers <= max_answers:
+            raise ValueError("min_answers must be between 1 and max_answers")
+        self.similarity_threshold = similarity_threshold
+        self.min_answers = min_answers
+        self.max_answers = max_answers
+        self.max_prompts = max_prompts
+        self.cache_dir = cache_dir
+        self.calls_saved = 0
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        # family -> OrderedDict of prompt -> PooledPrompt, least recently used first
+        self._pools = {}
+
+    def get(self, family, prompt):
+        """Return a pooled answer for prompt, or None if the LLM should be asked."""
+        signature = prompt_signature(prompt)
+        with self._lock:
+            pooled = self._match(family, prompt, signature)
+            if pooled is None or len(pooled.answers) < self.min_answers:
+                return None
+            self.calls_saved += 1
+            answer = self._rng.choice(pooled.answers)
+        logger.debug("Reusing a %s answer", family)
+        # json answers are lists and dicts the caller may change
+        return copy.deepcopy(answer)
+
+    def add(self, family, prompt, answer):
+        """Pool an answer the LLM gave to prompt."""
+        signature = prompt_signature(prompt)
+        with self._lock:
+            pool = self._pool(family)
+            pooled = self._match(family, prompt, signature)
+            if pooled is None:
+                pooled = pool[prompt] = PooledPrompt(prompt, signature)
+                while len(pool) > self.max_prompts:
+                    pool.popitem(last=False)
+            pooled.answers.append(copy.deepcopy(answer))
+            del pooled.answers[: -self.max_answers]
+            self._save(family, pool)
+
+    def _match(self, family, prompt, signature):
+        pool = self._pool(family)
+        pooled = pool.get(prompt)
+        if pooled is None:
+            best_similarity = self.similarity_threshold
+            for candidate in pool.values():
+                similarity = estimate_similarity(signature, candidate.signature)
+                if similarity >= best_similarity:
+                    pooled, best_similarity = candidate, similarity
+        if pooled is not None:
+            pool.move_to_end(pooled.prompt)
+        return pooled
+
+    def _pool(self, family):
+        if family not in self._pools:
+            self._pools[family] = self._load(family)
+        return self._pools[family]
+
+    def _path(self, family):
+        filename = re.sub(r"[^\w.-]", "_", family) + ".json"
+        return os.path.join(self.cache_dir or get_cache_dir(), filename)
+
+    def _load(self, family):
+        pool = OrderedDict()
+        try:
+            with open(self._path(family), "rb") as f:
+                entries = orjson.loads(f.read())
+        except (FileNotFoundError, orjson.JSONDecodeError):
+            return pool
+        for entry in entries:
+            try:
+                pooled = PooledPrompt(
+                    entry["prompt"], tuple(entry["signature"]), entry["answers"]
+                )
+            except (KeyError, TypeError):
+                continue
+            pool[pooled.prompt] = pooled
+        return pool
+
+    def _save(self, family, pool):
+        path = self._path(family)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entries = [
+            {"prompt": p.prompt, "signature": p.signature, "answers": p.answers}
+            for p in pool.values()
+        ]
+        with tempfile.NamedTemporaryFile(
+            mode="wb", dir=os.path.dirname(path), delete=False
+        ) as f:
+            f.write(orjson.dumps(entries))
+        os.replace(f.name, path)
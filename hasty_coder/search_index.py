@@ -0,0 +1,195 @@
+"""
+BM25 search over a project's files, used to pick the files relevant to a prompt.
+
+Files are indexed by the words in their path, their module docstring and the names of the functions and
+classes they define, all of which come from the persistent project map. The terms of each file are saved
+next to the map as gzipped json, keyed by the file's content hash, so only files whose content changed get
+their terms recomputed, even in a new process.
+"""
+import gzip
+import logging
+import math
+import os.path
+import re
+import tempfile
+from collections import Counter, defaultdict
+
+import orjson
+
+from hasty_coder.project_map import get_project_map
+from hasty_coder.utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONTEXT_TOKENS = 1500
+BM25_K1 = 1.5
+BM25_B = 0.75
+# the path says a lot about what a file is for, so count its words more than once
+PATH_WEIGHT = 3
+INDEX_VERSION = 1
+
+_WORD_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from in is it of on or that the this to with py self".split()
+)
+
+# root path -> ProjectSearchIndex. Kept warm between commands by `hc serve`.
+_indexes = {}
+
+
+def search_terms(text):
+    """Split text, including snake_case, CamelCase and paths, into lowercase search terms."""
+    words = (word.lower() for word in _WORD_RE.findall(text or ""))
+    return [word for word in words if len(word) > 1 and word not in STOPWORDS]
+
+
+class ProjectSearchIndex:
+    """BM25 search over the files of a `ProjectMap`."""
+
+    def __init__(self, project_map, index_path=None):
+        self.project_map = project_map
+        self.index_path = index_path or (
+            re.sub(r"(\.json)?\.gz$", "", project_map.map_path) + ".terms.json.gz"
+        )
+        # relative path -> (content hash, Counter of terms)
+        self._terms = {}
+        self._postings = None
+        self._generation = None
+        self._load()
+
+    def search(self, query, k=10):
+        """Return up to k `(relative_path, score)` pairs, best match first."""
+        postings, document_lengths, average_length = self._get_postings()
+        scores = defaultdict(float)
+        document_count = len(document_lengths)
+        for term in set(search_terms(query)):
+            matches = postings.get(term)
+            if not matches:
+                continue
+            idf = math.log(
+                1 + (document_count - len(matches) + 0.5) / (len(matches) + 0.5)
+            )
+            for rel_path, term_count in matches.items():
+                length_norm = (
+                    1 - BM25_B + BM25_B * document_lengths[rel_path] / average_length
+                )
+                scores[rel_path] += (
+                    idf
+                    * term_count
+                    * (BM25_K1 + 1)
+                    / (term_count + BM25_K1 * length_norm)
+                )
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:k]
+
+    def relevant_files(
+        self, query, max_tokens=DEFAULT_CONTEXT_TOKENS, k=20, exclude=()
+    ):
+        """
+        Return `{relative_path: description}` for the files most relevant to query.
+
+        Descriptions are the first line of the module docstring and the signatures the file defines. Files are
+        added best match first until the descriptions would use more than max_tokens.
+        """
+        files = {}
+        tokens_used = 0
+        for rel_path, _ in self.search(query, k=k + len(exclude)):
+            if rel_path in exclude:
+                continue
+            description = self.describe(rel_path)
+            tokens = estimate_tokens(rel_path + description)
+            if tokens_used + tokens > max_tokens:
+                break
+            files[rel_path] = description
+            tokens_used += tokens
+            if len(files) >= k:
+                break
+        return files
+
+    def describe(self, rel_path):
+        info = self.project_map.files[rel_path]
+        description = info.docstring.strip().split("\n", 1)[0]
+        if info.symbols:
+            signatures = ", ".join(f"`{s.strip()}`" for s in info.symbols)
+            description = f"{description} Defines {signatures}".strip()
+        return description
+
+    def _get_postings(self):
+        if (
+            self._postings is not None
+            and self._generation == self.project_map.generation
+        ):
+            return self._postings
+        files = self.project_map.files
+        changed = False
+        for rel_path in set(self._terms) - set(files):
+            del self._terms[rel_path]
+            changed = True
+        postings = defaultdict(dict)
+        document_lengths = {}
+        for rel_path, info in files.items():
+            cached = self._terms.get(rel_path)
+            if cached is None or cached[0] != info.content_hash:
+                cached = self._terms[rel_path] = (
+                    info.content_hash,
+                    _file_terms(rel_path, info),
+                )
+                changed = True
+            terms = cached[1]
+            for term, count in terms.items():
+                postings[term][rel_path] = count
+            document_lengths[rel_path] = sum(terms.values())
+        average_length = max(sum(document_lengths.values()) / max(len(files), 1), 1)
+        self._postings = (postings, document_lengths, average_length)
+        self._generation = self.project_map.generation
+        if changed:
+            self._save()
+        return self._postings
+
+    def _load(self):
+        try:
+            with gzip.open(self.index_path, "rb") as f:
+                data = orjson.loads(f.read())
+        except FileNotFoundError:
+            return
+        except (OSError, EOFError, orjson.JSONDecodeError):
+            logger.warning("Ignoring corrupt search index %s", self.index_path)
+            return
+        if (
+            data.get("version") != INDEX_VERSION
+            or data.get("root") != self.project_map.root_path
+        ):
+            return
+        self._terms = {
+            rel_path: (content_hash, Counter(terms))
+            for rel_path, (content_hash, terms) in data["terms"].items()
+        }
+
+    def _save(self):
+        data = {
+            "version": INDEX_VERSION,
+            "root": self.project_map.root_path,
+            "terms": self._terms,
+        }
+        index_dir = os.path.dirname(self.index_path)
+        os.makedirs(index_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(mode="wb", dir=index_dir, delete=False) as f:
+            f.write(gzip.compress(orjson.dumps(data), compresslevel=6))
+        os.replace(f.name, self.index_path)
+
+
+def _file_terms(rel_path, info):
+    terms = search_terms(rel_path) * PATH_WEIGHT + search_terms(info.docstring)
+    for signature in info.symbols:
+        terms.extend(search_terms(signature.split("(", 1)[0]))
+    return Counter(terms)
+
+
+def get_project_search_index(root_path):
+    """Return the search index of a project, with its project map refreshed."""
+    root_path = os.path.abspath(root_path)
+    project_map = get_project_map(root_path)
+    index = _indexes.get(root_path)
+    if index is None or index.project_map is not project_map:
+        index = _indexes[root_path] = ProjectSearchIndex(project_map)
+    return index
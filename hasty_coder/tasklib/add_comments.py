@@ -1,14 +1,21 @@
 import logging
+from functools import partial
+from itertools import groupby
 
+from hasty_coder import llm
 from hasty_coder.langlib.python import (
+    SnippetDeduplicator,
     add_docstring,
     extract_first_docstring,
     get_func_and_class_snippets_in_path,
 )
-from hasty_coder.utils import LoggedOpenAI, parallel_run
+from hasty_coder.utils import parallel_imap_unordered
 
 logger = logging.getLogger(__name__)
 
+# snippets at least this similar share a docstring
+NEAR_DUPLICATE_THRESHOLD = 0.9
+
 
 def describe_code_snippet(code_snippet):
     """Describe a code snippet and return a JSON dict of docstrings."""
@@ -29,18 +36,27 @@ INPUT CODE:
 DOCSTRINGS (as json dict):
 ```json
 """
-    comments = LoggedOpenAI(temperature=0)(
-        prompt, as_json=True, stop=["INPUT CODE", "```"]
+    comments = llm.complete(
+        prompt, temperature=0, as_json=True, stop=["INPUT CODE", "```"]
     )
     comment = list(comments.values())[0]
     logger.info(f"Got docstring: {comment}")
     return comment
 
 
-def _add_comments_to_code_snippet(code_snippet_row):
+def _add_comments_to_code_snippet(code_snippet_row, deduplicator=None):
     """Add comments to a code snippet"""
-    full_path, start_line_no, end_line_no, code_snippet = code_snippet_row
-    docstring = describe_code_snippet(code_snippet)
+    code_snippet = code_snippet_row[3]
+    if deduplicator is None:
+        docstring = describe_code_snippet(code_snippet)
+    else:
+        docstring = deduplicator.run(code_snippet, describe_code_snippet)
+    return _docstring_edit(code_snippet_row, docstring)
+
+
+def _docstring_edit(code_snippet_row, docstring):
+    """Return the edit that adds docstring to a code snippet, in the format `apply_comment_edits` takes."""
+    full_path, start_line_no, _, code_snippet = code_snippet_row
     new_code_snippet = add_docstring(code_snippet, docstring)
 
     # shorten the snippets
@@ -66,26 +82,69 @@ def _remove_identical_lines_from_end(text_a, text_b):
     return "".join(lines_a), "".join(lines_b)
 
 
-def add_comments_to_all_code_in_path(path):
-    """Add comments to all code in a given path."""
-    # gather code snippets
-    code_snippet_rows = []
-    for (
-        full_path,
-        start_line_no,
-        end_line_no,
-        code_snippet,
-    ) in get_func_and_class_snippets_in_path(path):
-        docstring = extract_first_docstring(code_snippet)
+def iter_code_snippet_rows_missing_docstrings(path):
+    """Yield `(full_path, start_line_no, end_line_no, code_snippet)` rows for code without docstrings, file by file."""
+    for snippet in get_func_and_class_snippets_in_path(path):
+        docstring = extract_first_docstring(snippet.code_text)
         if docstring:
             continue
-        code_snippet_rows.append((full_path, start_line_no, end_line_no, code_snippet))
-    logger.info(f"Found {len(code_snippet_rows)} code snippets in need of docstrings.")
+        yield snippet.filepath, snippet.start_line, snippet.end_line, snippet.code_text
+
+
+def get_code_snippet_rows_missing_docstrings(path):
+    """Return `(full_path, start_line_no, end_line_no, code_snippet)` rows for code without docstrings."""
+    return list(iter_code_snippet_rows_missing_docstrings(path))
+
+
+def add_comments_to_all_code_in_path(path, max_workers=2, max_in_flight=8):
+    """
+    Add comments to all code in a given path.
+
+    Files are parsed as the completions are needed and at most `max_in_flight` snippets are waiting on a
+    completion at a time. A file is edited as soon as all of its snippets are done, so an interrupted run
+    keeps the files it finished. Duplicate and near-duplicate snippets share one docstring.
+    """
+    deduplicator = SnippetDeduplicator(similarity_threshold=NEAR_DUPLICATE_THRESHOLD)
+    remaining_by_file = {}
+    results_by_file = {}
+
+    def produce_rows():
+        rows = iter_code_snippet_rows_missing_docstrings(path)
+        for full_path, file_rows in groupby(rows, key=lambda row: row[0]):
+            file_rows = list(file_rows)
+            remaining_by_file[full_path] = len(file_rows)
+            results_by_file[full_path] = []
+            yield from file_rows
+
+    snippet_count = 0
+    results = parallel_imap_unordered(
+        partial(_add_comments_to_code_snippet, deduplicator=deduplicator),
+        produce_rows(),
+        max_workers=max_workers,
+        max_pending=max_in_flight,
+    )
+    for (full_path, *_), result_row in results:
+        snippet_count += 1
+        results_by_file[full_path].append(result_row)
+        remaining_by_file[full_path] -= 1
+        if not remaining_by_file[full_path]:
+            del remaining_by_file[full_path]
+            apply_comment_edits(results_by_file.pop(full_path))
+    logger.info(
+        f"Added docstrings to {snippet_count} code snippets "
+        f"({deduplicator.calls_saved} were duplicates)."
+    )
 
-    result_rows = parallel_run(_add_comments_to_code_snippet, code_snippet_rows)
 
+def apply_comment_edits(result_rows):
+    """
+    Apply the edits made by `_add_comments_to_code_snippet` to the files. Returns how many were applied.
+
+    Edits whose lines no longer hold the snippet they were made for (the file changed since) are skipped.
+    """
     # edit in reverse order so the line numbers don't become inaccurate as we make edits
-    result_rows.sort(reverse=True)
+    result_rows = sorted(result_rows, reverse=True)
+    applied = 0
     for (
         full_path,
         start_line_no,
@@ -94,14 +153,41 @@ def add_comments_to_all_code_in_path(path):
         new_code_snippet,
     ) in result_rows:
         # todo: do all edits to a single file at once
-        edit_file(full_path, start_line_no, end_line_no, new_code_snippet)
-
-
-def edit_file(filepath, start_line_no, end_line_no, injected_content):
-    """Edit a file by replacing a range of lines with new content."""
+        if edit_file(
+            full_path,
+            start_line_no,
+            end_line_no,
+            new_code_snippet,
+            expected_content=code_snippet,
+        ):
+            applied += 1
+        else:
+            logger.warning(
+                "Skipping the edit of %s:%d-%d since the file changed",
+                full_path,
+                start_line_no,
+                end_line_no,
+            )
+    return applied
+
+
+def edit_file(
+    filepath, start_line_no, end_line_no, injected_content, expected_content=None
+):
+    """
+    Edit a file by replacing a range of lines with new content.
+
+    If `expected_content` is given the file is only edited if those lines still hold it. Returns whether the
+    file was edited.
+    """
     with open(filepath, "r", encoding="utf-8") as f:
         lines = f.readlines()
     replacing = lines[start_line_no - 1 : end_line_no]
+    if (
+        expected_content is not None
+        and "".join(replacing).splitlines() != expected_content.splitlines()
+    ):
+        return False
     print("REPLACING:")
     print("|" + "".join(replacing) + "|")
     print("WITH:")
@@ -110,6 +196,7 @@ def edit_file(filepath, start_line_no, end_line_no, injected_content):
 
     with open(filepath, "w", encoding="utf-8") as f:
         f.writelines(lines)
+    return True
 
 
 if __name__ == "__main__":
@@ -0,0 +1,167 @@
+"""
+Generate many projects at once.
+
+Projects run in threads of one process, so they share the completion backend (and its HTTP connection pool)
+and the completion cache. A `FairLimiter` caps the number of completions in flight across all projects and lets
+waiting projects take turns, so a project with many files can't starve the rest. Every completion is tagged with
+its project's `llm.completion_group` to count tokens per project.
+"""
+import itertools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+
+import orjson
+
+from hasty_coder import llm
+from hasty_coder.tasklib.filegen_handlers.gen_gitignore import (
+    prefetch_gitignore_templates,
+)
+from hasty_coder.tasklib.generate_software_project_plan import (
+    generate_project_plan,
+    generate_project_plan_fast,
+)
+from hasty_coder.tasklib.implement_software_project import implement_project_plan
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PROJECTS = 4
+DEFAULT_MAX_CONCURRENT_COMPLETIONS = 8
+
+# numbers the batch runs so their completion groups stay apart
+_batch_ids = itertools.count()
+
+
+@dataclass
+class BatchProjectResult:
+    index: int
+    description: str
+    software_name: str = None
+    project_path: str = None
+    seconds: float = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    error: str = None
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+
+def read_batch_descriptions(path):
+    """
+    Return the descriptions in a jsonl file.
+
+    Each line is either a json string or an object with a "description" key.
+    """
+    descriptions = []
+    with open(path, "rb") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            entry = orjson.loads(line)
+            if isinstance(entry, dict):
+                entry = entry.get("description")
+            if not isinstance(entry, str):
+                raise ValueError(f"{path}:{line_no} has no description")
+            descriptions.append(entry.strip())
+    return descriptions
+
+
+def write_projects_batch(
+    descriptions,
+    projects_path,
+    max_projects=DEFAULT_MAX_PROJECTS,
+    max_concurrent_completions=DEFAULT_MAX_CONCURRENT_COMPLETIONS,
+    fast_plan=False,
+    llm_files=(),
+):
+    """Generate a project for each description. Returns a `BatchProjectResult` per project, in order."""
+    prefetch_gitignore_templates()
+    backend = llm.get_backend()
+    if hasattr(backend, "resize_pool"):
+        backend.resize_pool(max_concurrent_completions)
+    previous_limiter = llm.set_limiter(llm.FairLimiter(max_concurrent_completions))
+    batch_id = next(_batch_ids)
+
+    def write_one(index, description):
+        group = ("batch", batch_id, index)
+        llm.completion_group.set(group)
+        result = BatchProjectResult(index=index, description=description)
+        started_at = time.perf_counter()
+        try:
+            if fast_plan:
+                project_plan = generate_project_plan_fast(description)
+            else:
+                project_plan = generate_project_plan(description)
+            result.software_name = project_plan.software_name
+            result.project_path = implement_project_plan(
+                project_plan, projects_path, llm_files=llm_files
+            )
+        except Exception as e:  # pylint: disable=broad-except
+            logger.exception("Project %d failed", index)
+            result.error = repr(e)
+        result.seconds = time.perf_counter() - started_at
+        usage = llm.group_token_usage(group)
+        result.prompt_tokens = usage.prompt_tokens
+        result.completion_tokens = usage.completion_tokens
+        return result
+
+    results = []
+    try:
+        with ThreadPoolExecutor(max_workers=max_projects) as executor:
+            futures = [
+                executor.submit(write_one, index, description)
+                for index, description in enumerate(descriptions)
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                logger.info(
+                    "Project %d/%d done: %s",
+                    len(results) + 1,
+                    len(descriptions),
+                    result.project_path or result.error,
+                )
+                results.append(result)
+    finally:
+        llm.set_limiter(previous_limiter)
+    return sorted(results, key=lambda r: r.index)
+
+
+def format_batch_summary(results, batch_seconds):
+    """
+    Return a table of each project's time and tokens.
+
+    `batch_seconds` is the wall time of the whole batch, which is more than any one project's when projects
+    waited for a free slot.
+    """
+    rows = [("#", "Project", "Seconds", "Prompt tokens", "Completion tokens", "Result")]
+    for result in results:
+        rows.append(
+            (
+                str(result.index + 1),
+                result.software_name or result.description[:40],
+                f"{result.seconds:.1f}",
+                str(result.prompt_tokens),
+                str(result.completion_tokens),
+                result.project_path if result.error is None else result.error[:60],
+            )
+        )
+    rows.append(
+        (
+            "",
+            "Total",
+            f"{batch_seconds:.1f}",
+            str(sum(r.prompt_tokens for r in results)),
+            str(sum(r.completion_tokens for r in results)),
+            f"{sum(r.error is None for r in results)}/{len(results)} created",
+        )
+    )
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    lines = []
+    for row_no, row in enumerate(rows):
+        lines.append("  ".join(cell.ljust(width) for cell, width in zip(row, widths)))
+        if row_no in (0, len(rows) - 2):
+            lines.append("  ".join("-" * width for width in widths))
+    return "\n".join(line.rstrip() for line in lines)
@@ -1,7 +1,15 @@
+import logging
+import os.path
 import re
 
-from hasty_coder import openai_cli
-from hasty_coder.langlib.python import get_func_and_class_snippets, walk_python_files
+from hasty_coder import llm
+from hasty_coder.langlib.python import (
+    SnippetDeduplicator,
+    get_func_and_class_snippets,
+    walk_python_files,
+)
+
+logger = logging.getLogger(__name__)
 
 
 def review_snippet_old(code_snippet):
@@ -19,7 +27,7 @@ CODE SNIPPET:
 
 RESPONSE:"""
 
-    major_problems = openai_cli.completion(prompt, max_tokens=400)
+    major_problems = llm.complete(prompt, max_tokens=400)
     return major_problems
 
 
@@ -38,7 +46,7 @@ CODE SNIPPET:
 IDENTICAL CODE SNIPPET WITH COMMENTS ABOUT MAJOR PROBLEMS:
 ``````
 """
-    flagged_code = openai_cli.completion(prompt, max_tokens=1800, stop=["``````"])
+    flagged_code = llm.complete(prompt, max_tokens=1800, stop=["``````"])
     # print(flagged_code)
     deflagged_code = _validate_review_comments(flagged_code)
     # print(deflagged_code)
@@ -62,7 +70,7 @@ CODE:
 ``````
 CODE WITH IRRELEVANT #!# COMMENTS REMOVED:
 ``````"""
-    deflagged_code = openai_cli.completion(prompt, max_tokens=1800, stop=["``````"])
+    deflagged_code = llm.complete(prompt, max_tokens=1800, stop=["``````"])
     return deflagged_code
 
 
@@ -106,26 +114,43 @@ def _parse_flagged_code(original_code, flagged_code):
     return comments
 
 
-def review_file_source(code_text, file_path=None):
+def review_deduplicator():
+    """
+    Return a deduplicator for reviews.
+
+    Review comments are tied to line numbers so only copies with the same tokens on the same lines share a
+    review. Renamed copies have the same problems, so identifiers are canonicalized.
+    """
+    return SnippetDeduplicator(canonicalize_identifiers=True)
+
+
+def review_file_source(code_text, file_path=None, deduplicator=None):
+    deduplicator = deduplicator or review_deduplicator()
     for snippet in get_func_and_class_snippets(code_text, filepath=file_path):
-        comments = review_snippet(snippet.code_text, line_offset=snippet.start_line)
+        comments = deduplicator.run(snippet.code_text, review_snippet)
+        comments = [(line_num + snippet.start_line, c) for line_num, c in comments]
         yield snippet, comments
 
 
-def review_file(file_path):
+def review_file(file_path, deduplicator=None):
     with open(file_path, encoding="utf-8") as f:
         code_text = f.read()
-    for snippet, comments in review_file_source(code_text, file_path=file_path):
+    for snippet, comments in review_file_source(
+        code_text, file_path=file_path, deduplicator=deduplicator
+    ):
         yield snippet, comments
 
 
 def review_files(file_paths):
+    deduplicator = review_deduplicator()
     for file_path in file_paths:
-        for snippet, comments in review_file(file_path):
+        for snippet, comments in review_file(file_path, deduplicator=deduplicator):
             yield snippet, comments
+    if deduplicator.calls_saved:
+        logger.info(f"Skipped reviewing {deduplicator.calls_saved} duplicate snippets")
 
 
 def review_path(path):
-    file_paths = walk_python_files(path)
+    file_paths = [os.path.join(path, p) for p in walk_python_files(path)]
     for snippet, comments in review_files(file_paths):
         yield snippet, comments
@@ -0,0 +1,173 @@
+"""
+Point test generation at the code the existing tests don't cover.
+
+The project's test suite is run once under coverage.py in a subprocess. Uncovered lines are mapped onto
+function snippets, and only functions below a coverage threshold get tests written, most uncovered lines first.
+Results are cached by a hash of the project's python sources, so the suite only runs again after a change.
+"""
+import logging
+import os.path
+import subprocess
+import sys
+import tempfile
+from dataclasses import dataclass
+from hashlib import md5
+
+import orjson
+
+from hasty_coder.project_map import get_project_map
+
+logger = logging.getLogger(__name__)
+
+COVERAGE_TIMEOUT_SECONDS = 30 * 60
+
+
+class CoverageUnavailable(Exception):
+    """The test suite couldn't be measured, so every function is a target."""
+
+
+@dataclass
+class SnippetCoverage:
+    statements: int
+    uncovered: int
+
+    @property
+    def fraction_covered(self):
+        if not self.statements:
+            return 1.0
+        return 1 - self.uncovered / self.statements
+
+
+def get_cache_dir():
+    return os.path.join(tempfile.gettempdir(), "hasty-coder/coverage/")
+
+
+def source_hash(project_map):
+    """Return a hash of every python file in the project."""
+    digest = md5()
+    for rel_path in sorted(project_map.files):
+        if rel_path.endswith(".py"):
+            digest.update(rel_path.encode("utf-8"))
+            digest.update(project_map.files[rel_path].content_hash.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def get_project_coverage(project_root):
+    """
+    Return `{relative_path: (statement_lines, missing_lines)}` for the project's test suite.
+
+    Reuses the last measurement if no python file changed since.
+    """
+    project_root = os.path.abspath(project_root)
+    current_hash = source_hash(get_project_map(project_root))
+    cache_path = os.path.join(
+        get_cache_dir(), md5(project_root.encode("utf-8")).hexdigest() + ".json"
+    )
+    try:
+        with open(cache_path, "rb") as f:
+            cached = orjson.loads(f.read())
+        if cached["source_hash"] == current_hash:
+            logger.info("Sources unchanged, reusing coverage from the last run")
+            return _coverage_from_json(cached["files"])
+    except (FileNotFoundError, orjson.JSONDecodeError, KeyError):
+        pass
+
+    files = _run_coverage(project_root)
+    os.makedirs(get_cache_dir(), exist_ok=True)
+    with tempfile.NamedTemporaryFile(mode="wb", dir=get_cache_dir(), delete=False) as f:
+        f.write(orjson.dumps({"source_hash": current_hash, "files": files}))
+    os.replace(f.name, cache_path)
+    return _coverage_from_json(files)
+
+
+def _coverage_from_json(files):
+    return {
+        rel_path: (set(statements), set(missing))
+        for rel_path, (statements, missing) in files.items()
+    }
+
+
+def _run_coverage(project_root):
+    """Run the test suite under coverage. Returns `{relative_path: [statement_lines, missing_lines]}`."""
+    with tempfile.TemporaryDirectory(prefix="hasty-coder-coverage-") as tmp_dir:
+        data_file = os.path.join(tmp_dir, ".coverage")
+        report_file = os.path.join(tmp_dir, "coverage.json")
+        coverage = [sys.executable, "-m", "coverage"]
+        logger.info("Measuring test coverage of %s", project_root)
+        try:
+            run = subprocess.run(
+                coverage
+                + ["run", f"--data-file={data_file}", f"--source={project_root}"]
+                + ["-m", "pytest", "-q", "-p", "no:cacheprovider"],
+                cwd=project_root,
+                capture_output=True,
+                text=True,
+                timeout=COVERAGE_TIMEOUT_SECONDS,
+                check=False,
+            )
+            if "No module named coverage" in run.stderr:
+                raise CoverageUnavailable("coverage.py is not installed")
+            subprocess.run(
+                coverage
+                + ["json", f"--data-file={data_file}", "-o", report_file, "-q"],
+                cwd=project_root,
+                capture_output=True,
+                text=True,
+                timeout=300,
+                check=True,
+            )
+            with open(report_file, "rb") as f:
+                report = orjson.loads(f.read())
+        except (OSError, subprocess.SubprocessError) as e:
+            raise CoverageUnavailable(f"Couldn't measure coverage: {e}") from e
+
+    files = {}
+    for filename, file_report in report["files"].items():
+        rel_path = os.path.relpath(os.path.join(project_root, filename), project_root)
+        missing = file_report["missing_lines"]
+        statements = sorted(file_report["executed_lines"] + missing)
+        files[rel_path] = [statements, missing]
+    return files
+
+
+def measure_snippet_coverage(snippet, coverage, project_root):
+    """Return the `SnippetCoverage` of a snippet. Files the suite never imported count as uncovered."""
+    rel_path = os.path.relpath(os.path.abspath(snippet.filepath), project_root)
+    snippet_lines = set(range(snippet.start_line, snippet.end_line + 1))
+    if rel_path not in coverage:
+        return SnippetCoverage(
+            statements=len(snippet_lines), uncovered=len(snippet_lines)
+        )
+    statements, missing = coverage[rel_path]
+    return SnippetCoverage(
+        statements=len(statements & snippet_lines),
+        uncovered=len(missing & snippet_lines),
+    )
+
+
+def select_undercovered_snippets(snippets, project_root, threshold=0.8):
+    """
+    Return the snippets covered less than threshold, most uncovered lines first.
+
+    If coverage can't be measured every snippet is returned.
+    """
+    project_root = os.path.abspath(project_root)
+    try:
+        coverage = get_project_coverage(project_root)
+    except CoverageUnavailable as e:
+        logger.warning("%s. Writing tests for every function.", e)
+        return list(snippets)
+
+    targets = []
+    for snippet in snippets:
+        snippet_coverage = measure_snippet_coverage(snippet, coverage, project_root)
+        if snippet_coverage.fraction_covered < threshold:
+            targets.append((snippet_coverage.uncovered, snippet))
+    targets.sort(key=lambda target: -target[0])
+    logger.info(
+        "%d of %d functions are less than %d%% covered",
+        len(targets),
+        len(snippets),
+        threshold * 100,
+    )
+    return [snippet for _, snippet in targets]
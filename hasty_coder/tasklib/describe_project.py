@@ -1,45 +1,55 @@
 import os.path
 from pathlib import Path
 
-from hasty_coder.filewalk import find_project_root, get_nonignored_file_paths
-from hasty_coder.langlib.python import get_file_docstring
+from hasty_coder.filewalk import find_project_root
 from hasty_coder.models import SoftwareProjectPlan
+from hasty_coder.project_map import get_project_map
+from hasty_coder.search_index import DEFAULT_CONTEXT_TOKENS, get_project_search_index
 from hasty_coder.utils import slugify
 
 
-def fill_in_project_plan_from_path(path):
+def fill_in_project_plan_from_path(path, relevant_to=None, max_context_tokens=None):
     """
     Fill in a project plan with information from the path.
 
     If the path is a file, the project name is the name of the file without the extension.
     If the path is a directory, the project name is the name of the directory.
+
+    If `relevant_to` is given, only the files most relevant to it are listed (with their docstrings and
+    signatures as descriptions), up to max_context_tokens. Otherwise every file is listed.
     """
-    project_root_path = Path(find_project_root(path))
-    if project_root_path is None:
+    project_root = find_project_root(path)
+    if project_root is None:
         raise ValueError("Could not find project root. Must be in a git repository.")
+    project_root_path = Path(project_root)
     print(f"Project root: {project_root_path}")
     project_name = slugify(project_root_path.name).replace("-", " ").title()
 
-    project_files = get_nonignored_file_paths(project_root_path)
+    if relevant_to is None:
+        project_map = get_project_map(project_root_path)
+        project_files = {f: "" for f in project_map.file_paths()}
+    else:
+        target = os.path.relpath(os.path.abspath(path), project_root_path)
+        project_files = get_project_search_index(project_root_path).relevant_files(
+            f"{target} {relevant_to}",
+            max_tokens=max_context_tokens or DEFAULT_CONTEXT_TOKENS,
+            exclude={target},
+        )
 
     project_plan = SoftwareProjectPlan(
         software_name=project_name,
-        project_files={f: "" for f in project_files},
+        project_files=project_files,
     )
     return project_plan
 
 
 def get_project_files_and_descriptions(root_path):
     """Return a dictionary of project files and descriptions."""
-    file_descriptions = {}
-    project_files = get_nonignored_file_paths(root_path)
-    for file_path in project_files:
-        abs_path = os.path.join(root_path, file_path)
-        description = ""
-        if abs_path.endswith(".py"):
-            description = get_file_docstring(abs_path)
-        file_descriptions[file_path] = description or ""
-    return file_descriptions
+    project_map = get_project_map(root_path)
+    return {
+        file_path: project_map.files[file_path].docstring
+        for file_path in project_map.file_paths()
+    }
 
 
 if __name__ == "__main__":
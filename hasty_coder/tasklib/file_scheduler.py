@@ -0,0 +1,271 @@
+"""
+Decide what order to generate a project's files in.
+
+A run takes as long as its slowest chain of work, so starting a big `main.py` last stretches the whole run.
+Each file's generation time is estimated from its extension and description (corrected by timings of earlier
+runs) and the longest jobs are started first. Files can depend on other files, like tests on the modules they
+import. A dependent waits for its dependencies, and a job's priority includes the work that waits on it. Small
+files written several to a completion are one job, estimated as the sum of its files.
+"""
+import contextvars
+import logging
+import os.path
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# rough size of generated files, in tokens
+EXTENSION_TOKEN_ESTIMATES = {
+    ".py": 700,
+    ".js": 700,
+    ".ts": 700,
+    ".go": 700,
+    ".java": 800,
+    ".rs": 700,
+    ".html": 600,
+    ".css": 400,
+    ".md": 500,
+    ".toml": 150,
+    ".cfg": 150,
+    ".ini": 100,
+    ".yml": 200,
+    ".yaml": 200,
+    ".json": 200,
+    ".txt": 60,
+    ".gitignore": 0,
+}
+FILENAME_TOKEN_ESTIMATES = {
+    "dockerfile": 150,
+    "makefile": 200,
+    "license": 0,
+    "__init__.py": 20,
+    "readme.md": 900,
+}
+DEFAULT_TOKEN_ESTIMATE = 300
+DEFAULT_SECONDS_PER_TOKEN = 0.03
+
+# history path -> TimingHistory
+_timing_histories = {}
+
+
+def get_timing_history_path():
+    return os.path.join(tempfile.gettempdir(), "hasty-coder/file-timings.json")
+
+
+def is_test_file(filepath):
+    filename = os.path.basename(filepath)
+    return filename.startswith("test_") or filename.endswith("_test.py")
+
+
+def file_kind(filepath):
+    """Return the group a file's timings are pooled with, like `.py` or `test .py`."""
+    filename = os.path.basename(filepath).lower()
+    if filename in FILENAME_TOKEN_ESTIMATES:
+        return filename
+    kind = os.path.splitext(filename)[1] or filename
+    return f"test {kind}" if is_test_file(filepath) else kind
+
+
+def estimate_file_tokens(filepath, description=""):
+    """Estimate how many tokens it takes to write a file."""
+    filename = os.path.basename(filepath).lower()
+    tokens = FILENAME_TOKEN_ESTIMATES.get(filename)
+    if tokens is None:
+        extension = os.path.splitext(filename)[1] or filename
+        tokens = EXTENSION_TOKEN_ESTIMATES.get(extension, DEFAULT_TOKEN_ESTIMATE)
+        if tokens and is_test_file(filepath):
+            tokens *= 1.3
+        if tokens and os.path.splitext(filename)[0] in ("main", "app", "cli", "views"):
+            tokens *= 1.5
+    if tokens:
+        # longer descriptions usually mean more to write
+        tokens += 10 * len((description or "").split())
+    return tokens
+
+
+class TimingHistory:
+    """Seconds per estimated token for each kind of file, learned from earlier runs."""
+
+    def __init__(self, path=None):
+        self.path = path or get_timing_history_path()
+        self._lock = threading.Lock()
+        # kind -> [estimated tokens, seconds]
+        self.totals = self._load()
+
+    def seconds_per_token(self, kind):
+        estimated_tokens, seconds = self.totals.get(kind, (0, 0))
+        if estimated_tokens < 100:
+            return DEFAULT_SECONDS_PER_TOKEN
+        return seconds / estimated_tokens
+
+    def estimate_seconds(self, filepath, description=""):
+        tokens = estimate_file_tokens(filepath, description)
+        return tokens * self.seconds_per_token(file_kind(filepath))
+
+    def record(self, filepath, description, seconds):
+        tokens = estimate_file_tokens(filepath, description)
+        if not tokens:
+            return
+        with self._lock:
+            totals = self.totals.setdefault(file_kind(filepath), [0, 0])
+            totals[0] += tokens
+            totals[1] += seconds
+
+    def save(self):
+        with self._lock:
+            data = orjson.dumps(self.totals)
+        history_dir = os.path.dirname(self.path)
+        os.makedirs(history_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(mode="wb", dir=history_dir, delete=False) as f:
+            f.write(data)
+        os.replace(f.name, self.path)
+
+    def _load(self):
+        try:
+            with open(self.path, "rb") as f:
+                return orjson.loads(f.read())
+        except FileNotFoundError:
+            return {}
+        except orjson.JSONDecodeError:
+            logger.warning("Ignoring corrupt timing history %s", self.path)
+            return {}
+
+
+def get_timing_history():
+    path = get_timing_history_path()
+    if path not in _timing_histories:
+        _timing_histories[path] = TimingHistory(path)
+    return _timing_histories[path]
+
+
+def infer_file_dependencies(filepaths):
+    """Make each test file depend on the modules it is named after, like `tests/test_db.py` on `app/db.py`."""
+    modules_by_name = {}
+    for filepath in filepaths:
+        if filepath.endswith(".py") and not is_test_file(filepath):
+            name = os.path.splitext(os.path.basename(filepath))[0]
+            modules_by_name.setdefault(name, []).append(filepath)
+
+    dependencies = {}
+    for filepath in filepaths:
+        if not is_test_file(filepath):
+            continue
+        name = os.path.splitext(os.path.basename(filepath))[0]
+        name = (
+            name[len("test_") :] if name.startswith("test_") else name[: -len("_test")]
+        )
+        if modules_by_name.get(name):
+            dependencies[filepath] = modules_by_name[name]
+    return dependencies
+
+
+def schedule_priorities(estimates, dependencies):
+    """
+    Return each job's priority: its own estimate plus the longest chain of work that waits on it.
+
+    Without dependencies this is longest-processing-time-first.
+    """
+    dependents = {job: [] for job in estimates}
+    for job, job_dependencies in dependencies.items():
+        for dependency in job_dependencies:
+            if dependency in dependents and job in estimates:
+                dependents[dependency].append(job)
+
+    priorities = {}
+
+    def priority(job, visiting=()):
+        if job not in priorities:
+            if job in visiting:
+                raise ValueError(f"Circular file dependency involving {job}")
+            downstream = [priority(d, visiting + (job,)) for d in dependents[job]]
+            priorities[job] = estimates[job] + max(downstream, default=0)
+        return priorities[job]
+
+    for job in estimates:
+        priority(job)
+    return priorities
+
+
+def job_filepaths(job):
+    """Return the files a job writes. A job is a filepath or a tuple of filepaths written together."""
+    return job if isinstance(job, tuple) else (job,)
+
+
+def run_scheduled(func, jobs, max_workers=2, dependencies=None, history=None):
+    """
+    Call `func(job)` for each job in `{job: description}`, longest first, respecting dependencies.
+
+    A job is a filepath, or a tuple of filepaths written together with a tuple of their descriptions. Returns
+    `{job: seconds}`. If any job raised, the first error is raised once every job has finished.
+    """
+    history = history or get_timing_history()
+    job_descriptions = {
+        job: jobs[job] if isinstance(job, tuple) else (jobs[job],) for job in jobs
+    }
+    job_by_filepath = {filepath: job for job in jobs for filepath in job_filepaths(job)}
+    job_dependencies = {}
+    for filepath, filepath_dependencies in (dependencies or {}).items():
+        job = job_by_filepath.get(filepath)
+        if job is None:
+            continue
+        for dependency in filepath_dependencies:
+            dependency_job = job_by_filepath.get(dependency)
+            if dependency_job is not None and dependency_job != job:
+                job_dependencies.setdefault(job, []).append(dependency_job)
+    dependencies = job_dependencies
+    estimates = {
+        job: sum(
+            history.estimate_seconds(filepath, description)
+            for filepath, description in zip(job_filepaths(job), job_descriptions[job])
+        )
+        for job in jobs
+    }
+    priorities = schedule_priorities(estimates, dependencies)
+
+    waiting = set(jobs)
+    finished = set()
+    timings = {}
+    errors = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+
+        def timed(job):
+            started_at = time.perf_counter()
+            try:
+                return func(job)
+            finally:
+                timings[job] = time.perf_counter() - started_at
+
+        while waiting or running:
+            ready = [
+                job
+                for job in waiting
+                if all(d in finished for d in dependencies.get(job, ()))
+            ]
+            ready.sort(key=lambda job: (-priorities[job], job_filepaths(job)))
+            for job in ready[: max_workers - len(running)]:
+                waiting.remove(job)
+                # in the caller's context, so context variables like `llm.completion_group` carry over
+                context = contextvars.copy_context()
+                running[executor.submit(context.run, timed, job)] = job
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = running.pop(future)
+                finished.add(job)
+                if future.exception() is not None:
+                    logger.error("Generating %s failed: %r", job, future.exception())
+                    errors.append(future.exception())
+                    continue
+                # a batch's time isn't the time of writing its files one at a time
+                if not isinstance(job, tuple):
+                    history.record(job, jobs[job], timings[job])
+
+    history.save()
+    if errors:
+        raise errors[0]
+    return timings
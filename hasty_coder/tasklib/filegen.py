@@ -2,56 +2,174 @@ import logging
 import re
 from pathlib import Path
 
+from hasty_coder import llm
 from hasty_coder.langlib import python
 from hasty_coder.models import SoftwareProjectPlan
+from hasty_coder.tasklib.file_scheduler import estimate_file_tokens
+from hasty_coder.tasklib.filegen_handlers.gen_boilerplate import BOILERPLATE_HOOKS
 from hasty_coder.tasklib.filegen_handlers.gen_gitignore import gen_gitignore
 from hasty_coder.tasklib.filegen_handlers.gen_readme import gen_readme
-from hasty_coder.utils import LoggedOpenAI
 
 logger = logging.getLogger(__name__)
 
+# files expected to be shorter than this are written several to a prompt
+SMALL_FILE_TOKENS = 250
+MAX_BATCH_FILES = 8
+MAX_BATCH_TOKENS = 1200
+BATCH_FILE_START = "=== FILE: {filepath} ==="
+BATCH_FILE_END = "=== END FILE ==="
+BATCH_FILE_PATTERN = re.compile(
+    r"^=== FILE: (?P<filepath>.+?) ===\n(?P<contents>.*?)^=== END FILE ===",
+    flags=re.MULTILINE | re.DOTALL,
+)
 
-def generate_file_contents(filepath, project_plan: SoftwareProjectPlan):
-    """Generate file contents for a given filepath and SoftwareProjectPlan object."""
+
+def generate_file_contents(
+    filepath,
+    project_plan: SoftwareProjectPlan,
+    context="",
+    llm_files=(),
+    format_python=True,
+):
+    """
+    Generate file contents for a given filepath and SoftwareProjectPlan object.
+
+    `context` is added to the prompt, like the signatures of files that were already written. Files named in
+    `llm_files` are generated by the LLM even if there is a template for them. Pass `format_python=False` when
+    the caller formats and checks python itself, like `implement_project_plan` does in worker processes.
+    """
+    local_contents = render_local_file(filepath, project_plan, llm_files=llm_files)
+    if local_contents is not None:
+        return local_contents
     filepath = Path(filepath)
     description = project_plan.project_files.get(str(filepath), "")
     logger.info("Generating %s", filepath)
     handler = match_file_handler(filepath)
     if handler:
-        return handler(filepath, description, project_plan)
+        file_contents = handler(filepath, description, project_plan)
+        # handlers return None when they can't write the file, which leaves it to the LLM
+        if file_contents is not None:
+            return file_contents
 
     end_token = "ENDOFFILE_ZZZ"
     prompt = f"""
 {project_plan.as_markdown()}
-
+{context}
 INSTRUCTIONS
 Based on the description above. Write the contents of the {filepath} file. Denote the end of the file with the string "{end_token}"
 The {filepath} file is described as "{description}".
 {filepath} FILE CONTENTS:
 """
-    llm = LoggedOpenAI(temperature=0.01)
     file_contents = None
     print(prompt)
     for i in range(3):
-        file_contents = llm(prompt, stop=[end_token])
+        file_contents = llm.complete(prompt, temperature=0.01, stop=[end_token])
         if file_contents:
             break
 
-    if filepath.name.endswith(".py"):
+    if format_python and filepath.name.endswith(".py"):
         file_contents = python.format_code(file_contents)
 
     return file_contents
 
 
-def match_file_handler(filepath):
+def group_small_files(filepaths, project_plan: SoftwareProjectPlan):
+    """
+    Return batches of the files small enough to be written together, and the files to write one at a time.
+
+    Files with a handler aren't batched.
+    """
+    batches, singles = [], []
+    batch, batch_tokens = [], 0
+    for filepath in filepaths:
+        description = project_plan.project_files.get(str(filepath), "")
+        tokens = estimate_file_tokens(str(filepath), description)
+        if match_file_handler(filepath) or not tokens or tokens > SMALL_FILE_TOKENS:
+            singles.append(filepath)
+            continue
+        if len(batch) >= MAX_BATCH_FILES or batch_tokens + tokens > MAX_BATCH_TOKENS:
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(filepath)
+        batch_tokens += tokens
+    if len(batch) > 1:
+        batches.append(batch)
+    else:
+        singles.extend(batch)
+    return batches, singles
+
+
+def generate_file_batch_contents(filepaths, project_plan: SoftwareProjectPlan):
+    """
+    Generate the contents of several small files with one completion.
+
+    Returns `{filepath: contents}` for the files found in the response, unformatted. The rest should be
+    generated one at a time with `generate_file_contents`.
+    """
+    logger.info("Generating %s", ", ".join(str(filepath) for filepath in filepaths))
+    file_list = "\n".join(
+        f" - {filepath}: {project_plan.project_files.get(str(filepath), '')}"
+        for filepath in filepaths
+    )
+    example = f"{BATCH_FILE_START.format(filepath='<FILEPATH>')}\n<CONTENTS>\n{BATCH_FILE_END}"
+    prompt = f"""
+{project_plan.as_markdown()}
+
+INSTRUCTIONS
+Based on the description above. Write the contents of each of these files:
+{file_list}
+
+Write every file in this format, one after the other:
+{example}
+
+FILES:
+"""
+    response = llm.complete(prompt, temperature=0.01, max_tokens=MAX_BATCH_TOKENS * 2)
+
+    wanted = {str(filepath): filepath for filepath in filepaths}
+    contents_by_filepath = {}
+    for match in BATCH_FILE_PATTERN.finditer(response + "\n"):
+        filepath = wanted.get(match.group("filepath").strip().strip("`"))
+        if filepath is None:
+            continue
+        contents_by_filepath[filepath] = match.group("contents")
+    missing = [
+        str(filepath) for filepath in filepaths if filepath not in contents_by_filepath
+    ]
+    if missing:
+        logger.info("Batch response was missing %s", ", ".join(missing))
+    return contents_by_filepath
+
+
+def match_file_handler(filepath, hooks=None):
     """Return the handler associated with the given filepath, or None if no match is found."""
     filename = Path(filepath).name
-    for pattern, handler in FILENAME_PATTERN_HOOKS.items():
-        if re.match(pattern, filename, flags=re.IGNORECASE):
+    for pattern, handler in (hooks or FILENAME_PATTERN_HOOKS).items():
+        if re.fullmatch(pattern, filename, flags=re.IGNORECASE):
             return handler
     return None
 
 
+def render_local_file(filepath, project_plan: SoftwareProjectPlan, llm_files=()):
+    """
+    Render a boilerplate file from a template, without the LLM.
+
+    Returns None if there's no template that fits, or the filename is in `llm_files`.
+    """
+    filepath = Path(filepath)
+    if filepath.name.lower() in {name.lower() for name in llm_files}:
+        return None
+    handler = match_file_handler(filepath, hooks=BOILERPLATE_HOOKS)
+    if handler is None:
+        return None
+    contents = handler(
+        filepath, project_plan.project_files.get(str(filepath), ""), project_plan
+    )
+    if contents is not None:
+        logger.info("Rendered %s from a template", filepath)
+    return contents
+
+
 FILENAME_PATTERN_HOOKS = {
     r"readme\.md": gen_readme,
     r"\.gitignore": gen_gitignore,
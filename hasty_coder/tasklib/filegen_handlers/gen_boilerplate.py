@@ -0,0 +1,292 @@
+"""
+Render common boilerplate files from templates instead of asking the LLM.
+
+Each handler reads the plan's software stack and returns the file contents, or None when the template doesn't
+fit the project (like a `requirements.txt` for a Go project) so the file is generated as usual. Requirements
+are only rendered for stacks whose packages are all known; otherwise the LLM lists what the project imports.
+"""
+import re
+from datetime import date
+
+from hasty_coder.models import SoftwareProjectPlan
+
+PYTHON_VERSION = "3.11"
+
+# stack names -> pypi requirements
+FRAMEWORK_REQUIREMENTS = {
+    "flask": ["flask"],
+    "django": ["django"],
+    "fastapi": ["fastapi", "uvicorn"],
+    "click": ["click"],
+    "typer": ["typer"],
+    "streamlit": ["streamlit"],
+    "pyramid": ["pyramid"],
+    "tornado": ["tornado"],
+}
+DATABASE_REQUIREMENTS = {
+    "postgresql": ["psycopg2-binary"],
+    "postgres": ["psycopg2-binary"],
+    "mysql": ["pymysql"],
+    "mongodb": ["pymongo"],
+    "redis": ["redis"],
+    "sqlalchemy": ["sqlalchemy"],
+}
+TESTING_REQUIREMENTS = {"pytest": ["pytest"], "unittest": []}
+# stack names that need no packages
+STDLIB_DATABASES = {"", "none", "sqlite", "sqlite3"}
+
+TOML_ESCAPES = {
+    "\b": "\\b",
+    "\t": "\\t",
+    "\n": "\\n",
+    "\f": "\\f",
+    "\r": "\\r",
+    '"': '\\"',
+    "\\": "\\\\",
+}
+
+# descriptions of `__init__.py` files that have nothing to do but exist
+EMPTY_INIT_PATTERN = re.compile(
+    r"^(empty\b|package\s+(initiali[sz]er|marker)\b|(marks?|makes?|indicates?|declares?|initiali[sz]es?)\s+(the\s+|this\s+|an?\s+)?\S*\s*"
+    r"(as\s+an?\s+)?(python\s+)?(package|module|directory|folder)\b)",
+    flags=re.IGNORECASE,
+)
+# ...unless they also mention doing something
+INIT_CODE_PATTERN = re.compile(
+    r"\b(and|import|expos|export|creat|regist|configur|version|app)\w*",
+    flags=re.IGNORECASE,
+)
+OTHER_LICENSE_PATTERN = re.compile(
+    r"apache|gpl|bsd|mozilla|mpl|unlicense|proprietary", re.I
+)
+
+MIT_LICENSE = """MIT License
+
+Copyright (c) {year} The {software_name} Authors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+SETUP_PY = """from setuptools import find_packages, setup
+
+setup(
+    name={name!r},
+    version="0.1.0",
+    description={description!r},
+    packages=find_packages(exclude=["tests", "tests.*"]),
+    python_requires=">={python_version}",
+    install_requires={requirements!r},
+)
+"""
+
+PYPROJECT_TOML = """[build-system]
+requires = ["setuptools>=61"]
+build-backend = "setuptools.build_meta"
+
+[project]
+name = {name}
+version = "0.1.0"
+description = {description}
+requires-python = ">={python_version}"
+dependencies = [{requirements}]
+"""
+
+DOCKERFILE = """FROM python:{python_version}-slim
+
+WORKDIR /app
+{install}
+COPY . .
+{expose}
+CMD {command}
+"""
+
+
+def is_python_project(project_plan: SoftwareProjectPlan):
+    language = project_plan.stack_value("programming_language") or ""
+    return "python" in language.lower()
+
+
+def _stack_name(project_plan, key):
+    return (project_plan.stack_value(key) or "").lower().strip()
+
+
+def toml_string(value):
+    """Return value as a TOML basic string."""
+    escaped = "".join(
+        TOML_ESCAPES.get(char)
+        or (f"\\u{ord(char):04x}" if ord(char) < 0x20 or ord(char) == 0x7F else char)
+        for char in value
+    )
+    return f'"{escaped}"'
+
+
+def runtime_requirements(project_plan: SoftwareProjectPlan):
+    """Return the pypi packages the stack needs at runtime, or None if the stack has unknown parts."""
+    framework = _stack_name(project_plan, "framework")
+    database = _stack_name(project_plan, "database")
+    if framework not in FRAMEWORK_REQUIREMENTS:
+        return None
+    if database not in DATABASE_REQUIREMENTS and database not in STDLIB_DATABASES:
+        return None
+    return FRAMEWORK_REQUIREMENTS[framework] + DATABASE_REQUIREMENTS.get(database, [])
+
+
+def testing_requirements(project_plan: SoftwareProjectPlan):
+    """Return the pypi packages the tests need, or None if the testing framework is unknown."""
+    testing_framework = _stack_name(project_plan, "testing_framework") or "unittest"
+    return TESTING_REQUIREMENTS.get(testing_framework)
+
+
+def gen_empty_init(filepath, description, project_plan: SoftwareProjectPlan):
+    """Write an empty `__init__.py` unless its description says it should hold code."""
+    if not is_python_project(project_plan):
+        return None
+    description = (description or "").strip().rstrip(".")
+    if filepath.parts[0] == "tests" or not description:
+        return ""
+    if EMPTY_INIT_PATTERN.match(description) and not INIT_CODE_PATTERN.search(
+        description
+    ):
+        return ""
+    return None
+
+
+def gen_license(filepath, description, project_plan: SoftwareProjectPlan):
+    """Write an MIT license unless the description asks for another license."""
+    if OTHER_LICENSE_PATTERN.search(description or ""):
+        return None
+    return MIT_LICENSE.format(
+        year=date.today().year, software_name=project_plan.software_name
+    )
+
+
+def gen_requirements(filepath, description, project_plan: SoftwareProjectPlan):
+    """Write a requirements.txt of the stack's packages."""
+    if not is_python_project(project_plan):
+        return None
+    requirements = runtime_requirements(project_plan)
+    test_requirements = testing_requirements(project_plan)
+    if requirements is None or test_requirements is None:
+        return None
+    requirements += test_requirements
+    return "".join(f"{requirement}\n" for requirement in requirements)
+
+
+def gen_setup_py(filepath, description, project_plan: SoftwareProjectPlan):
+    """Write a setuptools setup.py."""
+    if not is_python_project(project_plan):
+        return None
+    requirements = runtime_requirements(project_plan)
+    if requirements is None:
+        return None
+    return SETUP_PY.format(
+        name=project_plan.slug,
+        description=project_plan.tagline or project_plan.short_description or "",
+        python_version=PYTHON_VERSION,
+        requirements=requirements,
+    )
+
+
+def gen_pyproject(filepath, description, project_plan: SoftwareProjectPlan):
+    """Write a pyproject.toml that builds with setuptools."""
+    if not is_python_project(project_plan):
+        return None
+    requirements = runtime_requirements(project_plan)
+    if requirements is None:
+        return None
+    return PYPROJECT_TOML.format(
+        name=toml_string(project_plan.slug),
+        description=toml_string(
+            project_plan.tagline or project_plan.short_description or ""
+        ),
+        python_version=PYTHON_VERSION,
+        requirements=", ".join(toml_string(r) for r in requirements),
+    )
+
+
+def _install_command(project_plan):
+    project_files = project_plan.project_files or {}
+    if "requirements.txt" in project_files:
+        return "pip install -r requirements.txt"
+    if "setup.py" in project_files or "pyproject.toml" in project_files:
+        return "pip install -e ."
+    return None
+
+
+def gen_dockerfile(filepath, description, project_plan: SoftwareProjectPlan):
+    """Write a Dockerfile for python web apps with a known way to start."""
+    if not is_python_project(project_plan):
+        return None
+    framework = _stack_name(project_plan, "framework")
+    if framework == "flask":
+        expose, command = "EXPOSE 5000", '["flask", "run", "--host=0.0.0.0"]'
+    elif framework == "django" and "manage.py" in (project_plan.project_files or {}):
+        expose, command = (
+            "EXPOSE 8000",
+            '["python", "manage.py", "runserver", "0.0.0.0:8000"]',
+        )
+    else:
+        return None
+    install = ""
+    if "requirements.txt" in (project_plan.project_files or {}):
+        install = "\nCOPY requirements.txt .\nRUN pip install --no-cache-dir -r requirements.txt\n"
+    return DOCKERFILE.format(
+        python_version=PYTHON_VERSION, install=install, expose=expose, command=command
+    )
+
+
+def gen_makefile(filepath, description, project_plan: SoftwareProjectPlan):
+    """Write a Makefile with install, test and docker targets."""
+    if not is_python_project(project_plan):
+        return None
+    install = _install_command(project_plan)
+    if install is None:
+        return None
+    test_command = (
+        "pytest" if testing_requirements(project_plan) else "python -m unittest"
+    )
+    targets = [
+        ("install", "Install the dependencies", install),
+        ("test", "Run the tests", test_command),
+    ]
+    if "Dockerfile" in (project_plan.project_files or {}):
+        targets.append(
+            (
+                "docker-build",
+                "Build the docker image",
+                f"docker build -t {project_plan.slug} .",
+            )
+        )
+    phony = " ".join(name for name, _, _ in targets)
+    rules = "\n\n".join(
+        f"{name}:  ## {help_text}\n\t{command}" for name, help_text, command in targets
+    )
+    return f".PHONY: {phony}\n\n{rules}\n"
+
+
+# filename pattern -> handler. Handlers return None to leave the file to the LLM.
+BOILERPLATE_HOOKS = {
+    r"__init__\.py": gen_empty_init,
+    r"license(\.txt|\.md)?": gen_license,
+    r"requirements\.txt": gen_requirements,
+    r"setup\.py": gen_setup_py,
+    r"pyproject\.toml": gen_pyproject,
+    r"dockerfile": gen_dockerfile,
+    r"makefile": gen_makefile,
+}
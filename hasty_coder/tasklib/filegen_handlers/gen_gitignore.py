@@ -1,27 +1,76 @@
 import json
 import logging
+import os
 from functools import lru_cache
 
-from hasty_coder.filecache import get_cached_url_contents
+from hasty_coder.filecache import get_cached_url_contents, prefetch_urls
+from hasty_coder.gitignore_pack import get_gitignore_pack, normalize_template_name
 from hasty_coder.models import SoftwareProjectPlan
 
 logger = logging.getLogger(__name__)
 
+GITIGNORE_TREE_URL = "https://api.github.com/repos/github/gitignore/git/trees/main"
+DEFAULT_GITIGNORE_TEMPLATES = [
+    # Common OS's
+    "Global/Windows",
+    "Global/macOS",
+    "Global/Linux",
+    # Common Editors
+    "Global/Emacs",
+    "Global/JetBrains",
+    "Global/VisualStudioCode",
+]
+
+
+class GitignoreTemplatesUnavailable(RuntimeError):
+    """There's no offline template pack and downloading templates isn't allowed."""
+
+    def __init__(self):
+        super().__init__(
+            "No gitignore template pack is installed. Build one from a checkout of github/gitignore with "
+            "`hc gitignore-pack PATH` (or point HASTY_CODER_GITIGNORE_PACK at one), or allow downloading "
+            "templates with HASTY_CODER_GITIGNORE_NETWORK=1."
+        )
+
 
 def gen_gitignore(filepath, description, project_plan: SoftwareProjectPlan):
-    """Generate a .gitignore file from a SoftwareProjectPlan object."""
-    return gen_gitignore_for_language(
-        project_plan.software_stack.primary_programming_language
-    )
-
-
-def gen_gitignore_for_language(programming_language):
-    available_gitignore_templates = get_available_gitignore_templates()
-    programming_language = programming_language.lower().strip().replace(" ", "")
-    language_template_name = available_gitignore_templates.get(
-        programming_language, None
-    )
-    contents = build_default_gitignore()
+    """
+    Generate a .gitignore file from a SoftwareProjectPlan object.
+
+    Returns None, leaving the file to the LLM, when there are no templates to build it from.
+    """
+    try:
+        return gen_gitignore_for_language(
+            project_plan.stack_value("programming_language")
+        )
+    except GitignoreTemplatesUnavailable as e:
+        logger.warning("%s Asking the LLM to write %s instead.", e, filepath)
+        return None
+
+
+def gen_gitignore_for_language(programming_language, allow_network=None):
+    """
+    Build a .gitignore for a language from the offline template pack.
+
+    The network is only used when `allow_network` is True (or the HASTY_CODER_GITIGNORE_NETWORK env var is
+    "1"). Raises `GitignoreTemplatesUnavailable` if there's no template pack and the network isn't allowed.
+    """
+    if allow_network is None:
+        allow_network = network_allowed()
+    if not allow_network and get_gitignore_pack() is None:
+        raise GitignoreTemplatesUnavailable()
+    programming_language = normalize_template_name(programming_language)
+    contents = build_default_gitignore(allow_network=allow_network)
+    pack = get_gitignore_pack()
+    if pack is not None and programming_language in pack:
+        return contents + pack.get(programming_language)
+
+    language_template_name = None
+    if allow_network:
+        available_gitignore_templates = get_available_gitignore_templates()
+        language_template_name = available_gitignore_templates.get(
+            programming_language, None
+        )
     if language_template_name:
         contents += retreive_gitignore_template(language_template_name)
     else:
@@ -29,10 +78,15 @@ def gen_gitignore_for_language(programming_language):
     return contents
 
 
+def network_allowed():
+    """Return whether gitignore templates may be downloaded. Off unless HASTY_CODER_GITIGNORE_NETWORK is set."""
+    setting = os.getenv("HASTY_CODER_GITIGNORE_NETWORK") or ""
+    return setting.lower() in ("1", "true", "yes")
+
+
 def get_available_gitignore_templates():
     """Get a list of available gitignore templates from the GitHub API."""
-    url = "https://api.github.com/repos/github/gitignore/git/trees/main"
-    contents = get_cached_url_contents(url)
+    contents = get_cached_url_contents(GITIGNORE_TREE_URL)
     data = json.loads(contents.decode("utf-8"))
     paths = [t["path"] for t in data["tree"] if t["path"].endswith(".gitignore")]
     # strip .gitignore ending
@@ -41,23 +95,20 @@ def get_available_gitignore_templates():
     return {lang.lower(): lang for lang in language_names}
 
 
-@lru_cache(maxsize=1)
-def build_default_gitignore():
-    templates = [
-        # Common OS's
-        "Global/Windows",
-        "Global/macOS",
-        "Global/Linux",
-        # Common Editors
-        "Global/Emacs",
-        "Global/JetBrains",
-        "Global/VisualStudioCode",
-    ]
-
+@lru_cache(maxsize=2)
+def build_default_gitignore(allow_network=True):
+    pack = get_gitignore_pack()
     template_contents = []
-    for t in templates:
+    for t in DEFAULT_GITIGNORE_TEMPLATES:
+        if pack is not None and t in pack:
+            template = pack.get(t)
+        elif allow_network:
+            template = retreive_gitignore_template(t)
+        else:
+            logger.warning("No offline gitignore template for %s", t)
+            continue
         template_contents.append(f"## {t}")
-        template_contents.append(retreive_gitignore_template(t))
+        template_contents.append(template)
     template_contents.extend([".idea"])
 
     return "\n".join(template_contents)
@@ -65,11 +116,24 @@ def build_default_gitignore():
 
 def retreive_gitignore_template(template_name):
     """Retreive a gitignore template from the GitHub API."""
-    url = f"https://raw.githubusercontent.com/github/gitignore/main/{template_name}.gitignore"
-    contents = get_cached_url_contents(url)
+    contents = get_cached_url_contents(gitignore_template_url(template_name))
     return contents.decode("utf-8")
 
 
+def gitignore_template_url(template_name):
+    return f"https://raw.githubusercontent.com/github/gitignore/main/{template_name}.gitignore"
+
+
+def prefetch_gitignore_templates():
+    """Start downloading the gitignore template list and default templates in the background."""
+    if not network_allowed():
+        return []
+    urls = [GITIGNORE_TREE_URL] + [
+        gitignore_template_url(t) for t in DEFAULT_GITIGNORE_TEMPLATES
+    ]
+    return prefetch_urls(urls)
+
+
 if __name__ == "__main__":
     print(gen_gitignore_for_language("python"))
     # print(build_default_gitignore())
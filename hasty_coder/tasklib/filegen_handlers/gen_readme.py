@@ -1,5 +1,5 @@
+from hasty_coder import llm
 from hasty_coder.models import SoftwareProjectPlan
-from hasty_coder.utils import LoggedOpenAI
 
 
 def gen_readme(filepath, description, project_plan: SoftwareProjectPlan):
@@ -20,6 +20,6 @@ def gen_hasty_bio():
     prompt = """
 Write a humorous bio for an AI named Hasty that writes a lot of code but doesn't do a good job.  Allude to the many disasters Hasty has caused. Hasty is a big fan of the phrase "move fast and break things". But he does meet deadlines! Write it in first-person tense. 
 """
-    bio = LoggedOpenAI(temperature=0.9)(prompt)
+    bio = llm.complete(prompt, temperature=0.9, reuse_family="hasty_bio")
     bio += "\n\n - [HastyCoder](https://github.com/brycedrennan/hasty-coder) 🤖📝💻🚀💥"
     return bio
@@ -1,19 +1,24 @@
 import logging
-from dataclasses import is_dataclass
 
+from hasty_coder import llm
 from hasty_coder.models import SoftwareProjectPlan
 from hasty_coder.tasklib.fragments import REQUIRED_PROJECT_FILES
-from hasty_coder.utils import LoggedOpenAI, phraseify
+from hasty_coder.utils import phraseify
 
 logger = logging.getLogger(__name__)
 
 
-def generate_project_plan(short_description=""):
-    """Generate a project plan from a short description."""
-    if not short_description:
-        short_description = generate_project_description_short()
-    short_description = rewrite_project_description(short_description)
-    project_plan = SoftwareProjectPlan(short_description=short_description)
+def generate_project_plan(short_description="", project_plan=None):
+    """
+    Generate a project plan from a short description.
+
+    Given a `project_plan`, like one loaded from json, only its missing fields are generated.
+    """
+    if project_plan is None:
+        if not short_description:
+            short_description = generate_project_description_short()
+        short_description = rewrite_project_description(short_description)
+        project_plan = SoftwareProjectPlan(short_description=short_description)
     generation_plan = {
         "long_description": generate_project_description_long,
         "software_name": generate_project_name,
@@ -27,13 +32,114 @@ def generate_project_plan(short_description=""):
         "project_files": generate_project_file_structure,
     }
     for attr, generator in generation_plan.items():
-        attr_value = getattr(project_plan, attr, None)
-        if attr_value is None or is_dataclass(attr_value):
+        if getattr(project_plan, attr, None) is None:
             setattr(project_plan, attr, generator(project_plan))
 
     return project_plan
 
 
+FAST_PLAN_TEMPLATE = """{
+    "short_description": <STR>,  # the description above rewritten as a clear and concise description, in the present tense
+    "long_description": <STR>,  # a concise and witty paragraph expanding on the short description
+    "software_name": <STR>,  # a short and witty noun phrase. No colons or taglines
+    "tagline": <STR>,  # a clever and witty tagline without the name of the project or punctuation
+    "emoji_tagline": <STR>,  # the tagline in no more than 3 emoji
+    "software_stack": {
+        "project_type": <STR>,  # one of ["webapp", "cli", "library", "mobile app", "desktop app"]
+        "programming_language": <STR>,  # prefer python for webapps, clis and libraries
+        "framework": <STR>,  # prefer flask for python webapps
+        "database": <null or STR>,
+        "testing_framework": <STR>
+    },
+    "installation_instructions": <STR>,  # how to install the software as a single terminal command, in markdown
+    "quick_start": <STR>,  # how to start the program as a single terminal command, in markdown
+    "features": [<STR>, ...],  # customer-oriented key features, each formatted "<FEATURE_NAME>: <FEATURE_DESCRIPTION>"
+    "todo": [<STR>, ...],  # smaller tasks that will complete the software
+    "project_files": {<FILEPATH>: <STR>, ...}  # every file of the project and a description starting with a present tense verb. No code in the root folder. Include a README.md, Makefile, Dockerfile, .gitignore and a test suite mirroring the code
+}"""
+
+
+def _is_text(value):
+    return isinstance(value, str) and bool(value.strip())
+
+
+def _is_text_list(value):
+    return isinstance(value, list) and bool(value) and all(map(_is_text, value))
+
+
+PLAN_FIELD_VALIDATORS = {
+    "short_description": _is_text,
+    "long_description": _is_text,
+    "software_name": _is_text,
+    "tagline": _is_text,
+    "emoji_tagline": _is_text,
+    "software_stack": lambda value: isinstance(value, dict)
+    and _is_text(value.get("programming_language")),
+    "installation_instructions": _is_text,
+    "quick_start": _is_text,
+    "features": _is_text_list,
+    "todo": _is_text_list,
+    "project_files": lambda value: isinstance(value, dict)
+    and bool(value)
+    and all(isinstance(description, str) for description in value.values()),
+}
+
+
+def generate_project_plan_fast(short_description=""):
+    """
+    Generate a project plan with a single completion.
+
+    The whole plan is requested as one json object. Fields that are missing or invalid are then filled in by
+    the same generators `generate_project_plan` uses, so the result has the same shape as a staged plan.
+    """
+    if not short_description:
+        short_description = generate_project_description_short()
+    prompt = f"""
+DESCRIPTION:
+{short_description}
+
+INSTRUCTIONS:
+Based on the description of a software project above, write a plan for it. Use the format provided in the JSON template
+below. Replace the parts contained in angle brackets with the appropriate values.
+
+JSON TEMPLATE:
+```
+{FAST_PLAN_TEMPLATE}
+```
+PROJECT PLAN (json):
+"""
+    try:
+        answer = llm.complete(prompt, temperature=0.02, max_tokens=3000, as_json=True)
+    except llm.CompletionError:
+        logger.warning("No usable plan from the single completion")
+        answer = {}
+    if not isinstance(answer, dict):
+        answer = {}
+
+    project_plan = SoftwareProjectPlan()
+    for attr, is_valid in PLAN_FIELD_VALIDATORS.items():
+        value = answer.get(attr)
+        if is_valid(value):
+            setattr(project_plan, attr, value)
+        else:
+            logger.info("Regenerating %s, it was missing or invalid", attr)
+    if project_plan.short_description is None:
+        project_plan.short_description = rewrite_project_description(short_description)
+    # match what the staged generators return
+    if project_plan.software_name is not None:
+        project_plan.software_name = phraseify(project_plan.software_name)
+    if project_plan.emoji_tagline is not None:
+        project_plan.emoji_tagline = project_plan.emoji_tagline.replace(" ", "")
+    if project_plan.project_files is not None:
+        project_plan.project_files = {
+            path: project_plan.project_files.get(path, "")
+            for path in sorted(
+                set(project_plan.project_files) | set(REQUIRED_PROJECT_FILES)
+            )
+        }
+    return generate_project_plan(project_plan=project_plan)
+
+
 def generate_software_stack(project_plan):
     """Generate a software stack based on a given project plan."""
     prompt = f"""
@@ -58,7 +164,7 @@ JSON TEMPLATE:
 TECH STACK:
 ```
 """
-    stack = LoggedOpenAI(temperature=0.02)(prompt, as_json=True, stop=["```"])
+    stack = llm.complete(prompt, temperature=0.02, as_json=True, stop=["```"])
     logger.info("Tech Stack: %s", stack)
     return stack
 
@@ -77,7 +183,8 @@ Based on the description above, {instructions}
 
 {data_name_display.upper()}{json_extra}:
 """
-    answer = LoggedOpenAI(temperature=temperature)(prompt, as_json=as_json)
+    # answers are specific to the project, so they are never reused for another one
+    answer = llm.complete(prompt, temperature=temperature, as_json=as_json)
     # strip quotes from the ends of the answer
     if isinstance(answer, str):
         answer = answer.strip('"')
@@ -89,7 +196,9 @@ Based on the description above, {instructions}
 def generate_project_description_short():
     """Generate a humorous project description for a small python project."""
     prompt = "Write a very brief and concise idea for a small python project in a single, short sentence. Write as if it's a description of existing software. Do not use the project name in the description. Make it something funny:"
-    description = LoggedOpenAI(temperature=0.8)(prompt).strip()
+    description = llm.complete(
+        prompt, temperature=0.8, reuse_family="project_idea"
+    ).strip()
     logger.info("Yolo Idea: %s", description)
     return description
 
@@ -117,7 +226,7 @@ DESCRIPTION:
 
 RE-WRITTEN DESCRIPTION:
 """
-    rewritten = LoggedOpenAI(temperature=0)(prompt)
+    rewritten = llm.complete(prompt, temperature=0)
     logger.info("Rewritten Description: %s", rewritten)
     return rewritten
 
@@ -225,7 +334,6 @@ def generate_software_feature_list(project_plan):
 
 def generate_project_todo(project_plan):
     """Generate a project to-do list from a project plan."""
-    llm = LoggedOpenAI(temperature=0.02)
     prompt = f"""
 {project_plan.as_markdown()}
 INSTRUCTIONS:
@@ -235,14 +343,13 @@ that will help us complete the software. Write the list as a json list of string
 TODO LIST:
 ```
     """
-    requirements = llm(prompt, as_json=True, stop=["```"])
+    requirements = llm.complete(prompt, temperature=0.02, as_json=True, stop=["```"])
     logger.info("Requirements: %s", requirements)
     return requirements
 
 
 def generate_project_file_structure(project_plan):
     """Generate a project file structure based on a project plan."""
-    llm = LoggedOpenAI(temperature=0.02)
     prompt = f"""
 {project_plan.as_markdown()}
 
@@ -254,7 +361,7 @@ Write project files as a json list of strings.
     
 PROJECT FILES (json list of strings):
 """
-    files = llm(prompt, as_json=True)
+    files = llm.complete(prompt, temperature=0.02, as_json=True)
     files = sorted(list(set(files + REQUIRED_PROJECT_FILES)))
 
     file_text = "\n".join(f" - {file}" for file in files)
@@ -270,7 +377,7 @@ Write the descriptions as a json dictionary where the key is the filepath and th
 
 FILE DESCRIPTIONS (json dictionary):
 """
-    file_descriptions = llm(prompt, as_json=True)
+    file_descriptions = llm.complete(prompt, temperature=0.02, as_json=True)
     structure = {path: file_descriptions.get(path, "") for path in files}
     logger.info("File Structure: %s", structure)
     return structure
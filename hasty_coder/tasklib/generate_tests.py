@@ -0,0 +1,333 @@
+"""
+Write tests for every function in a path, keeping only the tests that pass.
+
+Tests are generated concurrently in threads (the work is waiting on the API) and every candidate is checked in
+a pool of worker processes while other candidates are still being generated:
+
+  - compile it
+  - format it with black
+  - run it with pytest in a subprocess, with a per-test timeout
+
+A candidate that fails is regenerated with the error appended to the prompt, up to `max_attempts` times.
+"""
+import ast
+import logging
+import multiprocessing
+import os.path
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import List
+
+from hasty_coder.filewalk import find_project_root
+from hasty_coder.langlib.python import (
+    CodeSnippet,
+    format_code,
+    get_func_and_class_snippets,
+    get_func_and_class_snippets_in_path,
+    parse_python_file,
+)
+from hasty_coder.langlib.symbol_index import get_symbol_index
+from hasty_coder.tasklib.coverage_targets import select_undercovered_snippets
+from hasty_coder.tasklib.write_tests import write_test_for_snippet
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PER_TEST_TIMEOUT_SECONDS = 10
+DEFAULT_MAX_ATTEMPTS = 3
+
+# loaded into the pytest subprocess so a single hanging test can't stall the pipeline
+TIMEOUT_CONFTEST = """
+import signal
+
+import pytest
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    def on_timeout(signum, frame):
+        raise TimeoutError("test took longer than {timeout} seconds")
+
+    previous = signal.signal(signal.SIGALRM, on_timeout)
+    signal.alarm({timeout})
+    try:
+        yield
+    finally:
+        signal.alarm(0)
+        signal.signal(signal.SIGALRM, previous)
+"""
+
+
+@dataclass
+class ValidationResult:
+    passed: bool
+    test_code: str
+    stage: str = None
+    error: str = ""
+
+
+@dataclass
+class GeneratedTest:
+    snippet: CodeSnippet
+    test_code: str = None
+    passed: bool = False
+    attempts: int = 0
+    errors: List[str] = field(default_factory=list)
+
+
+def validate_test_code(
+    test_code, project_root, per_test_timeout=DEFAULT_PER_TEST_TIMEOUT_SECONDS
+):
+    """Compile, format and run candidate test code. Runs in a worker process."""
+    try:
+        compile(test_code, "test_candidate.py", "exec")
+    except SyntaxError as e:
+        return ValidationResult(False, test_code, stage="compile", error=repr(e))
+    try:
+        test_code = format_code(test_code)
+    except Exception as e:  # pylint: disable=broad-except
+        return ValidationResult(False, test_code, stage="format", error=repr(e))
+
+    with tempfile.TemporaryDirectory(prefix="hasty-coder-test-") as tmp_dir:
+        test_path = os.path.join(tmp_dir, "test_candidate.py")
+        with open(test_path, "w", encoding="utf-8") as f:
+            f.write(test_code)
+        with open(os.path.join(tmp_dir, "conftest.py"), "w", encoding="utf-8") as f:
+            f.write(TIMEOUT_CONFTEST.format(timeout=int(per_test_timeout)))
+        # an empty config so the project's pytest options don't apply to the candidate
+        config_path = os.path.join(tmp_dir, "pytest.ini")
+        with open(config_path, "w", encoding="utf-8") as f:
+            f.write("[pytest]\n")
+
+        # ahead of any paths the project already needs
+        python_path = os.pathsep.join(
+            p for p in (project_root, os.environ.get("PYTHONPATH")) if p
+        )
+        env = {**os.environ, "PYTHONPATH": python_path, "PYTHONDONTWRITEBYTECODE": "1"}
+        command = [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider"]
+        command += ["-c", config_path, "--rootdir", tmp_dir]
+        try:
+            collect = subprocess.run(
+                command + ["--collect-only", test_path],
+                cwd=project_root,
+                env=env,
+                capture_output=True,
+                text=True,
+                timeout=60,
+                check=False,
+            )
+            if collect.returncode != 0:
+                return ValidationResult(
+                    False, test_code, stage="collect", error=collect.stdout[-4000:]
+                )
+            test_count = collect.stdout.count("::")
+            run = subprocess.run(
+                command + ["-x", test_path],
+                cwd=project_root,
+                env=env,
+                capture_output=True,
+                text=True,
+                timeout=30 + per_test_timeout * max(test_count, 1),
+                check=False,
+            )
+        except subprocess.TimeoutExpired as e:
+            return ValidationResult(False, test_code, stage="run", error=repr(e))
+    if run.returncode != 0:
+        return ValidationResult(False, test_code, stage="run", error=run.stdout[-4000:])
+    return ValidationResult(True, test_code)
+
+
+def is_function_snippet(snippet):
+    """Return True for snippets of public functions and methods."""
+    try:
+        node = snippet.ast_tree.body[0]
+    except (SyntaxError, IndexError):
+        return False
+    return isinstance(
+        node, (ast.FunctionDef, ast.AsyncFunctionDef)
+    ) and not node.name.startswith("_")
+
+
+def generate_tests_for_snippets(
+    snippets,
+    project_root,
+    symbol_index=None,
+    max_generation_workers=4,
+    max_validation_workers=2,
+    max_attempts=DEFAULT_MAX_ATTEMPTS,
+    per_test_timeout=DEFAULT_PER_TEST_TIMEOUT_SECONDS,
+):
+    """
+    Generate and validate tests for snippets. Yields a `GeneratedTest` for each snippet as it finishes.
+
+    Generation and validation run at the same time: a snippet's candidate is validated while the next
+    snippets are being generated. If a validator process dies, the validations it took down are recorded as
+    errors and a new pool of validators takes the rest.
+    """
+
+    def new_validators():
+        # spawn rather than fork since the generator threads are already running
+        return ProcessPoolExecutor(
+            max_workers=max_validation_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    validators = new_validators()
+    # future -> (kind, GeneratedTest)
+    pending = {}
+
+    def validate(result, test_code):
+        nonlocal validators
+        args = (validate_test_code, test_code, project_root, per_test_timeout)
+        try:
+            future = validators.submit(*args)
+        except BrokenProcessPool:
+            validators.shutdown(wait=False)
+            validators = new_validators()
+            future = validators.submit(*args)
+        pending[future] = ("validate", result)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_generation_workers) as generators:
+
+            def generate(result, failed_attempt=None):
+                result.attempts += 1
+                future = generators.submit(
+                    write_test_for_snippet, result.snippet, symbol_index, failed_attempt
+                )
+                pending[future] = ("generate", result)
+
+            for snippet in snippets:
+                generate(GeneratedTest(snippet=snippet))
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, result = pending.pop(future)
+                    if kind == "generate":
+                        try:
+                            test_code = future.result()
+                        except Exception as e:  # pylint: disable=broad-except
+                            logger.warning("Failed to generate tests: %r", e)
+                            result.errors.append(repr(e))
+                            yield result
+                            continue
+                        validate(result, test_code)
+                        continue
+
+                    try:
+                        validation = future.result()
+                    except BrokenProcessPool as e:
+                        logger.warning("Validator crashed: %r", e)
+                        result.errors.append(f"validation crashed: {e!r}")
+                        yield result
+                        continue
+                    result.test_code = validation.test_code
+                    if validation.passed:
+                        result.passed = True
+                        yield result
+                        continue
+                    error = f"{validation.stage} failed:\n{validation.error}"
+                    result.errors.append(error)
+                    if result.attempts >= max_attempts:
+                        yield result
+                        continue
+                    generate(result, failed_attempt=(validation.test_code, error))
+    finally:
+        validators.shutdown()
+
+
+def output_filename_for_snippet(snippet, project_root):
+    """
+    Return the name of the test file for a function snippet.
+
+    The name holds the module's path in the project and the function's qualified name, joined by double
+    underscores, so same-named modules in different packages and same-named methods of different classes get
+    different files. Like `test_shop__cart__Cart__add.py`.
+    """
+    module_path = os.path.splitext(os.path.relpath(snippet.filepath, project_root))[0]
+    parts = [part for part in module_path.split(os.sep) if part not in ("", ".")]
+    parts.extend(snippet_qualname(snippet).split("."))
+    return f"test_{'__'.join(parts)}.py"
+
+
+def snippet_qualname(snippet):
+    """Return the qualified name (like `Cart.add`) of the function a snippet holds."""
+    function_name = snippet.ast_tree.body[0].name
+    try:
+        _, tree = parse_python_file(snippet.filepath)
+    except (OSError, SyntaxError, ValueError):
+        return function_name
+
+    def find(node, parents):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                start_line = min(
+                    [child.lineno] + [d.lineno for d in child.decorator_list]
+                )
+                if child.name == function_name and start_line == snippet.start_line:
+                    return ".".join(parents + [child.name])
+                found = find(child, parents + [child.name])
+            else:
+                found = find(child, parents)
+            if found:
+                return found
+        return None
+
+    return find(tree, []) or function_name
+
+
+def write_tests_for_path(path, output_dir=None, coverage_threshold=None, **kwargs):
+    """
+    Write passing tests for the public functions in path into output_dir.
+
+    With a `coverage_threshold` only functions the existing tests cover less than that fraction of are
+    targeted, most uncovered first. Returns the list of `GeneratedTest` results.
+    """
+    path = os.path.abspath(path)
+    project_root = find_project_root(path) or (
+        path if os.path.isdir(path) else os.path.dirname(path)
+    )
+    output_dir = output_dir or os.path.join(project_root, "tests", "generated")
+    if os.path.isdir(path):
+        snippets = get_func_and_class_snippets_in_path(path)
+    else:
+        source, tree = parse_python_file(path)
+        snippets = get_func_and_class_snippets(source, filepath=path, tree=tree)
+    snippets = [s for s in snippets if is_function_snippet(s)]
+    if coverage_threshold is not None:
+        snippets = select_undercovered_snippets(
+            snippets, project_root, threshold=coverage_threshold
+        )
+    logger.info("Writing tests for %d functions", len(snippets))
+
+    symbol_index = get_symbol_index(project_root)
+    results = []
+    for result in generate_tests_for_snippets(
+        snippets, project_root, symbol_index=symbol_index, **kwargs
+    ):
+        results.append(result)
+        if not result.passed:
+            logger.warning(
+                "Couldn't write passing tests for %s:%s after %d attempts",
+                result.snippet.filepath,
+                result.snippet.start_line,
+                result.attempts,
+            )
+            continue
+        os.makedirs(output_dir, exist_ok=True)
+        test_path = os.path.join(
+            output_dir, output_filename_for_snippet(result.snippet, project_root)
+        )
+        with open(test_path, "w", encoding="utf-8") as f:
+            f.write(result.test_code)
+        logger.info("Wrote %s", test_path)
+    return results
@@ -1,50 +1,308 @@
+import ast
+import logging
 import os.path
 import pathlib
+from concurrent.futures import Future, wait
 from datetime import datetime
 
+from hasty_coder.langlib.python import get_top_level_signatures
 from hasty_coder.models import SoftwareProjectPlan
-from hasty_coder.tasklib.filegen import generate_file_contents
-from hasty_coder.utils import parallel_run, slugify
+from hasty_coder.tasklib.file_scheduler import (
+    infer_file_dependencies,
+    job_filepaths,
+    run_scheduled,
+)
+from hasty_coder.tasklib.filegen import (
+    generate_file_batch_contents,
+    generate_file_contents,
+    group_small_files,
+    render_local_file,
+)
+from hasty_coder.tasklib.project_journal import ProjectJournal
+from hasty_coder.tasklib.validate_files import FileValidator
+from hasty_coder.utils import slugify
 
+logger = logging.getLogger(__name__)
 
-def implement_project_plan(project_plan: SoftwareProjectPlan, projects_path):
-    """Implement a software project plan by creating a project skeleton and generating file contents."""
+MAX_REGENERATIONS = 2
+MAX_ERROR_CHARS = 2000
+
+
+def implement_project_plan(
+    project_plan: SoftwareProjectPlan, projects_path, dependencies=None, llm_files=()
+):
+    """
+    Implement a software project plan by creating a project skeleton and generating file contents.
+
+    Files are generated longest first. `dependencies` maps a filepath to the filepaths that must be written
+    before it; by default tests wait for the modules they are named after. Boilerplate files are rendered from
+    templates unless their filename is in `llm_files`. Progress is journaled in the project folder so the run
+    can be finished with `resume_project`.
+    """
     project_folder_name = slugify(project_plan.software_name)
     project_path = create_project_skeleton(
         project_path=os.path.join(projects_path, project_folder_name),
         filepaths=project_plan.project_files.keys(),
     )
-    files_only_filepaths = [
+    journal = ProjectJournal.create(
+        project_path, project_plan, files_only_filepaths(project_plan)
+    )
+    generate_project_files(
+        journal, journal.unfinished_filepaths(), dependencies, llm_files
+    )
+    return project_path
+
+
+def resume_project(project_path, dependencies=None, llm_files=()):
+    """Finish an interrupted `implement_project_plan` run, generating only the files that aren't done."""
+    journal = ProjectJournal.load(project_path)
+    create_project_skeleton(
+        project_path, journal.project_plan.project_files.keys(), resume=True
+    )
+    filepaths = journal.unfinished_filepaths()
+    logger.info(
+        "Resuming %s: %d of %d files left",
+        project_path,
+        len(filepaths),
+        len(journal.files),
+    )
+    generate_project_files(journal, filepaths, dependencies, llm_files)
+    return journal
+
+
+def files_only_filepaths(project_plan):
+    return [
         filepath
         for filepath in project_plan.project_files.keys()
         if not filepath.endswith("/")
     ]
 
-    def gen_and_save(filepath):
-        """Save generated file contents to filepath"""
-        file_contents = generate_file_contents(filepath, project_plan)
-        if file_contents:
-            with open(os.path.join(project_path, filepath), "w", encoding="utf-8") as f:
-                f.write(file_contents)
 
-    parallel_run(gen_and_save, files_only_filepaths)
+def generate_project_files(
+    journal,
+    filepaths,
+    dependencies=None,
+    llm_files=(),
+    max_regenerations=MAX_REGENERATIONS,
+):
+    """
+    Generate and save files of a journaled project, recording each one's progress.
 
-    return project_path
+    Generated files are written as soon as they arrive and checked and formatted in worker processes while
+    the rest are generated. Files that fail the checks are generated again with the error in the prompt.
+    """
+    project_plan = journal.project_plan
+    project_path = journal.project_path
+    if dependencies is None:
+        dependencies = infer_file_dependencies(files_only_filepaths(project_plan))
+    # filepath -> why its last version failed validation
+    failures = {}
+    validations = []
+
+    with FileValidator() as validator:
+
+        def handle_validation(filepath, future):
+            """Write the formatted file if it passed, or remember why it failed."""
+            try:
+                validation = future.result()
+            except Exception as e:  # pylint: disable=broad-except
+                failure = f"validation crashed: {e!r}"
+            else:
+                if validation.passed:
+                    write_project_file(project_path, filepath, validation.contents)
+                    journal.mark_done(filepath, validation.contents)
+                    return
+                failure = f"{validation.stage} failed:\n{validation.error}"
+            failures[filepath] = failure
+            logger.warning("%s %s", filepath, failure)
+            journal.mark_failed(filepath, failure)
+
+        def save_and_validate(filepath, file_contents):
+            """Write a file now and its formatted version once it passes validation."""
+            write_project_file(project_path, filepath, file_contents)
+            if not file_contents:
+                journal.mark_done(filepath, file_contents)
+                return
+
+            # resolved once the result is handled. Waiting on the validation itself could return before its
+            # callbacks have run.
+            handled = Future()
+
+            def on_validated(future):
+                try:
+                    handle_validation(filepath, future)
+                finally:
+                    handled.set_result(None)
+
+            validations.append(handled)
+            validator.submit(filepath, file_contents).add_done_callback(on_validated)
+
+        def gen_and_save(filepath):
+            """Save generated file contents to filepath"""
+            journal.mark_in_flight(filepath)
+            try:
+                context = written_signatures_context(
+                    project_path, dependencies.get(filepath, [])
+                )
+                failure = failures.pop(filepath, None)
+                if failure:
+                    context += f"\nTHE LAST VERSION OF {filepath} FAILED VALIDATION:\n{failure[-MAX_ERROR_CHARS:]}\n"
+                file_contents = generate_file_contents(
+                    filepath,
+                    project_plan,
+                    context=context,
+                    llm_files=llm_files,
+                    format_python=False,
+                )
+            except Exception as e:
+                journal.mark_failed(filepath, e)
+                raise
+            save_and_validate(filepath, file_contents)
+
+        def gen_batch_and_save(batch):
+            """Save the contents of a batch of small files, generating any it missed one at a time."""
+            for filepath in batch:
+                journal.mark_in_flight(filepath)
+            try:
+                contents_by_filepath = generate_file_batch_contents(batch, project_plan)
+            except Exception as e:  # pylint: disable=broad-except
+                logger.warning("Batch of %d files failed: %r", len(batch), e)
+                contents_by_filepath = {}
+            for filepath in batch:
+                if filepath in contents_by_filepath:
+                    save_and_validate(filepath, contents_by_filepath[filepath])
+                else:
+                    gen_and_save(filepath)
+
+        def gen_job(job):
+            if isinstance(job, tuple):
+                gen_batch_and_save(job)
+            else:
+                gen_and_save(job)
+
+        try:
+            filepaths = render_local_files(journal, filepaths, llm_files)
+            timings = run_scheduled(
+                gen_job,
+                small_file_jobs(project_plan, filepaths, dependencies),
+                dependencies=dependencies,
+            )
+            wait(validations)
+            for _ in range(max_regenerations):
+                if not failures:
+                    break
+                logger.info(
+                    "Regenerating %d files that failed validation", len(failures)
+                )
+                timings.update(
+                    run_scheduled(
+                        gen_and_save,
+                        {fp: project_plan.project_files[fp] for fp in failures},
+                        dependencies=dependencies,
+                    )
+                )
+                wait(validations)
+        except BaseException:
+            logger.error(
+                "Project unfinished. Run `hc project --resume %s` to finish it.",
+                project_path,
+            )
+            raise
+    for job, seconds in sorted(timings.items(), key=lambda t: -t[1]):
+        logger.info("Generated %s in %.1fs", ", ".join(job_filepaths(job)), seconds)
+    if failures:
+        logger.warning(
+            "%s still fail validation. Run `hc project --resume %s` to try them again.",
+            ", ".join(sorted(failures)),
+            project_path,
+        )
 
 
-def create_project_skeleton(project_path, filepaths):
-    """Create a project skeleton with the given filepaths under the given project path."""
+def write_project_file(project_path, filepath, file_contents):
+    if file_contents:
+        with open(os.path.join(project_path, filepath), "w", encoding="utf-8") as f:
+            f.write(file_contents)
+
+
+def render_local_files(journal, filepaths, llm_files=()):
+    """Write the files that have templates. Returns the files left for the LLM."""
+    remaining = []
+    for filepath in filepaths:
+        file_contents = render_local_file(
+            filepath, journal.project_plan, llm_files=llm_files
+        )
+        if file_contents is None:
+            remaining.append(filepath)
+            continue
+        write_project_file(journal.project_path, filepath, file_contents)
+        journal.mark_done(filepath, file_contents)
+    return remaining
+
+
+def small_file_jobs(project_plan, filepaths, dependencies):
+    """
+    Return `run_scheduled` jobs for files, with the small ones grouped into batches written by one completion.
+
+    A batch is a tuple of filepaths with a tuple of their descriptions.
+    """
+    # files that need context from other files are written on their own
+    batches, _ = group_small_files(
+        [fp for fp in filepaths if not dependencies.get(fp)], project_plan
+    )
+    batched = {filepath for batch in batches for filepath in batch}
+    jobs = {
+        tuple(batch): tuple(project_plan.project_files[fp] for fp in batch)
+        for batch in batches
+    }
+    jobs.update(
+        {
+            filepath: project_plan.project_files[filepath]
+            for filepath in filepaths
+            if filepath not in batched
+        }
+    )
+    if batches:
+        logger.info(
+            "Writing %d small files in %d completions", len(batched), len(batches)
+        )
+    return jobs
+
+
+def written_signatures_context(project_path, filepaths):
+    """Return the signatures of already written python files, formatted for a prompt."""
+    sections = []
+    for filepath in filepaths:
+        if not filepath.endswith(".py"):
+            continue
+        try:
+            with open(os.path.join(project_path, filepath), encoding="utf-8") as f:
+                tree = ast.parse(f.read())
+        except (OSError, SyntaxError, ValueError):
+            continue
+        signatures = get_top_level_signatures(tree)
+        if signatures:
+            sections.append(f"{filepath} defines:\n" + "\n".join(signatures))
+    if not sections:
+        return ""
+    return "\nSIGNATURES OF FILES ALREADY WRITTEN\n" + "\n\n".join(sections) + "\n"
+
+
+def create_project_skeleton(project_path, filepaths, resume=False):
+    """
+    Create a project skeleton with the given filepaths under the given project path.
+
+    With `resume` missing files and folders are added to an existing project instead of starting a new one.
+    """
     # make sure all the paths will be created under the base path
     base_path = os.path.abspath(project_path)
-    # if base_path already exists append a timestamp to the path
-    if os.path.exists(base_path):
-        base_path = f"{base_path}-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-
-    filepaths = [os.path.join(base_path, filepath) for filepath in filepaths]
-    abs_filepaths = [os.path.abspath(filepath) for filepath in filepaths]
-    for filepath in abs_filepaths:
+    for filepath in filepaths:
+        filepath = os.path.abspath(os.path.join(base_path, filepath))
         if os.path.commonpath([base_path, filepath]) != base_path:
             raise ValueError(f"Filepath {filepath} is not under base path {base_path}")
+    if not resume:
+        base_path = claim_new_folder(base_path)
+
+    filepaths = [os.path.join(base_path, filepath) for filepath in filepaths]
 
     for filepath in filepaths:
         full_path = pathlib.Path(os.path.join(base_path, filepath))
@@ -52,3 +310,21 @@ def create_project_skeleton(project_path, filepaths):
         if not filepath.endswith("/"):
             full_path.touch()
     return base_path
+
+
+def claim_new_folder(path):
+    """
+    Create a new folder at path and return it.
+
+    If path already exists a timestamp is appended, then a counter. Creating the folder is what claims the
+    name, so projects started at the same time with the same name get different folders.
+    """
+    candidate = path
+    timestamped = f"{path}-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    for attempt in range(1000):
+        try:
+            os.makedirs(candidate)
+            return candidate
+        except FileExistsError:
+            candidate = timestamped if attempt == 0 else f"{timestamped}-{attempt + 1}"
+    raise FileExistsError(f"Couldn't find a free folder name for {path}")
@@ -0,0 +1,119 @@
+"""
+A journal of an `hc project` run, kept in the project folder so a run that dies can be resumed.
+
+The journal holds the project plan and the state of every file: pending, in-flight, done (with a hash of what
+was written) or failed (with the error). It is rewritten atomically on every change, so whatever kills the run,
+the journal on disk describes what was finished. A resumed run reuses the plan and only generates the files that
+aren't done or whose done contents went missing.
+"""
+import hashlib
+import logging
+import os.path
+import tempfile
+import threading
+
+import orjson
+
+from hasty_coder.models import SoftwareProjectPlan
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_FILENAME = ".hasty-coder-journal.json"
+JOURNAL_VERSION = 1
+
+PENDING = "pending"
+IN_FLIGHT = "in-flight"
+DONE = "done"
+FAILED = "failed"
+
+
+class JournalNotFound(Exception):
+    """The folder has no journal to resume from."""
+
+
+def content_hash(contents):
+    return hashlib.blake2b(contents.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class ProjectJournal:
+    """The plan and per-file progress of a project run."""
+
+    def __init__(self, project_path, project_plan, files=None):
+        self.project_path = project_path
+        self.project_plan = project_plan
+        # filepath -> {"state": ..., "hash": ..., "error": ...}
+        self.files = files or {}
+        self._lock = threading.Lock()
+
+    @property
+    def journal_path(self):
+        return os.path.join(self.project_path, JOURNAL_FILENAME)
+
+    @classmethod
+    def create(cls, project_path, project_plan, filepaths):
+        """Start a journal for a new run with every file pending."""
+        journal = cls(
+            project_path,
+            project_plan,
+            files={filepath: {"state": PENDING} for filepath in filepaths},
+        )
+        journal.save()
+        return journal
+
+    @classmethod
+    def load(cls, project_path):
+        journal_path = os.path.join(project_path, JOURNAL_FILENAME)
+        try:
+            with open(journal_path, "rb") as f:
+                data = orjson.loads(f.read())
+        except FileNotFoundError as e:
+            raise JournalNotFound(f"No {JOURNAL_FILENAME} in {project_path}") from e
+        if data.get("version") != JOURNAL_VERSION:
+            raise JournalNotFound(f"{journal_path} is from another version")
+        return cls(
+            project_path,
+            SoftwareProjectPlan.from_dict(data["plan"]),
+            files=data["files"],
+        )
+
+    def unfinished_filepaths(self):
+        """
+        Return the files a resumed run has to generate.
+
+        Files that were in flight when the run died are generated again. A done file is kept, even if it was
+        edited since, unless it is missing.
+        """
+        unfinished = []
+        for filepath, entry in self.files.items():
+            if entry["state"] == DONE:
+                if os.path.exists(os.path.join(self.project_path, filepath)):
+                    continue
+                logger.info("%s was done but is missing", filepath)
+            unfinished.append(filepath)
+        return unfinished
+
+    def mark_in_flight(self, filepath):
+        self._update(filepath, {"state": IN_FLIGHT})
+
+    def mark_done(self, filepath, contents):
+        self._update(filepath, {"state": DONE, "hash": content_hash(contents or "")})
+
+    def mark_failed(self, filepath, error):
+        self._update(filepath, {"state": FAILED, "error": repr(error)})
+
+    def _update(self, filepath, entry):
+        with self._lock:
+            self.files[filepath] = entry
+            self.save()
+
+    def save(self):
+        data = {
+            "version": JOURNAL_VERSION,
+            "plan": self.project_plan.to_dict(),
+            "files": self.files,
+        }
+        with tempfile.NamedTemporaryFile(
+            mode="wb", dir=self.project_path, delete=False
+        ) as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        os.replace(f.name, self.journal_path)
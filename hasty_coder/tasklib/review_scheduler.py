@@ -0,0 +1,233 @@
+"""
+Prioritize code review by cheap local risk signals and stop at a budget.
+
+Snippets are ranked before any tokens are spent using:
+  - cyclomatic complexity
+  - size in lines
+  - nesting depth
+  - git churn and recency
+  - missing docstrings
+
+They are then reviewed riskiest-first within the token, time or cost budget. A snippet too big for what is left
+of the budget is skipped and smaller ones after it are still reviewed.
+"""
+import logging
+import math
+import os.path
+import time
+from dataclasses import dataclass, field
+from typing import List
+
+from hasty_coder import llm
+from hasty_coder.explore_project import get_git_file_churn
+from hasty_coder.filewalk import get_nonignored_file_paths
+from hasty_coder.langlib.python import (
+    CodeSnippet,
+    cyclomatic_complexity,
+    get_func_and_class_snippets,
+    max_nesting_depth,
+    parse_python_file,
+)
+from hasty_coder.tasklib.code_review import review_deduplicator, review_snippet
+from hasty_coder.utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+SIGNAL_WEIGHTS = {
+    "complexity": 1.0,
+    "size": 0.6,
+    "nesting_depth": 0.8,
+    "churn": 0.7,
+    "recency": 0.5,
+    "missing_docstring": 0.4,
+}
+
+# tokens used by the review prompt and the validation prompt excluding the code itself
+REVIEW_PROMPT_OVERHEAD_TOKENS = 300
+
+
+@dataclass
+class SnippetRisk:
+    snippet: CodeSnippet
+    complexity: int = 1
+    size: int = 0
+    nesting_depth: int = 0
+    churn: int = 0
+    days_since_change: float = None
+    missing_docstring: bool = False
+
+    @property
+    def score(self):
+        """Combine the risk signals into a single number. Higher is riskier."""
+        recency = 0.0
+        if self.days_since_change is not None:
+            recency = 1 / (1 + self.days_since_change / 30)
+        signals = {
+            "complexity": math.log2(self.complexity + 1),
+            "size": math.log2(self.size + 1),
+            "nesting_depth": self.nesting_depth,
+            "churn": math.log2(self.churn + 1),
+            "recency": recency,
+            "missing_docstring": float(self.missing_docstring),
+        }
+        return sum(SIGNAL_WEIGHTS[name] * value for name, value in signals.items())
+
+    @property
+    def estimated_tokens(self):
+        """Estimate the tokens a review will use: two prompts that each contain and echo the code."""
+        code_tokens = estimate_tokens(self.snippet.code_text)
+        return 2 * (REVIEW_PROMPT_OVERHEAD_TOKENS + 2 * code_tokens)
+
+
+@dataclass
+class ReviewBudget:
+    max_tokens: int = None
+    max_seconds: float = None
+    max_cost: float = None
+    cost_per_1k_tokens: float = 0.02
+
+    def cost_of(self, tokens):
+        return tokens / 1000 * self.cost_per_1k_tokens
+
+    def exceeded_by(self, tokens_spent, seconds_elapsed, next_tokens=0):
+        """Return the name of the limit that would be exceeded, or None."""
+        tokens = tokens_spent + next_tokens
+        if self.max_tokens is not None and tokens > self.max_tokens:
+            return "tokens"
+        if self.max_cost is not None and self.cost_of(tokens) > self.max_cost:
+            return "cost"
+        if self.max_seconds is not None and seconds_elapsed >= self.max_seconds:
+            return "time"
+        return None
+
+
+@dataclass
+class ReviewCoverage:
+    snippets_total: int = 0
+    snippets_reviewed: int = 0
+    lines_total: int = 0
+    lines_reviewed: int = 0
+    tokens_spent: int = 0
+    cost: float = 0.0
+    seconds_elapsed: float = 0.0
+    stopped_by: str = None
+    skipped: List[SnippetRisk] = field(default_factory=list)
+
+    @property
+    def snippet_coverage(self):
+        return (
+            self.snippets_reviewed / self.snippets_total if self.snippets_total else 1.0
+        )
+
+    @property
+    def line_coverage(self):
+        return self.lines_reviewed / self.lines_total if self.lines_total else 1.0
+
+    def summary(self):
+        """Return a short human readable summary of what was reviewed."""
+        stopped = f" Stopped by {self.stopped_by} budget." if self.stopped_by else ""
+        return (
+            f"Reviewed {self.snippets_reviewed}/{self.snippets_total} snippets "
+            f"({self.snippet_coverage:.0%}), {self.lines_reviewed}/{self.lines_total} lines "
+            f"({self.line_coverage:.0%}) using {self.tokens_spent} tokens "
+            f"(${self.cost:.2f}) in {self.seconds_elapsed:.1f}s.{stopped}"
+        )
+
+
+def measure_snippet_risk(snippet: CodeSnippet, churn=None, now=None):
+    """Compute the local risk signals of a snippet."""
+    churn = churn or {}
+    now = now or time.time()
+    tree = snippet.ast_tree
+    commit_count, last_timestamp = churn.get(
+        os.path.abspath(snippet.filepath or ""), (0, None)
+    )
+    days_since_change = None
+    if last_timestamp:
+        days_since_change = max(0.0, (now - last_timestamp) / 86400)
+    return SnippetRisk(
+        snippet=snippet,
+        complexity=cyclomatic_complexity(tree),
+        size=snippet.end_line - snippet.start_line + 1,
+        nesting_depth=max_nesting_depth(tree),
+        churn=commit_count,
+        days_since_change=days_since_change,
+        missing_docstring=not snippet.docstring,
+    )
+
+
+def rank_snippets_in_path(path):
+    """Return the snippets in a path ordered from riskiest to safest."""
+    path = os.path.abspath(path)
+    if os.path.isfile(path):
+        file_paths = [path]
+    else:
+        file_paths = [
+            os.path.join(path, p)
+            for p in get_nonignored_file_paths(path)
+            if p.endswith(".py")
+        ]
+    churn = get_git_file_churn(path)
+    now = time.time()
+    risks = []
+    for file_path in file_paths:
+        try:
+            code_text, tree = parse_python_file(file_path)
+        except SyntaxError:
+            logger.warning("Skipping %s, could not parse it", file_path)
+            continue
+        snippets = get_func_and_class_snippets(code_text, filepath=file_path, tree=tree)
+        risks.extend(measure_snippet_risk(s, churn=churn, now=now) for s in snippets)
+    risks.sort(key=lambda r: r.score, reverse=True)
+    return risks
+
+
+def review_path_prioritized(path, budget=None, coverage=None):
+    """
+    Review the riskiest snippets in a path first, skipping those that don't fit in what is left of the budget.
+
+    Yields `(snippet, comments)` like `review_path`. Pass in a `ReviewCoverage` to get a report of how much was
+    reviewed.
+    """
+    budget = budget or ReviewBudget()
+    coverage = coverage if coverage is not None else ReviewCoverage()
+    ranked = rank_snippets_in_path(path)
+    coverage.snippets_total = len(ranked)
+    coverage.lines_total = sum(r.size for r in ranked)
+
+    # group duplicates before scheduling, so reviewing a copy of a reviewed snippet costs nothing
+    deduplicator = review_deduplicator()
+    group_keys = [deduplicator.representative(r.snippet.code_text)[0] for r in ranked]
+    reviewed_groups = set()
+    started_at = time.perf_counter()
+    starting_tokens = llm.token_usage.total_tokens
+    for i, risk in enumerate(ranked):
+        tokens_spent = llm.token_usage.total_tokens - starting_tokens
+        seconds_elapsed = time.perf_counter() - started_at
+        next_tokens = 0 if group_keys[i] in reviewed_groups else risk.estimated_tokens
+        exceeded = budget.exceeded_by(
+            tokens_spent, seconds_elapsed, next_tokens=next_tokens
+        )
+        if exceeded == "time" or (
+            exceeded and budget.exceeded_by(tokens_spent, seconds_elapsed)
+        ):
+            # nothing more can be reviewed
+            coverage.stopped_by = exceeded
+            coverage.skipped.extend(ranked[i:])
+            break
+        if exceeded:
+            # a smaller snippet further down may still fit
+            coverage.stopped_by = exceeded
+            coverage.skipped.append(risk)
+            continue
+        reviewed_groups.add(group_keys[i])
+        snippet = risk.snippet
+        comments = deduplicator.run(snippet.code_text, review_snippet)
+        comments = [(line_num + snippet.start_line, c) for line_num, c in comments]
+        coverage.snippets_reviewed += 1
+        coverage.lines_reviewed += risk.size
+        yield snippet, comments
+
+    coverage.tokens_spent = llm.token_usage.total_tokens - starting_tokens
+    coverage.cost = budget.cost_of(coverage.tokens_spent)
+    coverage.seconds_elapsed = time.perf_counter() - started_at
@@ -0,0 +1,253 @@
+"""
+Check and format generated files in worker processes.
+
+Formatting with black holds the GIL, so doing it in the generator threads stalls the network-bound work. Here
+every generated file is sent to a process pool instead, which:
+
+  - compiles python, formats it with black and lints it with pyflakes (if installed) for undefined names
+  - parses json, toml and yaml, and syntax checks javascript with `node --check` and shell scripts with `bash -n`
+
+Results are cached in the temp dir by a hash of the file's contents and the versions of the tools that checked
+it, so the same output is never checked twice but upgrading black or pyflakes checks it again. The cache keeps
+the `MAX_CACHED_VALIDATIONS` most recently used results.
+"""
+import hashlib
+import json
+import logging
+import multiprocessing
+import os.path
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from importlib import metadata
+
+import orjson
+
+from hasty_coder.langlib.python import format_code
+
+logger = logging.getLogger(__name__)
+
+VALIDATOR_VERSION = 1
+SUBPROCESS_CHECK_TIMEOUT_SECONDS = 30
+MAX_CACHED_VALIDATIONS = 5000
+
+# extension -> command that syntax checks the file at the end of it
+SUBPROCESS_CHECKS = {
+    ".js": ["node", "--check"],
+    ".mjs": ["node", "--check"],
+    ".cjs": ["node", "--check"],
+    ".sh": ["bash", "-n"],
+}
+
+
+@dataclass
+class FileValidation:
+    passed: bool
+    contents: str
+    stage: str = None
+    error: str = ""
+
+
+def get_cache_dir():
+    return os.path.join(tempfile.gettempdir(), "hasty-coder/validated/")
+
+
+@lru_cache(maxsize=None)
+def _tool_versions(extension):
+    """Return the versions of the tools that check files with an extension, or "missing" for those not installed."""
+    versions = []
+    if extension == ".py":
+        for package in ("black", "pyflakes"):
+            try:
+                versions.append(f"{package}=={metadata.version(package)}")
+            except metadata.PackageNotFoundError:
+                versions.append(f"{package} missing")
+    elif extension in SUBPROCESS_CHECKS:
+        # without the tool files pass unchecked
+        command = SUBPROCESS_CHECKS[extension][0]
+        versions.append(command if shutil.which(command) else f"{command} missing")
+    return " ".join(versions)
+
+
+def validation_cache_key(filepath, contents):
+    extension = os.path.splitext(str(filepath))[1].lower()
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (
+        str(VALIDATOR_VERSION),
+        extension,
+        _tool_versions(extension),
+        contents,
+    ):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def validate_file(filepath, contents):
+    """Check and format a file's contents. Runs in a worker process."""
+    extension = os.path.splitext(str(filepath))[1].lower()
+    if extension == ".py":
+        return _validate_python(filepath, contents)
+    try:
+        if extension == ".json":
+            json.loads(contents)
+        elif extension == ".toml":
+            try:
+                import tomllib  # pylint: disable=import-outside-toplevel
+            except ImportError:
+                return FileValidation(True, contents)
+            tomllib.loads(contents)
+        elif extension in (".yml", ".yaml"):
+            try:
+                import yaml  # pylint: disable=import-outside-toplevel
+            except ImportError:
+                return FileValidation(True, contents)
+            yaml.safe_load(contents)
+    except Exception as e:  # pylint: disable=broad-except
+        return FileValidation(False, contents, stage="parse", error=repr(e))
+    if extension in SUBPROCESS_CHECKS:
+        return _check_with_subprocess(filepath, contents, SUBPROCESS_CHECKS[extension])
+    return FileValidation(True, contents)
+
+
+def _validate_python(filepath, contents):
+    try:
+        compile(contents, str(filepath), "exec")
+    except (SyntaxError, ValueError) as e:
+        return FileValidation(False, contents, stage="compile", error=repr(e))
+    try:
+        contents = format_code(contents)
+    except Exception as e:  # pylint: disable=broad-except
+        return FileValidation(False, contents, stage="format", error=repr(e))
+    undefined_names = _undefined_names(filepath, contents)
+    if undefined_names:
+        return FileValidation(
+            False, contents, stage="lint", error="\n".join(undefined_names)
+        )
+    return FileValidation(True, contents)
+
+
+def _undefined_names(filepath, contents):
+    """Return pyflakes' undefined name messages, or nothing if pyflakes isn't installed."""
+    try:
+        # pylint: disable=import-outside-toplevel
+        from pyflakes.api import check
+        from pyflakes.messages import UndefinedName
+        from pyflakes.reporter import Reporter
+    except ImportError:
+        return []
+
+    class CollectingReporter(Reporter):
+        def __init__(self):
+            super().__init__(None, None)
+            self.messages = []
+
+        def flake(self, message):
+            if isinstance(message, UndefinedName):
+                self.messages.append(str(message))
+
+    reporter = CollectingReporter()
+    check(contents, str(filepath), reporter)
+    return reporter.messages
+
+
+def _check_with_subprocess(filepath, contents, command):
+    if shutil.which(command[0]) is None:
+        return FileValidation(True, contents)
+    extension = os.path.splitext(str(filepath))[1]
+    with tempfile.NamedTemporaryFile(
+        mode="w", suffix=extension, encoding="utf-8", delete=False
+    ) as f:
+        f.write(contents)
+    try:
+        check = subprocess.run(
+            command + [f.name],
+            capture_output=True,
+            text=True,
+            timeout=SUBPROCESS_CHECK_TIMEOUT_SECONDS,
+            check=False,
+        )
+    except subprocess.TimeoutExpired:
+        return FileValidation(True, contents)
+    finally:
+        os.unlink(f.name)
+    if check.returncode != 0:
+        error = (check.stderr or check.stdout).replace(f.name, str(filepath))
+        return FileValidation(False, contents, stage="parse", error=error[-4000:])
+    return FileValidation(True, contents)
+
+
+class FileValidator:
+    """A pool of worker processes validating files, with results cached by content."""
+
+    def __init__(self, max_workers=2):
+        # spawn rather than fork since generator threads are already running
+        self._pool = ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        _evict_cached()
+
+    def submit(self, filepath, contents):
+        """Validate a file in the pool. Returns a future of its `FileValidation`."""
+        cache_key = validation_cache_key(filepath, contents)
+        cached = _load_cached(cache_key)
+        if cached is not None:
+            future = Future()
+            future.set_result(cached)
+            return future
+        future = self._pool.submit(validate_file, str(filepath), contents)
+        future.add_done_callback(lambda f: _save_cached(cache_key, f))
+        return future
+
+
+def _load_cached(cache_key):
+    path = os.path.join(get_cache_dir(), cache_key + ".json")
+    try:
+        with open(path, "rb") as f:
+            validation = FileValidation(**orjson.loads(f.read()))
+        # mark it as recently used so eviction keeps it
+        os.utime(path)
+    except (OSError, orjson.JSONDecodeError, TypeError):
+        return None
+    return validation
+
+
+def _save_cached(cache_key, future):
+    if future.cancelled() or future.exception() is not None:
+        return
+    os.makedirs(get_cache_dir(), exist_ok=True)
+    with tempfile.NamedTemporaryFile(mode="wb", dir=get_cache_dir(), delete=False) as f:
+        f.write(orjson.dumps(asdict(future.result())))
+    os.replace(f.name, os.path.join(get_cache_dir(), cache_key + ".json"))
+
+
+def _evict_cached():
+    """Remove the least recently used cached results beyond `MAX_CACHED_VALIDATIONS`."""
+    try:
+        entries = [
+            (entry.stat().st_mtime, entry.path)
+            for entry in os.scandir(get_cache_dir())
+            if entry.is_file()
+        ]
+    except OSError:
+        return
+    if len(entries) <= MAX_CACHED_VALIDATIONS:
+        return
+    entries.sort()
+    for _, path in entries[: len(entries) - MAX_CACHED_VALIDATIONS]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -30,20 +30,90 @@ Steps to write a unit test for a single function
 
 """
 
-from hasty_coder import openai_cli
+import logging
+import re
 
+from hasty_coder import llm
 
-def write_test(code_snippet, project_plan=None):
+logger = logging.getLogger(__name__)
+
+MAX_ERROR_CHARS = 2000
+
+
+def format_test_context(snippet_context):
+    """Describe what a snippet calls and how it is called, for the test writing prompt."""
+    sections = []
+    definition = snippet_context.definition
+    if definition is not None:
+        qualname = definition.name[len(definition.module) + 1 :]
+        sections.append(
+            f"The code is `{qualname}` in the `{definition.module}` module. "
+            f"Import it with `from {definition.module} import {qualname.split('.')[0]}`."
+        )
+    if snippet_context.callees:
+        lines = []
+        for definition in snippet_context.callees:
+            line = f"{definition.signature}  # {definition.filepath}"
+            if definition.docstring:
+                line += f" - {definition.docstring}"
+            lines.append(line)
+        sections.append("SIGNATURES OF FUNCTIONS IT USES:\n" + "\n".join(lines))
+    if snippet_context.callers:
+        lines = [
+            f"{call.filepath}:{call.line}: {call.code}"
+            for call in snippet_context.callers
+        ]
+        sections.append("EXAMPLES OF IT BEING CALLED:\n" + "\n".join(lines))
+    return "\n\n".join(sections)
+
+
+def write_test(code_snippet, project_plan=None, context="", failed_attempt=None):
+    """
+    Write pytest tests for a code snippet.
+
+    `failed_attempt` is a `(test_code, error)` pair from an earlier try, so the model can fix what went wrong.
+    """
+    context = f"\n{context.strip()}\n" if context else ""
+    retry_instructions = ""
+    if failed_attempt:
+        failed_code, error = failed_attempt
+        retry_instructions = f"""
+A PREVIOUS ATTEMPT AT THESE TESTS:
+```
+{failed_code}
+```
+FAILED WITH THIS ERROR:
+```
+{error[-MAX_ERROR_CHARS:]}
+```
+Write new tests that don't have this problem.
+"""
     prompt = f"""
 INSTRUCTIONS:
 Write unit tests for the following code snippet. Use the pytest library. Use the pytest `monkeypatch` fixture to mock any external calls.
-
+{context}
 CODE SNIPPET:
 ```
 {code_snippet}
 ```
-
+{retry_instructions}
 UNIT TESTS:"""
-    print(prompt)
-    test_code = openai_cli.completion(prompt)
-    return test_code
+    logger.debug(prompt)
+    test_code = llm.complete(prompt)
+    return extract_code(test_code)
+
+
+def extract_code(text):
+    """Return the first fenced code block in text, or all of text if there isn't one."""
+    match = re.search(r"```[a-zA-Z]*\n(.*?)(```|$)", text, flags=re.DOTALL)
+    if match:
+        return match.group(1)
+    return text
+
+
+def write_test_for_snippet(snippet, symbol_index=None, failed_attempt=None):
+    """Write tests for a `CodeSnippet`, using the symbol index for the signatures it uses and how it is called."""
+    context = ""
+    if symbol_index is not None:
+        context = format_test_context(symbol_index.snippet_context(snippet))
+    return write_test(snippet.code_text, context=context, failed_attempt=failed_attempt)
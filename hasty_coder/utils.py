@@ -1,13 +1,10 @@
+import contextvars
 import logging
 import re
-import time
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from functools import partial
 
-import openai
-import openai.error
 import orjson
-from langchain import OpenAI
 
 logger = logging.getLogger(__name__)
 
@@ -18,44 +15,6 @@ def extract_json(text):
     return robust_json_loads(text)
 
 
-class LoggedOpenAI(OpenAI):
-    """Initialize LoggedOpenAI object with default timeout and max_tokens."""
-
-    def __init__(self, *args, **kwargs):
-        """Set default request timeout and max tokens for the class."""
-        kwargs["request_timeout"] = 30
-        kwargs.setdefault("max_tokens", 2000)
-        super().__init__(*args, **kwargs)
-
-    def __call__(self, prompt, stop=None, as_json=False, try_count=3):
-        """Call the OpenAI API and return the response as a string or JSON object"""
-        prompt = prompt.strip()
-        total_response = ""
-        for i in range(6):
-            logger.debug("STARTPROMPT\n%s\nENDPROMPT", prompt)
-            try:
-                last_response = super().__call__(prompt + total_response, stop)
-            except openai.error.RateLimitError:
-                logger.warning("Rate limit error, pausing and then retrying")
-                time.sleep(10)
-                continue
-            total_response += last_response
-
-            logger.debug("STARTANSWER:\n%s\nENDANSWER", last_response)
-            if not as_json:
-                return total_response.strip()
-            try:
-                return extract_json(last_response)
-            except orjson.JSONDecodeError:
-                logger.exception("JSON DECODE ERROR: %s", last_response)
-                continue
-            except openai.error.Timeout:
-                logger.error("TIMEOUT ERROR")
-                continue
-
-        raise Exception("Failed to get valid JSON")
-
-
 def parallel_run(func, iterable, kwargs=None, max_workers=2):
     """Run a function in parallel over an iterable with a given number of workers."""
     if kwargs is None:
@@ -66,6 +25,41 @@ def parallel_run(func, iterable, kwargs=None, max_workers=2):
     return results
 
 
+def parallel_imap_unordered(func, iterable, max_workers=2, max_pending=None):
+    """
+    Yield `(item, result)` pairs as func finishes with each item.
+
+    Items are pulled from iterable lazily and at most `max_pending` of them are in flight at once, so a
+    slow consumer or a huge iterable doesn't pile up work in memory. func runs in a copy of the caller's
+    context, so context variables like `llm.completion_group` carry over.
+    """
+    max_pending = max_pending or max_workers * 2
+    with ThreadPoolExecutor(max_workers=max_workers) as e:
+        pending = {}
+        try:
+            for item in iterable:
+                while len(pending) >= max_pending:
+                    yield from _pop_finished(pending)
+                context = contextvars.copy_context()
+                pending[e.submit(context.run, func, item)] = item
+            while pending:
+                yield from _pop_finished(pending)
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def _pop_finished(pending):
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    for future in done:
+        yield pending.pop(future), future.result()
+
+
+def estimate_tokens(text):
+    """Roughly estimate how many tokens a piece of text will use (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
 def slugify(text):
     """Convert camelCase text to dash-separated text and remove non-alphanumeric characters."""
     # camelcase to dash-separated
@@ -110,10 +104,14 @@ def robust_json_loads(json_string):
         try:
             return orjson.loads(json_string)
         except orjson.JSONDecodeError as e:
-            if "trailing comma is not allowed" in str(e):
-                json_string = remove_last_comma_before_index(json_string, e.pos)
-                continue
-            if "unexpected end of data" in str(e):
-                json_string = remove_last_comma_before_index(json_string, e.pos)
-                continue
+            message = str(e)
+            if (
+                "trailing comma is not allowed" in message
+                or "unexpected end of data" in message
+            ):
+                fixed_json_string = remove_last_comma_before_index(json_string, e.pos)
+                # give up if there was no comma to remove
+                if fixed_json_string != json_string:
+                    json_string = fixed_json_string
+                    continue
             raise e
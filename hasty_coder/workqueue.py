@@ -0,0 +1,351 @@
+"""
+A local SQLite work queue so repo-wide tasks can be split across many worker processes or machines.
+
+`hc comments --enqueue queue.db PATH` or `hc lint --enqueue queue.db PATH` writes one job per code snippet.
+Any number of `hc worker queue.db` processes sharing the filesystem drain the queue. Each job is leased to
+one worker at a time. If a worker dies its lease expires and another worker picks the job up. Failed jobs
+are retried up to `max_attempts` times. `hc apply queue.db` then applies all results in one pass.
+
+Duplicate snippets are grouped when they are queued, like they are when running locally. Only the first of a
+group gets a job and the rest are listed in its payload's "duplicates" to share its result.
+"""
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from dataclasses import dataclass
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEASE_SECONDS = 10 * 60
+DEFAULT_MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    task TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    lease_expires_at REAL,
+    worker TEXT,
+    result BLOB,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_expires_at);
+"""
+
+
+@dataclass
+class Job:
+    id: int
+    task: str
+    payload: dict
+    attempts: int
+
+
+class WorkQueue:
+    def __init__(self, path, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def enqueue(self, task, payloads, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """Add a job for each payload. Returns how many were added."""
+        now = time.time()
+        rows = [
+            (task, orjson.dumps(payload), max_attempts, now, now)
+            for payload in payloads
+        ]
+        with self._transaction():
+            self.conn.executemany(
+                "INSERT INTO jobs (task, payload, max_attempts, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+        return len(rows)
+
+    def lease(self, worker):
+        """
+        Claim the next available job, or return None if there isn't one.
+
+        Jobs whose lease expired after their last attempt are marked failed rather than leased again, so a job
+        that keeps crashing or killing its workers isn't retried forever.
+        """
+        now = time.time()
+        with self._transaction():
+            self.conn.execute(
+                """
+                UPDATE jobs SET status = 'failed', error = COALESCE(error || '\n', '') || ?,
+                lease_expires_at = NULL, updated_at = ?
+                WHERE status = 'leased' AND lease_expires_at < ? AND attempts >= max_attempts
+                """,
+                ("lease expired on the last attempt", now, now),
+            )
+            row = self.conn.execute(
+                """
+                SELECT id, task, payload, attempts FROM jobs
+                WHERE (status = 'pending' OR (status = 'leased' AND lease_expires_at < ?))
+                ORDER BY id LIMIT 1
+                """,
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, task, payload, attempts = row
+            self.conn.execute(
+                """
+                UPDATE jobs SET status = 'leased', attempts = attempts + 1, worker = ?,
+                lease_expires_at = ?, updated_at = ? WHERE id = ?
+                """,
+                (worker, now + self.lease_seconds, now, job_id),
+            )
+        return Job(
+            id=job_id, task=task, payload=orjson.loads(payload), attempts=attempts + 1
+        )
+
+    def complete(self, job_id, result, worker):
+        """
+        Record a job's result. Returns False if the worker no longer holds the job.
+
+        A worker whose lease expired may find another worker took the job over, and then its result is dropped.
+        """
+        with self._transaction():
+            cursor = self.conn.execute(
+                """
+                UPDATE jobs SET status = 'done', result = ?, error = NULL, updated_at = ?
+                WHERE id = ? AND worker = ? AND status = 'leased'
+                """,
+                (orjson.dumps(result), time.time(), job_id, worker),
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id, error, worker):
+        """
+        Record a failure. The job goes back in the queue unless it is out of attempts.
+
+        Returns False if the worker no longer holds the job.
+        """
+        with self._transaction():
+            cursor = self.conn.execute(
+                """
+                UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'pending' END,
+                error = ?, lease_expires_at = NULL, updated_at = ?
+                WHERE id = ? AND worker = ? AND status = 'leased'
+                """,
+                (error, time.time(), job_id, worker),
+            )
+        return cursor.rowcount == 1
+
+    def results(self, task=None):
+        """Return `(payload, result)` pairs of completed jobs."""
+        query = "SELECT payload, result FROM jobs WHERE status = 'done'"
+        params = ()
+        if task:
+            query += " AND task = ?"
+            params = (task,)
+        return [
+            (orjson.loads(payload), orjson.loads(result))
+            for payload, result in self.conn.execute(query + " ORDER BY id", params)
+        ]
+
+    def counts(self):
+        """Return the number of jobs in each status."""
+        return dict(
+            self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+        )
+
+    def has_unfinished_jobs(self):
+        counts = self.counts()
+        return bool(counts.get("pending") or counts.get("leased"))
+
+    def _transaction(self):
+        return _ImmediateTransaction(self.conn)
+
+
+class _ImmediateTransaction:
+    """Take the write lock up front so two workers can't lease the same job."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+def _snippet_row(payload):
+    return (
+        payload["filepath"],
+        payload["start_line"],
+        payload["end_line"],
+        payload["code_text"],
+    )
+
+
+def _group_duplicates(payloads, deduplicator):
+    """Return the first payload of each group of duplicate snippets, with the others in its "duplicates"."""
+    groups = {}
+    for payload in payloads:
+        key, _ = deduplicator.representative(payload["code_text"])
+        if key in groups:
+            groups[key].setdefault("duplicates", []).append(payload)
+        else:
+            groups[key] = payload
+    return list(groups.values())
+
+
+def comments_task(payload):
+    """Return the docstring edits for a snippet and its duplicates."""
+    # pylint: disable=import-outside-toplevel
+    from hasty_coder.tasklib.add_comments import (
+        _add_comments_to_code_snippet,
+        _docstring_edit,
+        describe_code_snippet,
+    )
+
+    duplicates = payload.get("duplicates", [])
+    if not duplicates:
+        return [list(_add_comments_to_code_snippet(_snippet_row(payload)))]
+    docstring = describe_code_snippet(payload["code_text"])
+    return [
+        list(_docstring_edit(_snippet_row(p), docstring))
+        for p in [payload, *duplicates]
+    ]
+
+
+def review_task(payload):
+    # pylint: disable=import-outside-toplevel
+    from hasty_coder.tasklib.code_review import review_snippet
+
+    return review_snippet(payload["code_text"], line_offset=payload["start_line"])
+
+
+TASK_HANDLERS = {
+    "comments": comments_task,
+    "review": review_task,
+}
+
+
+def enqueue_comments(queue_path, path):
+    """Queue a docstring job for every group of duplicate snippets in path that don't have one."""
+    # pylint: disable=import-outside-toplevel
+    from hasty_coder.langlib.python import SnippetDeduplicator
+    from hasty_coder.tasklib.add_comments import (
+        NEAR_DUPLICATE_THRESHOLD,
+        get_code_snippet_rows_missing_docstrings,
+    )
+
+    payloads = [
+        {
+            "filepath": full_path,
+            "start_line": start_line_no,
+            "end_line": end_line_no,
+            "code_text": code_snippet,
+        }
+        for full_path, start_line_no, end_line_no, code_snippet in (
+            get_code_snippet_rows_missing_docstrings(path)
+        )
+    ]
+    payloads = _group_duplicates(
+        payloads, SnippetDeduplicator(similarity_threshold=NEAR_DUPLICATE_THRESHOLD)
+    )
+    with WorkQueue(queue_path) as queue:
+        return queue.enqueue("comments", payloads)
+
+
+def enqueue_review(queue_path, path):
+    """Queue a review job for every group of duplicate snippets in path, riskiest first."""
+    # pylint: disable=import-outside-toplevel
+    from hasty_coder.tasklib.code_review import review_deduplicator
+    from hasty_coder.tasklib.review_scheduler import rank_snippets_in_path
+
+    payloads = [
+        {
+            "filepath": risk.snippet.filepath,
+            "start_line": risk.snippet.start_line,
+            "end_line": risk.snippet.end_line,
+            "code_text": risk.snippet.code_text,
+        }
+        for risk in rank_snippets_in_path(path)
+    ]
+    payloads = _group_duplicates(payloads, review_deduplicator())
+    with WorkQueue(queue_path) as queue:
+        return queue.enqueue("review", payloads)
+
+
+def review_comments(payload, comments):
+    """
+    Return `(filepath, line_no, comment)` for a review job's comments and the same comments on its duplicates.
+
+    Review duplicates have the same tokens on the same lines, so comments move by the difference in start line.
+    """
+    located = []
+    for snippet in [payload, *payload.get("duplicates", [])]:
+        offset = snippet["start_line"] - payload["start_line"]
+        located.extend(
+            (snippet["filepath"], line_no + offset, comment)
+            for line_no, comment in comments
+        )
+    return located
+
+
+def run_worker(
+    queue_path,
+    worker=None,
+    handlers=None,
+    wait=False,
+    poll_seconds=2.0,
+    lease_seconds=DEFAULT_LEASE_SECONDS,
+):
+    """
+    Process jobs until the queue is drained. Returns the number of jobs processed.
+
+    With `wait` the worker keeps polling for new jobs instead of exiting.
+    """
+    handlers = handlers or TASK_HANDLERS
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    processed = 0
+    with WorkQueue(queue_path, lease_seconds=lease_seconds) as queue:
+        while True:
+            job = queue.lease(worker)
+            if job is None:
+                # other workers may still fail jobs back into the queue
+                if wait or queue.has_unfinished_jobs():
+                    time.sleep(poll_seconds)
+                    continue
+                break
+            try:
+                result = handlers[job.task](job.payload)
+            except Exception as e:  # pylint: disable=broad-except
+                logger.warning(
+                    "Job %s failed on attempt %s: %r", job.id, job.attempts, e
+                )
+                queue.fail(job.id, repr(e), worker)
+                continue
+            if not queue.complete(job.id, result, worker):
+                logger.warning("Lost the lease on job %s, dropping its result", job.id)
+                continue
+            processed += 1
+    logger.info("Worker %s processed %d jobs", worker, processed)
+    return processed
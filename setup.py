@@ -6,11 +6,19 @@ setup(
     description="A command line tool that uses AI to write entire software projects from scratch. HastyCoder is your AI careless coding companion. ",
     author="Bryce Drennan",
     packages=["hasty_coder"],
+    package_data={"hasty_coder": ["data/*.pack"]},
     entry_points={
         "console_scripts": [
             "hasty-code = hasty_coder.cli:route_cmd",
             "hc = hasty_coder.cli:route_cmd",
         ]
     },
-    install_requires=["black", "click", "isort", "langchain", "openai", "orjson"],
+    install_requires=[
+        "black",
+        "click",
+        "isort",
+        "orjson",
+        "pathspec",
+        "requests",
+    ],
 )
@@ -1,8 +1,16 @@
+import ast
+import textwrap
+
 import pytest
 
 from hasty_coder.langlib.python import (
+    SnippetDeduplicator,
     add_docstring_to_sourcecode,
+    code_fingerprint,
+    cyclomatic_complexity,
     get_func_and_class_snippets,
+    group_duplicate_snippets,
+    max_nesting_depth,
 )
 
 sample_code = """
@@ -56,3 +64,78 @@ def test_add_docstring_to_sourcecode(sourcecode):
     new_code = add_docstring_to_sourcecode(sourcecode, "added docstring")
     # new_code = format_code(new_code)
     print(new_code)
+
+
+branchy_code = """
+def classify(values):
+    for v in values:
+        if v > 10 and v < 20:
+            while v:
+                v -= 1
+        elif v < 0:
+            return "negative"
+    return "ok"
+"""
+
+
+def test_cyclomatic_complexity():
+    tree = ast.parse(branchy_code)
+    # 1 + for + if + and + while + elif
+    assert cyclomatic_complexity(tree) == 6
+
+
+def test_max_nesting_depth():
+    tree = ast.parse(branchy_code)
+    # def > for > if > while
+    assert max_nesting_depth(tree) == 4
+
+
+summing_code = """
+    def total(self, items):
+        result = 0
+        for item in items:
+            if item.enabled:
+                result += item.value
+        return result
+"""
+
+
+def test_code_fingerprint_ignores_comments_and_indentation():
+    commented = summing_code.replace("return result", "return result  # done")
+    assert code_fingerprint(summing_code) == code_fingerprint(
+        textwrap.dedent(commented)
+    )
+    renamed = summing_code.replace("result", "acc").replace("item", "x")
+    assert code_fingerprint(summing_code) != code_fingerprint(renamed)
+    assert code_fingerprint(summing_code, canonicalize_identifiers=True) == (
+        code_fingerprint(renamed, canonicalize_identifiers=True)
+    )
+
+
+def test_group_duplicate_snippets():
+    near_duplicate = summing_code.replace("item.value", "item.value * 1")
+    unrelated = branchy_code
+    assert group_duplicate_snippets([summing_code, near_duplicate, unrelated]) == [
+        [0],
+        [1],
+        [2],
+    ]
+    assert group_duplicate_snippets(
+        [summing_code, near_duplicate, unrelated], similarity_threshold=0.6
+    ) == [[0, 1], [2]]
+
+
+def test_deduplicator_runs_once_per_group():
+    calls = []
+
+    def describe(code_text):
+        calls.append(code_text)
+        return len(calls)
+
+    deduplicator = SnippetDeduplicator(canonicalize_identifiers=True)
+    renamed = summing_code.replace("result", "acc")
+    assert deduplicator.run(summing_code, describe) == 1
+    assert deduplicator.run(renamed, describe) == 1
+    assert deduplicator.run(branchy_code, describe) == 2
+    assert calls == [summing_code, branchy_code]
+    assert deduplicator.calls_saved == 1
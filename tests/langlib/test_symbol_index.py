@@ -0,0 +1,127 @@
+import os
+
+from hasty_coder import llm
+from hasty_coder.langlib.python import get_func_and_class_snippets_in_path
+from hasty_coder.langlib.symbol_index import SymbolIndex, extract_module_symbols
+from hasty_coder.project_map import ProjectMap
+from hasty_coder.tasklib.write_tests import write_test_for_snippet
+
+SHAPES = '''
+"""Shapes."""
+import math
+
+
+def area(radius):
+    """Return the area of a circle."""
+    return math.pi * radius**2
+
+
+class Circle:
+    def __init__(self, radius):
+        self.radius = radius
+
+    def describe(self):
+        return f"circle of area {self.area()}"
+
+    def area(self):
+        return area(self.radius)
+'''
+
+REPORT = """
+from .shapes import Circle, area as circle_area
+from pkg import shapes
+
+
+def report(radii):
+    total = sum(circle_area(r) for r in radii)
+    return [shapes.Circle(r).describe() for r in radii], total
+"""
+
+
+def _make_index(tmp_path):
+    project_path = tmp_path / "project"
+    (project_path / "pkg").mkdir(parents=True)
+    (project_path / "pkg" / "__init__.py").write_text("", encoding="utf-8")
+    (project_path / "pkg" / "shapes.py").write_text(SHAPES, encoding="utf-8")
+    (project_path / "pkg" / "report.py").write_text(REPORT, encoding="utf-8")
+    project_map = ProjectMap(project_path, map_path=str(tmp_path / "map.gz"))
+    project_map.refresh()
+    index = SymbolIndex(project_map, index_path=str(tmp_path / "symbols.gz"))
+    index.refresh()
+    return index
+
+
+def _snippet(index, name):
+    for snippet in get_func_and_class_snippets_in_path(index.project_map.root_path):
+        definition = index.definition_at(snippet.filepath, snippet.start_line)
+        if definition and definition.name == name:
+            return snippet
+    raise KeyError(name)
+
+
+def test_extract_module_symbols():
+    record = extract_module_symbols(REPORT, "pkg.report")
+    assert record["imports"] == {
+        "Circle": "pkg.shapes.Circle",
+        "circle_area": "pkg.shapes.area",
+        "shapes": "pkg.shapes",
+    }
+    assert ["report", "circle_area", 7] in [call[:3] for call in record["calls"]]
+
+
+def test_resolved_callers(tmp_path):
+    index = _make_index(tmp_path)
+    callers = index.callers["pkg.shapes.area"]
+    assert sorted((c.caller, c.line) for c in callers) == [
+        ("pkg.report.report", 7),
+        ("pkg.shapes.Circle.area", 19),
+    ]
+    assert [c.caller for c in index.callers["pkg.shapes.Circle.area"]] == [
+        "pkg.shapes.Circle.describe"
+    ]
+    assert index.definitions["pkg.shapes.area"].docstring == (
+        "Return the area of a circle."
+    )
+
+
+def test_snippet_context(tmp_path):
+    index = _make_index(tmp_path)
+    context = index.snippet_context(_snippet(index, "pkg.report.report"))
+    assert [d.name for d in context.callees] == ["pkg.shapes.area", "pkg.shapes.Circle"]
+    context = index.snippet_context(_snippet(index, "pkg.shapes.Circle.describe"))
+    assert [d.name for d in context.callees] == ["pkg.shapes.Circle.area"]
+    context = index.snippet_context(_snippet(index, "pkg.shapes.Circle"))
+    assert [c.code for c in context.callers] == [
+        "return [shapes.Circle(r).describe() for r in radii], total"
+    ]
+
+
+def test_refresh_is_incremental(tmp_path):
+    index = _make_index(tmp_path)
+    project_map = index.project_map
+    reloaded = SymbolIndex(project_map, index_path=index.index_path)
+    assert reloaded.refresh() == 0
+    assert "pkg.shapes.area" in reloaded.definitions
+
+    report_path = os.path.join(project_map.root_path, "pkg", "report.py")
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write("def report():\n    return 1\n")
+    project_map.refresh()
+    assert reloaded.refresh() == 1
+    assert [c.caller for c in reloaded.callers["pkg.shapes.area"]] == [
+        "pkg.shapes.Circle.area"
+    ]
+
+
+def test_write_test_includes_context(tmp_path):
+    index = _make_index(tmp_path)
+    backend = llm.FakeBackend(responses=["def test_describe(): pass"])
+    previous = llm.set_backend(backend)
+    try:
+        write_test_for_snippet(_snippet(index, "pkg.shapes.area"), index)
+    finally:
+        llm.set_backend(previous)
+    assert "SIGNATURES OF FUNCTIONS IT USES" not in backend.prompts[0]
+    assert "pkg/report.py:7: total = sum(circle_area(r) for r in radii)" in (
+        backend.prompts[0]
+    )
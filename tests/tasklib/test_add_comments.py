@@ -0,0 +1,76 @@
+import pytest
+
+from hasty_coder import llm
+from hasty_coder.tasklib.add_comments import (
+    add_comments_to_all_code_in_path,
+    apply_comment_edits,
+)
+
+code_a = """
+def first():
+    return 1
+
+
+def second():
+    return 2
+"""
+
+code_b = """
+def third():
+    return 3
+"""
+
+
+@pytest.fixture(name="backend")
+def backend_fixture():
+    def respond(prompt):
+        if "third" in prompt:
+            raise RuntimeError("backend went away")
+        return '{"1": "Return a number."}'
+
+    backend = llm.FakeBackend(responses=respond)
+    previous = llm.set_backend(backend)
+    yield backend
+    llm.set_backend(previous)
+
+
+def test_finished_files_are_kept_when_a_later_file_fails(tmp_path, backend):
+    (tmp_path / "a.py").write_text(code_a, encoding="utf-8")
+    (tmp_path / "b.py").write_text(code_b, encoding="utf-8")
+
+    with pytest.raises(RuntimeError):
+        add_comments_to_all_code_in_path(tmp_path, max_workers=1, max_in_flight=1)
+
+    assert len(backend.prompts) == 3
+    assert (tmp_path / "a.py").read_text(encoding="utf-8").count(
+        '"""Return a number."""'
+    ) == 2
+    assert (tmp_path / "b.py").read_text(encoding="utf-8") == code_b
+
+
+def test_duplicate_snippets_share_a_docstring(tmp_path, backend):
+    (tmp_path / "a.py").write_text(code_a, encoding="utf-8")
+    (tmp_path / "copy.py").write_text(code_a, encoding="utf-8")
+
+    add_comments_to_all_code_in_path(tmp_path)
+
+    assert len(backend.prompts) == 2
+    for filename in ["a.py", "copy.py"]:
+        text = (tmp_path / filename).read_text(encoding="utf-8")
+        assert text.count('"""Return a number."""') == 2
+
+
+def test_edits_to_changed_files_are_skipped(tmp_path):
+    path = tmp_path / "a.py"
+    path.write_text("def a():\n    return 1\n\n\ndef b():\n    return 2\n")
+    rows = [
+        (str(path), 1, 1, "def a():\n", 'def a():\n    """A."""\n'),
+        (str(path), 5, 5, "def b():\n", 'def b():\n    """B."""\n'),
+    ]
+    # the file changed after the edits were made
+    path.write_text("def a():\n    return 1\n\n\ndef renamed():\n    return 2\n")
+
+    assert apply_comment_edits(rows) == 1
+    assert path.read_text() == (
+        'def a():\n    """A."""\n    return 1\n\n\ndef renamed():\n    return 2\n'
+    )
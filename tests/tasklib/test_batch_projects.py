@@ -0,0 +1,101 @@
+import os
+
+import orjson
+import pytest
+
+from hasty_coder import llm
+from hasty_coder.models import SoftwareProjectPlan, SoftwareStack
+from hasty_coder.tasklib import batch_projects
+from hasty_coder.tasklib.batch_projects import (
+    format_batch_summary,
+    read_batch_descriptions,
+    write_projects_batch,
+)
+
+
+@pytest.fixture(autouse=True)
+def temp_dir_fixture(tmp_path, monkeypatch):
+    (tmp_path / "tmp").mkdir()
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path / "tmp"))
+    monkeypatch.setattr(batch_projects, "prefetch_gitignore_templates", lambda: None)
+
+
+def plan_for(description):
+    if "broken" in description:
+        raise RuntimeError("no plan")
+    return SoftwareProjectPlan(
+        software_name="Shop",
+        software_stack=SoftwareStack(
+            primary_programming_language="Python",
+            secondary_programming_languages=[],
+            primary_framework="Flask",
+            secondary_frameworks=[],
+            testing_tooling=["pytest"],
+        ),
+        project_files={"shop/": "the package", "shop/cart.py": description},
+    )
+
+
+def test_read_batch_descriptions(tmp_path):
+    path = tmp_path / "descriptions.jsonl"
+    path.write_bytes(
+        orjson.dumps("a shop")
+        + b"\n\n"
+        + orjson.dumps({"description": " a bank "})
+        + b"\n"
+    )
+    assert read_batch_descriptions(path) == ["a shop", "a bank"]
+
+    path.write_bytes(orjson.dumps({"name": "a shop"}) + b"\n")
+    with pytest.raises(ValueError, match=":1 has no description"):
+        read_batch_descriptions(path)
+
+
+def test_batch_projects_share_limiter_and_count_tokens(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_projects, "generate_project_plan", plan_for)
+    out_path = tmp_path / "out"
+    out_path.mkdir()
+    descriptions = ["a shop cart", "a cart for a bigger shop", "a broken shop"]
+    backend = llm.FakeBackend(responses=lambda prompt: "x = 1\n")
+    previous = llm.set_backend(backend)
+    try:
+        results = write_projects_batch(
+            descriptions, str(out_path), max_projects=3, max_concurrent_completions=2
+        )
+    finally:
+        llm.set_backend(previous)
+
+    assert [r.index for r in results] == [0, 1, 2]
+    made, other_made, broken = results
+    # same-named projects started together get their own folders
+    assert made.project_path != other_made.project_path
+    for result in (made, other_made):
+        assert result.error is None
+        assert result.software_name == "Shop"
+        assert result.prompt_tokens > 0 and result.completion_tokens > 0
+        with open(
+            os.path.join(result.project_path, "shop/cart.py"), encoding="utf-8"
+        ) as f:
+            assert f.read() == "x = 1\n"
+    assert "RuntimeError('no plan')" == broken.error
+    assert broken.total_tokens == 0
+    assert len(backend.prompts) == 2
+    # the limiter is removed afterwards
+    assert llm.set_limiter(None) is None
+
+    summary = format_batch_summary(results, 12.34)
+    lines = summary.splitlines()
+    assert lines[0].split() == [
+        "#",
+        "Project",
+        "Seconds",
+        "Prompt",
+        "tokens",
+        "Completion",
+        "tokens",
+        "Result",
+    ]
+    assert made.project_path in summary
+    assert "no plan" in summary
+    assert lines[-1].split()[:2] == ["Total", "12.3"]
+    assert lines[-1].endswith("2/3 created")
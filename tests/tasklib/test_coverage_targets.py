@@ -0,0 +1,64 @@
+import pytest
+
+from hasty_coder.langlib.python import CodeSnippet
+from hasty_coder.tasklib import coverage_targets
+from hasty_coder.tasklib.coverage_targets import (
+    CoverageUnavailable,
+    get_project_coverage,
+    select_undercovered_snippets,
+)
+
+
+@pytest.fixture(name="project_path")
+def project_path_fixture(tmp_path, monkeypatch):
+    (tmp_path / "tmp").mkdir()
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path / "tmp"))
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+    (project_path / "mod.py").write_text("x = 1\n", encoding="utf-8")
+    return project_path
+
+
+def test_coverage_is_cached_by_source_hash(project_path, monkeypatch):
+    runs = []
+
+    def fake_run_coverage(project_root):
+        runs.append(project_root)
+        return {"mod.py": [[1], []]}
+
+    monkeypatch.setattr(coverage_targets, "_run_coverage", fake_run_coverage)
+    assert get_project_coverage(project_path) == {"mod.py": ({1}, set())}
+    assert get_project_coverage(project_path) == {"mod.py": ({1}, set())}
+    assert len(runs) == 1
+
+    (project_path / "mod.py").write_text("x = 2\n", encoding="utf-8")
+    get_project_coverage(project_path)
+    assert len(runs) == 2
+
+
+def test_select_undercovered_snippets(project_path, monkeypatch):
+    monkeypatch.setattr(
+        coverage_targets,
+        "_run_coverage",
+        lambda root: {"mod.py": [[1, 2, 3, 5, 6, 7, 8], [6, 7, 8]]},
+    )
+    covered = CodeSnippet("", start_line=1, end_line=3, filepath="mod.py")
+    half_covered = CodeSnippet("", start_line=5, end_line=8, filepath="mod.py")
+    never_imported = CodeSnippet("", start_line=1, end_line=2, filepath="other.py")
+    snippets = [covered, never_imported, half_covered]
+    for snippet in snippets:
+        snippet.filepath = str(project_path / snippet.filepath)
+
+    assert select_undercovered_snippets(snippets, project_path, threshold=0.8) == [
+        half_covered,
+        never_imported,
+    ]
+
+
+def test_select_without_coverage_returns_everything(project_path, monkeypatch):
+    def unavailable(project_root):
+        raise CoverageUnavailable("coverage.py is not installed")
+
+    monkeypatch.setattr(coverage_targets, "_run_coverage", unavailable)
+    snippets = [CodeSnippet("", start_line=1, end_line=1, filepath="mod.py")]
+    assert select_undercovered_snippets(snippets, project_path) == snippets
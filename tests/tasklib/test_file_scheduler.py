@@ -0,0 +1,162 @@
+import threading
+import time
+
+import pytest
+
+from hasty_coder import llm
+from hasty_coder.models import SoftwareProjectPlan
+from hasty_coder.tasklib.file_scheduler import (
+    TimingHistory,
+    estimate_file_tokens,
+    infer_file_dependencies,
+    run_scheduled,
+    schedule_priorities,
+)
+from hasty_coder.tasklib.implement_software_project import implement_project_plan
+
+
+@pytest.fixture()
+def history(tmp_path):
+    return TimingHistory(str(tmp_path / "timings.json"))
+
+
+def test_estimate_file_tokens():
+    assert estimate_file_tokens("app/main.py", "entrypoint") > estimate_file_tokens(
+        "app/db.py", "entrypoint"
+    )
+    assert estimate_file_tokens("app/db.py", "a " * 100) > estimate_file_tokens(
+        "app/db.py", "a"
+    )
+    assert estimate_file_tokens("requirements.txt") < estimate_file_tokens("app/db.py")
+    assert estimate_file_tokens(".gitignore", "lots of words here") == 0
+
+
+def test_infer_file_dependencies():
+    dependencies = infer_file_dependencies(
+        ["app/db.py", "app/main.py", "tests/test_db.py", "tests/test_other.py"]
+    )
+    assert dependencies == {"tests/test_db.py": ["app/db.py"]}
+
+
+def test_priorities_include_waiting_work():
+    priorities = schedule_priorities({"a": 1, "b": 5, "t": 10}, {"t": ["a"]})
+    assert priorities == {"a": 11, "b": 5, "t": 10}
+    with pytest.raises(ValueError):
+        schedule_priorities({"a": 1, "b": 1}, {"a": ["b"], "b": ["a"]})
+
+
+def test_longest_jobs_start_first(history):
+    started = []
+
+    def job(filepath):
+        started.append(filepath)
+
+    jobs = {"requirements.txt": "", "app/main.py": "the app", "app/util.py": ""}
+    run_scheduled(job, jobs, max_workers=1, history=history)
+    assert started == ["app/main.py", "app/util.py", "requirements.txt"]
+
+
+def test_batches_are_scheduled_with_single_files(history):
+    started = []
+    finished = set()
+
+    def job(job):
+        if job == "tests/test_db.py":
+            assert "app/db.py" in finished
+        started.append(job)
+        finished.update(job if isinstance(job, tuple) else (job,))
+
+    small = ("app/db.py", "app/util.py", "setup.cfg")
+    jobs = {small: ("", "", ""), "app/main.py": "the app", "tests/test_db.py": ""}
+    timings = run_scheduled(
+        job,
+        jobs,
+        max_workers=1,
+        dependencies={"tests/test_db.py": ["app/db.py"]},
+        history=history,
+    )
+    # the batch is estimated as the sum of its files, plus the test waiting on it
+    assert started == [small, "app/main.py", "tests/test_db.py"]
+    assert set(timings) == set(jobs)
+
+
+def test_dependencies_finish_first(history):
+    finished = set()
+    lock = threading.Lock()
+    order_ok = []
+
+    def job(filepath):
+        if filepath == "tests/test_db.py":
+            order_ok.append("app/db.py" in finished)
+        time.sleep(0.01)
+        with lock:
+            finished.add(filepath)
+
+    jobs = {"app/db.py": "", "tests/test_db.py": "", "app/main.py": ""}
+    timings = run_scheduled(
+        job,
+        jobs,
+        max_workers=3,
+        dependencies={"tests/test_db.py": ["app/db.py"]},
+        history=history,
+    )
+    assert order_ok == [True]
+    assert set(timings) == set(jobs)
+
+
+def test_errors_raised_after_other_jobs(history):
+    ran = []
+
+    def job(filepath):
+        if filepath == "bad.py":
+            raise RuntimeError("boom")
+        ran.append(filepath)
+
+    with pytest.raises(RuntimeError):
+        run_scheduled(job, {"bad.py": "", "good.py": ""}, history=history)
+    assert ran == ["good.py"]
+
+
+def test_history_learns_from_timings(history):
+    default_estimate = history.estimate_seconds("app/db.py")
+    run_scheduled(lambda _: time.sleep(0.05), {"app/db.py": ""}, history=history)
+
+    reloaded = TimingHistory(history.path)
+    assert reloaded.estimate_seconds("app/db.py") < default_estimate
+    assert reloaded.estimate_seconds("app/db.py") == pytest.approx(0.05, rel=0.5)
+    # other kinds of files keep the default
+    assert reloaded.estimate_seconds("README.md") == history.estimate_seconds(
+        "README.md"
+    )
+
+
+def test_tests_are_written_with_module_signatures(tmp_path, monkeypatch):
+    (tmp_path / "tmp").mkdir()
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path / "tmp"))
+    plan = SoftwareProjectPlan(
+        software_name="Shop",
+        project_files={
+            "shop/": "the package",
+            "shop/db.py": "database access",
+            "tests/test_db.py": "tests of the database",
+        },
+    )
+
+    def respond(prompt):
+        if "Write the contents of the shop/db.py file" in prompt:
+            return "def connect(url, timeout=10):\n    return url\n"
+        return "def test_connect():\n    pass\n"
+
+    backend = llm.FakeBackend(responses=respond)
+    previous = llm.set_backend(backend)
+    try:
+        project_path = implement_project_plan(plan, str(tmp_path / "projects"))
+    finally:
+        llm.set_backend(previous)
+
+    test_prompt = [p for p in backend.prompts if "tests/test_db.py file" in p][0]
+    assert "def connect(url, timeout=10)" in test_prompt
+    assert (
+        "def connect" in (tmp_path / "projects" / "shop" / "shop" / "db.py").read_text()
+    )
+    assert project_path == str(tmp_path / "projects" / "shop")
@@ -0,0 +1,82 @@
+import pytest
+
+from hasty_coder import llm
+from hasty_coder.models import SoftwareProjectPlan
+from hasty_coder.tasklib.filegen import generate_file_batch_contents, group_small_files
+from hasty_coder.tasklib.implement_software_project import implement_project_plan
+
+PROJECT_FILES = {
+    "shop/": "the package",
+    "shop/__init__.py": "Marks the package",
+    "shop/main.py": "Runs the shop",
+    "requirements.txt": "Lists dependencies",
+    "setup.cfg": "Configures the package",
+    "README.md": "Describes the shop",
+}
+
+BATCH_RESPONSE = """=== FILE: shop/__init__.py ===
+=== END FILE ===
+=== FILE: requirements.txt ===
+click
+=== END FILE ===
+=== FILE: unasked.txt ===
+nope
+=== END FILE ===
+"""
+
+
+@pytest.fixture(name="plan")
+def plan_fixture(tmp_path, monkeypatch):
+    (tmp_path / "tmp").mkdir()
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path / "tmp"))
+    return SoftwareProjectPlan(software_name="Shop", project_files=PROJECT_FILES)
+
+
+def test_group_small_files(plan):
+    batches, singles = group_small_files(
+        [fp for fp in PROJECT_FILES if not fp.endswith("/")], plan
+    )
+    assert batches == [["shop/__init__.py", "requirements.txt", "setup.cfg"]]
+    assert singles == ["shop/main.py", "README.md"]
+
+
+def test_lone_small_file_is_not_batched(plan):
+    batches, singles = group_small_files(["setup.cfg", "shop/main.py"], plan)
+    assert batches == []
+    assert singles == ["shop/main.py", "setup.cfg"]
+
+
+def test_batch_response_is_split_into_files(plan):
+    backend = llm.FakeBackend(responses=[BATCH_RESPONSE])
+    previous = llm.set_backend(backend)
+    try:
+        contents = generate_file_batch_contents(
+            ["shop/__init__.py", "requirements.txt", "setup.cfg"], plan
+        )
+    finally:
+        llm.set_backend(previous)
+    assert contents == {"shop/__init__.py": "", "requirements.txt": "click\n"}
+    assert " - setup.cfg: Configures the package" in backend.prompts[0]
+
+
+def test_missing_batch_files_are_generated_alone(plan, tmp_path):
+    def respond(prompt):
+        if "Write the contents of each of these files" in prompt:
+            return BATCH_RESPONSE
+        if "Write the contents of the setup.cfg file" in prompt:
+            return "[metadata]\nname = shop\n"
+        return "print('hi')\n"
+
+    backend = llm.FakeBackend(responses=respond)
+    previous = llm.set_backend(backend)
+    try:
+        project_path = implement_project_plan(plan, str(tmp_path / "projects"))
+    finally:
+        llm.set_backend(previous)
+
+    single_file_prompts = [p for p in backend.prompts if "FILE CONTENTS:" in p]
+    assert len(single_file_prompts) == 2  # shop/main.py and the missing setup.cfg
+    with open(f"{project_path}/requirements.txt", encoding="utf-8") as f:
+        assert f.read() == "click\n"
+    with open(f"{project_path}/setup.cfg", encoding="utf-8") as f:
+        assert f.read() == "[metadata]\nname = shop"
@@ -0,0 +1,142 @@
+from pathlib import Path
+
+import pytest
+
+from hasty_coder import llm
+from hasty_coder.models import SoftwareProjectPlan
+from hasty_coder.tasklib.filegen import generate_file_contents, render_local_file
+from hasty_coder.tasklib.filegen_handlers.gen_boilerplate import gen_empty_init
+from hasty_coder.tasklib.implement_software_project import implement_project_plan
+
+FLASK_STACK = {
+    "project_type": "webapp",
+    "programming_language": "Python",
+    "framework": "Flask",
+    "database": "PostgreSQL",
+    "testing_framework": "pytest",
+}
+
+
+def make_plan(stack=None, **project_files):
+    files = {
+        "Makefile": "Builds the project",
+        "Dockerfile": "Builds the image",
+        "requirements.txt": "Lists dependencies",
+        "setup.py": "Packages the app",
+        **project_files,
+    }
+    return SoftwareProjectPlan(
+        software_name="Joke Box",
+        tagline='Jokes "on demand"',
+        software_stack=FLASK_STACK if stack is None else stack,
+        project_files=files,
+    )
+
+
+def test_python_boilerplate_is_rendered():
+    plan = make_plan()
+    assert render_local_file("requirements.txt", plan) == (
+        "flask\npsycopg2-binary\npytest\n"
+    )
+    setup_py = render_local_file("setup.py", plan)
+    compile(setup_py, "setup.py", "exec")
+    assert "install_requires=['flask', 'psycopg2-binary']" in setup_py
+
+    tomllib = pytest.importorskip("tomllib")
+    pyproject = tomllib.loads(render_local_file("pyproject.toml", plan))
+    assert pyproject["project"]["name"] == "joke-box"
+    assert pyproject["project"]["description"] == 'Jokes "on demand"'
+
+    dockerfile = render_local_file("Dockerfile", plan)
+    assert "RUN pip install --no-cache-dir -r requirements.txt" in dockerfile
+    assert 'CMD ["flask", "run", "--host=0.0.0.0"]' in dockerfile
+
+    makefile = render_local_file("Makefile", plan)
+    assert (
+        "install:  ## Install the dependencies\n\tpip install -r requirements.txt"
+        in makefile
+    )
+    assert "\tpytest" in makefile
+    assert "docker build -t joke-box ." in makefile
+
+    assert "The Joke Box Authors" in render_local_file("LICENSE", plan)
+
+
+def test_templates_that_dont_fit_are_left_to_the_llm():
+    go_plan = make_plan(stack={"programming_language": "Go", "framework": "gin"})
+    for filename in ["requirements.txt", "setup.py", "Dockerfile", "Makefile"]:
+        assert render_local_file(filename, go_plan) is None
+    assert render_local_file("LICENSE", make_plan(LICENSE="Apache 2.0 license")) is None
+    django_plan = make_plan(stack={**FLASK_STACK, "framework": "Django"})
+    assert render_local_file("Dockerfile", django_plan) is None
+    assert render_local_file("license_checker.py", make_plan()) is None
+
+
+def test_unknown_stacks_leave_requirements_to_the_llm():
+    for stack in [
+        {**FLASK_STACK, "framework": "argparse"},
+        {**FLASK_STACK, "framework": ""},
+        {**FLASK_STACK, "database": "Cassandra"},
+    ]:
+        plan = make_plan(stack=stack)
+        for filename in ["requirements.txt", "setup.py", "pyproject.toml"]:
+            assert render_local_file(filename, plan) is None
+    nose_plan = make_plan(stack={**FLASK_STACK, "testing_framework": "nose"})
+    assert render_local_file("requirements.txt", nose_plan) is None
+    sqlite_plan = make_plan(stack={**FLASK_STACK, "database": "SQLite"})
+    assert render_local_file("requirements.txt", sqlite_plan) == "flask\npytest\n"
+
+
+def test_pyproject_strings_are_escaped():
+    tomllib = pytest.importorskip("tomllib")
+    plan = make_plan()
+    plan.tagline = 'Jokes "on\\demand"\nevery\tday\x01'
+    pyproject = tomllib.loads(render_local_file("pyproject.toml", plan))
+    assert pyproject["project"]["description"] == plan.tagline
+
+
+@pytest.mark.parametrize(
+    ("filepath", "description", "expected"),
+    [
+        ("app/__init__.py", "", ""),
+        ("app/__init__.py", "Marks the directory as a Python package.", ""),
+        ("app/__init__.py", "Initializes the package", ""),
+        ("tests/__init__.py", "Initializes the test fixtures", ""),
+        ("app/__init__.py", "Initializes the Flask app", None),
+        ("app/__init__.py", "Initializes the package and exposes create_app", None),
+    ],
+)
+def test_empty_init(filepath, description, expected):
+    assert gen_empty_init(Path(filepath), description, make_plan()) == expected
+
+
+def test_llm_files_opt_out():
+    plan = make_plan()
+    backend = llm.FakeBackend(responses=["all:\n\techo hi\n"])
+    previous = llm.set_backend(backend)
+    try:
+        assert generate_file_contents("Makefile", plan, llm_files=["makefile"]) == (
+            "all:\n\techo hi"
+        )
+        assert generate_file_contents("setup.py", plan, llm_files=["makefile"]) == (
+            render_local_file("setup.py", plan)
+        )
+    finally:
+        llm.set_backend(previous)
+    assert len(backend.prompts) == 1
+
+
+def test_boilerplate_projects_need_no_completions(tmp_path, monkeypatch):
+    (tmp_path / "tmp").mkdir()
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path / "tmp"))
+    plan = make_plan(
+        **{"jokebox/": "", "jokebox/__init__.py": "", "tests/__init__.py": ""}
+    )
+    backend = llm.FakeBackend(responses=["should not be used"])
+    previous = llm.set_backend(backend)
+    try:
+        project_path = implement_project_plan(plan, str(tmp_path / "projects"))
+    finally:
+        llm.set_backend(previous)
+    assert backend.prompts == []
+    assert (Path(project_path) / "requirements.txt").read_text().startswith("flask")
@@ -0,0 +1,163 @@
+import time
+
+import orjson
+
+from hasty_coder import llm
+from hasty_coder.models import SoftwareProjectPlan, SoftwareStack
+from hasty_coder.prompt_reuse import ReuseCache
+from hasty_coder.tasklib.fragments import REQUIRED_PROJECT_FILES
+from hasty_coder.tasklib.generate_software_project_plan import (
+    generate_installation_instructions,
+    generate_project_plan,
+    generate_project_plan_fast,
+)
+from hasty_coder.utils import phraseify
+
+
+def test_loaded_plan_only_generates_missing_fields():
+    plan = SoftwareProjectPlan(
+        software_name="Shop",
+        short_description="sells things",
+        long_description="sells lots of things",
+        tagline="Buy",
+        emoji_tagline="🛒",
+        installation_instructions="pip install shop",
+        quick_start="shop run",
+        features={"Carts": "hold things"},
+        software_stack=SoftwareStack(
+            primary_programming_language="Python",
+            secondary_programming_languages=[],
+            primary_framework="Flask",
+            secondary_frameworks=[],
+            testing_tooling=["pytest"],
+        ),
+        project_files={"shop.py": "the shop"},
+    )
+    backend = llm.FakeBackend(responses=['["build it", "ship it"]'])
+    previous = llm.set_backend(backend)
+    try:
+        generated = generate_project_plan(project_plan=plan)
+    finally:
+        llm.set_backend(previous)
+
+    assert len(backend.prompts) == 1
+    assert generated.todo == ["build it", "ship it"]
+    assert generated.software_stack.primary_framework == "Flask"
+
+
+def test_project_specific_answers_are_not_reused(tmp_path, monkeypatch):
+    (tmp_path / "tmp").mkdir()
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path / "tmp"))
+    answers = iter(f"pip install shop{i}" for i in range(10))
+    backend = llm.FakeBackend(responses=lambda prompt: next(answers))
+    previous_backend = llm.set_backend(backend)
+    previous_reuse_cache = llm.set_reuse_cache(ReuseCache(min_answers=1))
+    try:
+        installs = [
+            generate_installation_instructions(
+                SoftwareProjectPlan(
+                    software_name="Shop", short_description="sells things"
+                )
+            )
+            for _ in range(2)
+        ]
+    finally:
+        llm.set_backend(previous_backend)
+        llm.set_reuse_cache(previous_reuse_cache)
+    assert installs == ["pip install shop0", "pip install shop1"]
+
+
+STACK = {
+    "project_type": "cli",
+    "programming_language": "python",
+    "framework": "click",
+    "database": None,
+    "testing_framework": "pytest",
+}
+FILES = {"shop/cli.py": "Runs the shop", "tests/test_cli.py": "Tests the cli"}
+
+
+def fake_planner(prompt):
+    """Answer both the staged and the single-shot plan prompts."""
+    if "PROJECT PLAN (json)" in prompt:
+        return orjson.dumps(
+            {
+                "short_description": "A shop in the terminal.",
+                "long_description": "Buy things without leaving the terminal.",
+                "software_name": "shop_keeper",
+                "tagline": "Retail therapy for hackers",
+                "emoji_tagline": "🛒 💻",
+                "software_stack": STACK,
+                # invalid, so it gets regenerated
+                "installation_instructions": 42,
+                "quick_start": "`shop`",
+                "features": ["Carts: hold things"],
+                "todo": ["build it"],
+                "project_files": FILES,
+            }
+        ).decode()
+    if "TECH STACK" in prompt:
+        return orjson.dumps(STACK).decode()
+    if "PROJECT FILES (json" in prompt:
+        return orjson.dumps(list(FILES)).decode()
+    if "FILE DESCRIPTIONS" in prompt:
+        return orjson.dumps(FILES).decode()
+    if "(in json format)" in prompt or "TODO LIST" in prompt:
+        return '["one thing", "another thing"]'
+    return "Some text about the shop"
+
+
+def generate_with_fake_planner(generate):
+    backend = llm.FakeBackend(responses=fake_planner)
+    previous = llm.set_backend(backend)
+    tokens_before = llm.token_usage.total_tokens
+    started_at = time.perf_counter()
+    try:
+        plan = generate("a shop in the terminal")
+    finally:
+        llm.set_backend(previous)
+    return plan, {
+        "calls": len(backend.prompts),
+        "tokens": llm.token_usage.total_tokens - tokens_before,
+        "seconds": time.perf_counter() - started_at,
+    }
+
+
+def test_fast_plan_repairs_invalid_fields():
+    plan, stats = generate_with_fake_planner(generate_project_plan_fast)
+    assert plan.software_name == phraseify("shop_keeper")
+    assert plan.emoji_tagline == "🛒💻"
+    assert plan.software_stack == STACK
+    assert plan.installation_instructions == "Some text about the shop"
+    assert set(REQUIRED_PROJECT_FILES) < set(plan.project_files)
+    assert plan.project_files["shop/cli.py"] == "Runs the shop"
+    # the plan, then the one invalid field
+    assert stats["calls"] == 2
+
+
+def test_fast_plan_benchmark():
+    """Compare the staged and single-shot plan modes."""
+    llm.clear_completion_cache()
+    staged_plan, staged = generate_with_fake_planner(generate_project_plan)
+    fast_plan, fast = generate_with_fake_planner(generate_project_plan_fast)
+    print(f"\nstaged: {staged}\nfast:   {fast}")
+
+    assert set(fast_plan.project_files) == set(staged_plan.project_files)
+    assert fast["calls"] < staged["calls"]
+    assert fast["tokens"] < staged["tokens"]
+
+
+def test_fast_plan_falls_back_to_staged_generation():
+    def broken(prompt):
+        if "PROJECT PLAN (json)" in prompt:
+            return "not json at all"
+        return fake_planner(prompt)
+
+    backend = llm.FakeBackend(responses=broken)
+    previous = llm.set_backend(backend)
+    try:
+        plan = generate_project_plan_fast("a shop in the terminal")
+    finally:
+        llm.set_backend(previous)
+    assert plan.software_stack == STACK
+    assert plan.todo == ["one thing", "another thing"]
@@ -0,0 +1,174 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from hasty_coder import llm
+from hasty_coder.langlib.python import get_func_and_class_snippets
+from hasty_coder.tasklib import generate_tests
+from hasty_coder.tasklib.generate_tests import (
+    ValidationResult,
+    generate_tests_for_snippets,
+    output_filename_for_snippet,
+    validate_test_code,
+    write_tests_for_path,
+)
+
+SOURCE = '''
+def double(x):
+    """Double a number."""
+    return x * 2
+
+
+def _private(x):
+    return x
+'''
+
+FAILING_TEST = """
+from pkg.mathy import double
+
+
+def test_double():
+    assert double(2) == 5
+"""
+
+PASSING_TEST = """```python
+from pkg.mathy import double
+
+
+def test_double():
+    assert double(2) == 4
+```"""
+
+
+@pytest.fixture(name="project_path")
+def project_path_fixture(tmp_path, monkeypatch):
+    (tmp_path / "tmp").mkdir()
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path / "tmp"))
+    project_path = tmp_path / "project"
+    (project_path / ".git").mkdir(parents=True)
+    (project_path / "pkg").mkdir()
+    (project_path / "pkg" / "__init__.py").write_text("", encoding="utf-8")
+    (project_path / "pkg" / "mathy.py").write_text(SOURCE, encoding="utf-8")
+    return project_path
+
+
+def test_validate_test_code_stages(project_path):
+    result = validate_test_code("def test_x(:\n", str(project_path))
+    assert (result.passed, result.stage) == (False, "compile")
+
+    result = validate_test_code(FAILING_TEST, str(project_path))
+    assert (result.passed, result.stage) == (False, "run")
+    assert "assert 4 == 5" in result.error
+
+    hanging_test = "import time\n\ndef test_hang():\n    time.sleep(30)\n"
+    result = validate_test_code(hanging_test, str(project_path), per_test_timeout=1)
+    assert "TimeoutError" in result.error
+
+
+def test_write_tests_retries_with_error(project_path):
+    def respond(prompt):
+        return PASSING_TEST if "assert 4 == 5" in prompt else FAILING_TEST
+
+    backend = llm.FakeBackend(responses=respond)
+    previous = llm.set_backend(backend)
+    try:
+        results = write_tests_for_path(project_path / "pkg", max_validation_workers=1)
+    finally:
+        llm.set_backend(previous)
+
+    assert [(r.passed, r.attempts) for r in results] == [(True, 2)]
+    assert "from pkg.mathy import double" in backend.prompts[0]
+    test_path = project_path / "tests" / "generated" / "test_pkg__mathy__double.py"
+    assert "assert double(2) == 4" in test_path.read_text(encoding="utf-8")
+
+
+def test_output_filenames_are_unique(tmp_path):
+    classes_source = """
+class Cart:
+    def add(self, item):
+        pass
+
+
+class Wishlist:
+    @property
+    def add(self):
+        pass
+"""
+    for package in ("shop", "admin"):
+        (tmp_path / package).mkdir()
+        (tmp_path / package / "cart.py").write_text(classes_source, encoding="utf-8")
+
+    filenames = []
+    for package in ("shop", "admin"):
+        filepath = str(tmp_path / package / "cart.py")
+        for snippet in get_func_and_class_snippets(classes_source, filepath):
+            if snippet.code_text.lstrip().startswith(("def", "@")):
+                filenames.append(output_filename_for_snippet(snippet, str(tmp_path)))
+
+    assert sorted(filenames) == [
+        "test_admin__cart__Cart__add.py",
+        "test_admin__cart__Wishlist__add.py",
+        "test_shop__cart__Cart__add.py",
+        "test_shop__cart__Wishlist__add.py",
+    ]
+
+
+def test_validate_test_code_keeps_pythonpath(project_path, tmp_path, monkeypatch):
+    extra_path = tmp_path / "extra"
+    extra_path.mkdir()
+    (extra_path / "helpers.py").write_text("TWO = 2\n", encoding="utf-8")
+    monkeypatch.setenv("PYTHONPATH", str(extra_path))
+    test_code = PASSING_TEST.strip("`").replace("python\n", "", 1)
+    test_code = "from helpers import TWO\n" + test_code.replace(
+        "double(2)", "double(TWO)"
+    )
+    result = validate_test_code(test_code, str(project_path))
+    assert (result.passed, result.error) == (True, "")
+
+
+class CrashingOncePool:
+    """Run validations in-process, except the first, which dies like a killed worker process."""
+
+    crashed = False
+
+    def __init__(self, **kwargs):
+        pass
+
+    def submit(self, func, *args):
+        future = Future()
+        if not CrashingOncePool.crashed:
+            CrashingOncePool.crashed = True
+            future.set_exception(BrokenProcessPool("a validator died"))
+        else:
+            future.set_result(func(*args))
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def test_validator_crash_is_recorded(project_path, monkeypatch):
+    monkeypatch.setattr(generate_tests, "ProcessPoolExecutor", CrashingOncePool)
+    monkeypatch.setattr(
+        generate_tests,
+        "validate_test_code",
+        lambda test_code, *args: ValidationResult(True, test_code),
+    )
+    monkeypatch.setattr(
+        generate_tests,
+        "write_test_for_snippet",
+        lambda snippet, *args: f"# test for {snippet.start_line}",
+    )
+    snippets = get_func_and_class_snippets(SOURCE, str(project_path / "pkg/mathy.py"))
+    results = list(
+        generate_tests_for_snippets(
+            snippets, str(project_path), max_generation_workers=1
+        )
+    )
+
+    assert len(results) == 2
+    crashed, passed = sorted(results, key=lambda r: r.passed)
+    assert not crashed.passed
+    assert "validation crashed" in crashed.errors[0]
+    assert passed.passed
@@ -0,0 +1,92 @@
+import orjson
+import pytest
+
+from hasty_coder import llm
+from hasty_coder.models import SoftwareProjectPlan, SoftwareStack
+from hasty_coder.tasklib.implement_software_project import (
+    implement_project_plan,
+    resume_project,
+)
+from hasty_coder.tasklib.project_journal import (
+    DONE,
+    FAILED,
+    JOURNAL_FILENAME,
+    JournalNotFound,
+    ProjectJournal,
+)
+
+
+@pytest.fixture(name="plan")
+def plan_fixture(tmp_path, monkeypatch):
+    (tmp_path / "tmp").mkdir()
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path / "tmp"))
+    return SoftwareProjectPlan(
+        software_name="Shop",
+        software_stack=SoftwareStack(
+            primary_programming_language="Python",
+            secondary_programming_languages=[],
+            primary_framework="Flask",
+            secondary_frameworks=[],
+            testing_tooling=["pytest"],
+        ),
+        project_files={
+            "shop/": "the package",
+            "shop/db.py": "database access",
+            "shop/cart.py": "shopping cart",
+        },
+    )
+
+
+def run_with_backend(backend, func, *args):
+    previous = llm.set_backend(backend)
+    try:
+        return func(*args)
+    finally:
+        llm.set_backend(previous)
+
+
+def test_resume_only_generates_unfinished_files(plan, tmp_path):
+    def flaky(prompt):
+        if "shop/cart.py file" in prompt:
+            raise RuntimeError("rate limited")
+        return "x = 1\n"
+
+    with pytest.raises(RuntimeError):
+        run_with_backend(
+            llm.FakeBackend(responses=flaky),
+            implement_project_plan,
+            plan,
+            str(tmp_path),
+        )
+    project_path = tmp_path / "shop"
+    journal = orjson.loads((project_path / JOURNAL_FILENAME).read_bytes())
+    assert journal["plan"]["software_stack"]["primary_programming_language"] == "Python"
+    assert journal["files"]["shop/db.py"]["state"] == DONE
+    assert journal["files"]["shop/cart.py"]["state"] == FAILED
+
+    backend = llm.FakeBackend(responses=lambda prompt: "y = 2\n")
+    journal = run_with_backend(backend, resume_project, str(project_path))
+    assert len(backend.prompts) == 1
+    assert "shop/cart.py file" in backend.prompts[0]
+    assert (project_path / "shop" / "cart.py").read_text() == "y = 2\n"
+    assert (project_path / "shop" / "db.py").read_text() == "x = 1\n"
+    assert journal.unfinished_filepaths() == []
+    # resuming didn't start a new timestamped folder
+    assert [p.name for p in tmp_path.iterdir() if p.name != "tmp"] == ["shop"]
+
+
+def test_missing_and_in_flight_files_are_unfinished(plan, tmp_path):
+    journal = ProjectJournal.create(str(tmp_path), plan, ["a.py", "b.py", "c.py"])
+    (tmp_path / "a.py").write_text("a = 1\n")
+    journal.mark_done("a.py", "a = 1\n")
+    journal.mark_done("b.py", "b = 1\n")
+    journal.mark_in_flight("c.py")
+
+    journal = ProjectJournal.load(str(tmp_path))
+    assert journal.project_plan == plan
+    assert journal.unfinished_filepaths() == ["b.py", "c.py"]
+
+
+def test_resume_needs_a_journal(tmp_path):
+    with pytest.raises(JournalNotFound):
+        resume_project(str(tmp_path))
@@ -0,0 +1,115 @@
+from hasty_coder import llm
+from hasty_coder.tasklib import review_scheduler
+from hasty_coder.tasklib.review_scheduler import (
+    ReviewBudget,
+    ReviewCoverage,
+    rank_snippets_in_path,
+    review_path_prioritized,
+)
+
+simple_code = '''
+def add(a, b):
+    """Add two numbers."""
+    return a + b
+'''
+
+risky_code = """
+def parse(rows):
+    out = []
+    for row in rows:
+        if row and row[0] == "#":
+            continue
+        try:
+            for cell in row.split(","):
+                if cell.strip() or cell == "0":
+                    out.append(int(cell))
+        except ValueError:
+            pass
+    return out
+"""
+
+
+def _write_project(tmp_path):
+    (tmp_path / "simple.py").write_text(simple_code, encoding="utf-8")
+    (tmp_path / "risky.py").write_text(risky_code, encoding="utf-8")
+    (tmp_path / "notes.txt").write_text("not python", encoding="utf-8")
+
+
+def test_rank_snippets_riskiest_first(tmp_path):
+    _write_project(tmp_path)
+    ranked = rank_snippets_in_path(tmp_path)
+    assert [r.snippet.filepath.rsplit("/", 1)[-1] for r in ranked] == [
+        "risky.py",
+        "simple.py",
+    ]
+    assert ranked[0].missing_docstring
+    assert not ranked[1].missing_docstring
+
+
+def test_review_stops_at_token_budget(tmp_path, monkeypatch):
+    _write_project(tmp_path)
+    reviewed = []
+
+    def fake_review_snippet(code_snippet, line_offset=0):
+        reviewed.append(code_snippet)
+        llm.token_usage.add(prompt_tokens=1000)
+        return []
+
+    monkeypatch.setattr(review_scheduler, "review_snippet", fake_review_snippet)
+    coverage = ReviewCoverage()
+    budget = ReviewBudget(max_tokens=1500)
+    results = list(review_path_prioritized(tmp_path, budget, coverage))
+
+    assert len(results) == 1
+    assert "def parse" in reviewed[0]
+    assert coverage.snippets_reviewed == 1
+    assert coverage.snippets_total == 2
+    assert coverage.tokens_spent == 1000
+    assert coverage.stopped_by == "tokens"
+    assert "Reviewed 1/2 snippets" in coverage.summary()
+
+
+def test_duplicates_share_a_review_without_using_budget(tmp_path, monkeypatch):
+    (tmp_path / "risky.py").write_text(risky_code, encoding="utf-8")
+    (tmp_path / "risky_copy.py").write_text(
+        risky_code.replace("rows", "lines"), encoding="utf-8"
+    )
+    reviewed = []
+
+    def fake_review_snippet(code_snippet, line_offset=0):
+        reviewed.append(code_snippet)
+        llm.token_usage.add(prompt_tokens=1000)
+        return [(1, "careful")]
+
+    monkeypatch.setattr(review_scheduler, "review_snippet", fake_review_snippet)
+    coverage = ReviewCoverage()
+    results = list(
+        review_path_prioritized(tmp_path, ReviewBudget(max_tokens=1500), coverage)
+    )
+
+    assert len(reviewed) == 1
+    assert [comments for _, comments in results] == [[(3, "careful")]] * 2
+    assert coverage.snippets_reviewed == 2
+    assert coverage.stopped_by is None
+
+
+def test_review_skips_snippets_that_dont_fit(tmp_path, monkeypatch):
+    _write_project(tmp_path)
+    reviewed = []
+
+    def fake_review_snippet(code_snippet, line_offset=0):
+        reviewed.append(code_snippet)
+        return []
+
+    monkeypatch.setattr(review_scheduler, "review_snippet", fake_review_snippet)
+    ranked = rank_snippets_in_path(tmp_path)
+    budget = ReviewBudget(max_tokens=ranked[1].estimated_tokens)
+    coverage = ReviewCoverage()
+    results = list(review_path_prioritized(tmp_path, budget, coverage))
+
+    # the risky snippet is too big for the budget but the simple one after it fits
+    assert [snippet.filepath for snippet, _ in results] == [ranked[1].snippet.filepath]
+    assert [r.snippet.filepath for r in coverage.skipped] == [
+        ranked[0].snippet.filepath
+    ]
+    assert coverage.stopped_by == "tokens"
@@ -0,0 +1,111 @@
+import os
+import shutil
+import time
+
+import pytest
+
+from hasty_coder import llm
+from hasty_coder.models import SoftwareProjectPlan
+from hasty_coder.tasklib import validate_files
+from hasty_coder.tasklib.implement_software_project import implement_project_plan
+from hasty_coder.tasklib.project_journal import ProjectJournal
+from hasty_coder.tasklib.validate_files import FileValidator, validate_file
+
+
+@pytest.fixture(autouse=True)
+def temp_dir(tmp_path, monkeypatch):
+    (tmp_path / "tmp").mkdir()
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path / "tmp"))
+
+
+def test_python_is_compiled_and_formatted():
+    validation = validate_file("app/main.py", "x=[1,\n2]")
+    assert validation.passed
+    assert validation.contents == "x = [1, 2]\n"
+
+    validation = validate_file("app/main.py", "def broken(:\n")
+    assert not validation.passed
+    assert validation.stage == "compile"
+
+
+@pytest.mark.parametrize(
+    ("filepath", "contents", "passed"),
+    [
+        ("package.json", '{"name": "app"}', True),
+        ("package.json", "{'name': 'app'}", False),
+        ("config.yml", "key: [unclosed", False),
+        ("notes.txt", "anything {[", True),
+    ],
+)
+def test_other_files_are_parsed(filepath, contents, passed):
+    assert validate_file(filepath, contents).passed == passed
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs node")
+def test_javascript_is_syntax_checked():
+    assert validate_file("app.js", "const x = 1;\n").passed
+    validation = validate_file("app.js", "const = ;\n")
+    assert not validation.passed
+    assert "app.js" in validation.error
+
+
+def test_results_are_cached_by_content(monkeypatch):
+    with FileValidator(max_workers=1) as validator:
+        assert validator.submit("app/main.py", "x=1").result().contents == "x = 1\n"
+
+    def fail(*args):
+        raise AssertionError("should have been cached")
+
+    monkeypatch.setattr(validate_files.ProcessPoolExecutor, "submit", fail)
+    with FileValidator(max_workers=1) as validator:
+        assert validator.submit("other/path.py", "x=1").result().contents == "x = 1\n"
+
+
+def test_cache_key_includes_tool_versions(monkeypatch):
+    key = validate_files.validation_cache_key("app/main.py", "x=1")
+    versions = {"black": "99.0", "pyflakes": "1.0"}
+    monkeypatch.setattr(validate_files.metadata, "version", versions.get)
+    validate_files._tool_versions.cache_clear()  # pylint: disable=protected-access
+    try:
+        upgraded_key = validate_files.validation_cache_key("app/main.py", "x=1")
+    finally:
+        validate_files._tool_versions.cache_clear()  # pylint: disable=protected-access
+    assert upgraded_key != key
+
+
+def test_cache_keeps_recently_used_results(monkeypatch):
+    monkeypatch.setattr(validate_files, "MAX_CACHED_VALIDATIONS", 2)
+    with FileValidator(max_workers=1) as validator:
+        for i in range(4):
+            validator.submit("notes.txt", f"note {i}").result()
+            time.sleep(0.01)
+
+    assert len(os.listdir(validate_files.get_cache_dir())) == 2
+    kept = [
+        validate_files._load_cached(  # pylint: disable=protected-access
+            validate_files.validation_cache_key("notes.txt", f"note {i}")
+        )
+        is not None
+        for i in range(4)
+    ]
+    assert kept == [False, False, True, True]
+
+
+def test_files_failing_validation_are_regenerated(tmp_path):
+    plan = SoftwareProjectPlan(
+        software_name="Shop",
+        project_files={"shop/": "", "shop/main.py": "Runs the shop"},
+    )
+    responses = ["def main(:\n    pass", "def main():\n  return 1"]
+    backend = llm.FakeBackend(responses=responses)
+    previous = llm.set_backend(backend)
+    try:
+        project_path = implement_project_plan(plan, str(tmp_path / "projects"))
+    finally:
+        llm.set_backend(previous)
+
+    assert len(backend.prompts) == 2
+    assert "compile failed" in backend.prompts[1]
+    with open(f"{project_path}/shop/main.py", encoding="utf-8") as f:
+        assert f.read() == "def main():\n    return 1\n"
+    assert ProjectJournal.load(project_path).files["shop/main.py"]["state"] == "done"
@@ -0,0 +1,130 @@
+"""
+Startup benchmark for the `hc` command.
+
+`hc` is called many times in scripts so starting a command must not import the heavy dependencies.
+Set HASTY_CODER_STARTUP_BUDGET_MS to change the time budget.
+
+Commands import their implementations once they run, so that cost is budgeted separately: each command's
+imports are timed in a fresh interpreter against HASTY_CODER_COMMAND_IMPORT_BUDGET_MS.
+"""
+import ast
+import os
+import subprocess
+import sys
+
+import orjson
+import pytest
+
+from hasty_coder import cli as cli_module
+from hasty_coder.cli import cli
+
+STARTUP_BUDGET_MS = float(os.getenv("HASTY_CODER_STARTUP_BUDGET_MS", "400"))
+COMMAND_IMPORT_BUDGET_MS = float(
+    os.getenv("HASTY_CODER_COMMAND_IMPORT_BUDGET_MS", "1000")
+)
+HEAVY_MODULES = ["black", "pathspec", "requests"]
+
+STARTUP_SCRIPT = """
+import sys
+import time
+
+import orjson
+
+started_at = time.perf_counter()
+from hasty_coder.cli import cli
+
+try:
+    cli.main(args=sys.argv[1:], prog_name="hc", standalone_mode=False)
+except SystemExit:
+    pass
+elapsed_ms = (time.perf_counter() - started_at) * 1000
+heavy_modules = [m for m in {heavy_modules!r} if m in sys.modules]
+print(orjson.dumps({{"ms": elapsed_ms, "heavy_modules": heavy_modules}}).decode())
+"""
+
+
+def measure_startup(args, runs=3):
+    """Return the fastest of several startup times (ms) and the heavy modules that got imported."""
+    script = STARTUP_SCRIPT.format(heavy_modules=HEAVY_MODULES)
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", script, *args],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        results.append(orjson.loads(output.strip().splitlines()[-1]))
+    return min(r["ms"] for r in results), results[0]["heavy_modules"]
+
+
+@pytest.mark.parametrize(
+    "args",
+    [pytest.param(["--help"], id="--help")]
+    + [pytest.param([name, "--help"], id=name) for name in sorted(cli.commands)],
+)
+def test_command_startup_budget(args):
+    elapsed_ms, heavy_modules = measure_startup(args)
+    print(f"hc {' '.join(args)}: {elapsed_ms:.0f}ms")
+    assert heavy_modules == []
+    assert elapsed_ms < STARTUP_BUDGET_MS
+
+
+IMPORT_SCRIPT = """
+import importlib
+import sys
+import time
+
+import orjson
+
+import hasty_coder.cli
+
+started_at = time.perf_counter()
+for module_name in sys.argv[1:]:
+    importlib.import_module(module_name)
+elapsed_ms = (time.perf_counter() - started_at) * 1000
+print(orjson.dumps({"ms": elapsed_ms, "black": "black" in sys.modules}).decode())
+"""
+
+
+def command_implementation_modules():
+    """Return {command function name: modules it imports when it runs}, read from cli.py."""
+    with open(cli_module.__file__, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    modules = {}
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.decorator_list:
+            modules[node.name] = sorted(
+                {n.module for n in ast.walk(node) if isinstance(n, ast.ImportFrom)}
+            )
+    return modules
+
+
+def measure_imports(module_names, runs=3):
+    """Return the fastest of several times (ms) to import modules after the cli, and if black came with them."""
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SCRIPT, *module_names],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        results.append(orjson.loads(output.strip().splitlines()[-1]))
+    return min(r["ms"] for r in results), results[0]["black"]
+
+
+@pytest.mark.parametrize(
+    "command",
+    [
+        pytest.param(command, id=command.name)
+        for command in sorted(cli.commands.values(), key=lambda c: c.name)
+    ],
+)
+def test_command_import_budget(command):
+    module_names = command_implementation_modules()[command.callback.__name__]
+    elapsed_ms, imported_black = measure_imports(module_names)
+    print(f"hc {command.name} imports {module_names}: {elapsed_ms:.0f}ms")
+    # only formatting needs black, so it's imported when code is formatted
+    assert not imported_black
+    assert elapsed_ms < COMMAND_IMPORT_BUDGET_MS
@@ -0,0 +1,95 @@
+import io
+import json
+import os
+import socket
+import stat
+import threading
+
+import pytest
+
+from hasty_coder.daemon import (
+    forward_to_daemon,
+    get_socket_path,
+    make_private_dir_for_socket,
+    make_server,
+    settings_env_digest,
+)
+
+
+@pytest.fixture(name="socket_path")
+def socket_path_fixture(tmp_path):
+    socket_path = str(tmp_path / "hc.sock")
+    server = make_server(socket_path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield socket_path
+    server.shutdown()
+    server.server_close()
+
+
+def test_no_daemon_running(tmp_path):
+    assert forward_to_daemon(["--help"], str(tmp_path / "missing.sock")) is None
+
+
+def test_forward_help(socket_path):
+    output = io.StringIO()
+    assert forward_to_daemon(["lint", "--help"], socket_path, stdout=output) == 0
+    assert "Riskiest code is reviewed first" in output.getvalue()
+
+
+def test_forward_uses_client_cwd(socket_path, tmp_path, monkeypatch):
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+    monkeypatch.chdir(project_path)
+    output = io.StringIO()
+    assert forward_to_daemon(["lint", "."], socket_path, stdout=output) == 0
+    assert "Reviewed 0/0 snippets" in output.getvalue()
+
+
+def test_forward_reports_usage_errors(socket_path):
+    output = io.StringIO()
+    assert (
+        forward_to_daemon(["lint", "/does/not/exist"], socket_path, stdout=output) == 2
+    )
+    assert "does not exist" in output.getvalue()
+
+
+def test_local_only_commands_are_not_forwarded(socket_path):
+    assert forward_to_daemon(["comments", "."], socket_path) is None
+
+
+def test_different_settings_run_locally(socket_path):
+    # the test daemon shares our env, so pretend to be a client with other settings
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(socket_path)
+    with client:
+        request = {"argv": ["lint", "--help"], "cwd": ".", "env_digest": "other"}
+        client.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        replies = [json.loads(line) for line in client.makefile("r")]
+    assert replies == [{"run_locally": True}]
+
+
+def test_settings_env_digest():
+    environ = {"OPENAI_API_KEY": "sk-a", "HOME": "/home/a", "HASTY_CODER_SOCKET": "a"}
+    digest = settings_env_digest(environ)
+    assert digest == settings_env_digest(
+        {**environ, "HOME": "/b", "HASTY_CODER_SOCKET": "b"}
+    )
+    assert "sk-a" not in digest
+    assert digest != settings_env_digest({**environ, "OPENAI_API_KEY": "sk-b"})
+
+
+def test_default_socket_is_in_a_private_folder(tmp_path, monkeypatch):
+    monkeypatch.delenv("HASTY_CODER_SOCKET", raising=False)
+    monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+    socket_path = get_socket_path()
+    socket_dir = os.path.dirname(socket_path)
+    assert os.path.dirname(socket_dir) == str(tmp_path)
+
+    make_private_dir_for_socket(socket_path)
+    assert stat.S_IMODE(os.stat(socket_dir).st_mode) == 0o700
+
+    os.chmod(socket_dir, 0o777)
+    with pytest.raises(PermissionError):
+        make_private_dir_for_socket(socket_path)
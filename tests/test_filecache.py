@@ -0,0 +1,240 @@
+import gzip
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import md5
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import orjson
+import pytest
+
+from hasty_coder import filecache
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, content):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+
+@pytest.fixture(name="fake_get")
+def fake_get_fixture(tmp_path, monkeypatch):
+    monkeypatch.setattr(filecache, "get_cache_dir", lambda: str(tmp_path))
+    filecache.clear_memory_cache()
+    calls = []
+    release = threading.Event()
+    release.set()
+
+    def fake_get(url, headers=None, timeout=None):
+        calls.append(url)
+        release.wait(5)
+        return FakeResponse(f"contents {len(calls)}".encode("utf-8"))
+
+    monkeypatch.setattr(filecache._session, "get", fake_get)
+    yield calls, release
+    filecache.clear_memory_cache()
+
+
+def test_concurrent_requests_share_one_download(fake_get):
+    calls, release = fake_get
+    release.clear()
+    with ThreadPoolExecutor(max_workers=8) as e:
+        futures = [
+            e.submit(filecache.get_cached_url_contents, "http://example.com/a")
+            for _ in range(8)
+        ]
+        time.sleep(0.1)
+        release.set()
+        results = [f.result() for f in futures]
+
+    assert calls == ["http://example.com/a"]
+    assert set(results) == {b"contents 1"}
+
+
+def test_memory_layer_skips_disk(fake_get, tmp_path):
+    calls, _ = fake_get
+    filecache.get_cached_url_contents("http://example.com/a")
+    for cache_file in tmp_path.iterdir():
+        if cache_file.name != filecache.INDEX_FILENAME:
+            cache_file.unlink()
+    assert filecache.get_cached_url_contents("http://example.com/a") == b"contents 1"
+    assert len(calls) == 1
+
+
+def test_stale_entries_are_served_while_refreshing(fake_get, tmp_path):
+    calls, _ = fake_get
+    filecache.get_cached_url_contents("http://example.com/a")
+    filecache.clear_memory_cache()
+    (cache_file,) = [p for p in tmp_path.iterdir() if p.name != "index.json"]
+    cache_file.write_bytes(b"contents 1")
+    (tmp_path / "index.json").unlink()
+    an_hour_ago = time.time() - 3600
+    os.utime(cache_file, (an_hour_ago, an_hour_ago))
+
+    contents = filecache.get_cached_url_contents(
+        "http://example.com/a", cache_duration_seconds=60
+    )
+    assert contents == b"contents 1"
+
+    for _ in range(50):
+        if len(calls) == 2 and filecache.get_cached_url_contents(
+            "http://example.com/a"
+        ) == (b"contents 2"):
+            break
+        time.sleep(0.02)
+    filecache.clear_memory_cache()
+    assert filecache.get_cached_url_contents("http://example.com/a") == b"contents 2"
+
+
+def test_prefetch_urls(fake_get):
+    calls, _ = fake_get
+    futures = filecache.prefetch_urls(["http://example.com/a", "http://example.com/b"])
+    assert {f.result() for f in futures} == {b"contents 1", b"contents 2"}
+    filecache.get_cached_url_contents("http://example.com/a")
+    assert sorted(calls) == ["http://example.com/a", "http://example.com/b"]
+
+
+class TemplateHandler(BaseHTTPRequestHandler):
+    etag = '"v1"'
+    body = b"*.pyc\n" * 100
+    requests_seen = []
+
+    def do_GET(self):  # noqa
+        self.requests_seen.append((self.path, self.headers.get("If-None-Match")))
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):  # noqa
+        pass
+
+
+@pytest.fixture(name="http_server")
+def http_server_fixture(tmp_path, monkeypatch):
+    monkeypatch.setattr(filecache, "get_cache_dir", lambda: str(tmp_path))
+    filecache.clear_memory_cache()
+    TemplateHandler.requests_seen = []
+    server = HTTPServer(("127.0.0.1", 0), TemplateHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    filecache.clear_memory_cache()
+
+
+def test_cache_is_compressed_and_indexed(http_server, tmp_path):
+    url = f"{http_server}/Python.gitignore"
+    assert filecache.get_cached_url_contents(url) == TemplateHandler.body
+
+    index = orjson.loads((tmp_path / "index.json").read_bytes())
+    (entry,) = index.values()
+    assert entry["url"] == url
+    assert entry["etag"] == '"v1"'
+    assert entry["size"] < len(TemplateHandler.body)
+
+
+def test_expired_entry_is_revalidated_with_304(http_server, tmp_path):
+    url = f"{http_server}/Python.gitignore"
+    filecache.get_cached_url_contents(url)
+    filecache.clear_memory_cache()
+    (cache_file,) = [p for p in tmp_path.iterdir() if p.name != "index.json"]
+    stored_bytes = cache_file.read_bytes()
+
+    contents = filecache.get_cached_url_contents(
+        url, cache_duration_seconds=0, stale_while_revalidate=False
+    )
+
+    assert contents == TemplateHandler.body
+    assert TemplateHandler.requests_seen[-1] == ("/Python.gitignore", '"v1"')
+    assert cache_file.read_bytes() == stored_bytes
+
+
+def test_least_recently_used_entries_are_evicted(http_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(filecache, "MAX_CACHE_ENTRIES", 2)
+    for name in ["a", "b"]:
+        filecache.get_cached_url_contents(f"{http_server}/{name}")
+        time.sleep(0.01)
+    filecache.get_cached_url_contents(f"{http_server}/a")
+    time.sleep(0.01)
+    filecache.get_cached_url_contents(f"{http_server}/c")
+
+    index = orjson.loads((tmp_path / "index.json").read_bytes())
+    assert sorted(e["url"].rsplit("/", 1)[-1] for e in index.values()) == ["a", "c"]
+    assert len([p for p in tmp_path.iterdir() if p.name != "index.json"]) == 2
+
+
+def test_entry_written_by_another_process_is_decompressed(http_server, tmp_path):
+    url = f"{http_server}/Python.gitignore"
+    key = md5(url.encode("utf-8")).hexdigest()
+    # another process cached it, but hasn't written its index yet
+    for codec, data in [
+        ("gzip", gzip.compress(b"from elsewhere")),
+        filecache._compress(b"from elsewhere"),  # pylint: disable=protected-access
+    ]:
+        filecache.clear_memory_cache()
+        (tmp_path / key).write_bytes(data)
+        assert filecache.get_cached_url_contents(url) == b"from elsewhere", codec
+    assert TemplateHandler.requests_seen == []
+
+
+def test_eviction_counts_files_from_other_processes(http_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(filecache, "MAX_CACHE_ENTRIES", 2)
+    old = time.time() - 2 * filecache.ORPHANED_TEMP_FILE_SECONDS
+    for age, name in enumerate(["tmpcrashed", "1" * 32, "0" * 32]):
+        (tmp_path / name).write_bytes(b"unindexed")
+        os.utime(tmp_path / name, (old - age, old - age))
+    (tmp_path / "tmpinprogress").write_bytes(b"being written")
+
+    filecache.get_cached_url_contents(f"{http_server}/a")
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(
+        ["1" * 32, md5(f"{http_server}/a".encode()).hexdigest()]
+        + ["index.json", "tmpinprogress"]
+    )
+
+
+def test_memory_layer_is_bounded(fake_get, monkeypatch):
+    calls, _ = fake_get
+    monkeypatch.setattr(filecache, "MAX_MEMORY_CACHE_BYTES", 25)
+    for name in "abc":
+        filecache.get_cached_url_contents(f"http://example.com/{name}")
+    # "contents N" is 10 bytes, so only the two most recent fit
+    assert len(filecache._memory_cache) == 2
+    assert filecache._memory_cache_bytes == 20
+    # the evicted one is still on disk
+    assert filecache.get_cached_url_contents("http://example.com/a") == b"contents 1"
+    assert len(calls) == 3
+
+
+def test_eviction_scans_without_the_lock(fake_get, monkeypatch):
+    lock_free_during_scan = []
+    real_scandir = os.scandir
+
+    def checking_scandir(path):
+        # the lock is reentrant, so check from another thread
+        def try_lock():
+            acquired = filecache._lock.acquire(blocking=False)
+            if acquired:
+                filecache._lock.release()
+            lock_free_during_scan.append(acquired)
+
+        thread = threading.Thread(target=try_lock)
+        thread.start()
+        thread.join()
+        return real_scandir(path)
+
+    monkeypatch.setattr(filecache.os, "scandir", checking_scandir)
+    filecache.get_cached_url_contents("http://example.com/a")
+    assert lock_free_during_scan == [True]
@@ -0,0 +1,109 @@
+from pathlib import Path
+
+import pytest
+
+from hasty_coder import filecache, gitignore_pack, llm
+from hasty_coder.gitignore_pack import GitignorePack, build_gitignore_pack
+from hasty_coder.models import SoftwareProjectPlan
+from hasty_coder.tasklib.filegen_handlers import gen_gitignore
+from hasty_coder.tasklib.implement_software_project import implement_project_plan
+
+
+@pytest.fixture(name="mirror")
+def mirror_fixture(tmp_path):
+    mirror = tmp_path / "gitignore"
+    (mirror / "Global").mkdir(parents=True)
+    (mirror / "community").mkdir()
+    (mirror / ".github").mkdir()
+    (mirror / "Python.gitignore").write_text("__pycache__/\n")
+    (mirror / "Node.gitignore").write_text("node_modules/\n")
+    (mirror / "Global" / "macOS.gitignore").write_text(".DS_Store\n")
+    (mirror / "community" / "Python.gitignore").write_text("not this one\n")
+    (mirror / "README.md").write_text("readme")
+    return mirror
+
+
+def test_build_and_lookup(mirror, tmp_path):
+    pack_path = tmp_path / "templates.pack"
+    assert build_gitignore_pack(mirror, pack_path) == 4
+
+    pack = GitignorePack(pack_path)
+    assert pack.get("Python") == "__pycache__/\n"
+    assert pack.get("python3") == "__pycache__/\n"
+    assert pack.get("TypeScript") == "node_modules/\n"
+    assert pack.get("Global/macOS") == ".DS_Store\n"
+    assert pack.get("community/Python") == "not this one\n"
+    assert "cobol" not in pack
+    assert pack.get("cobol") is None
+    pack.close()
+
+
+def test_gen_gitignore_without_network(mirror, tmp_path, monkeypatch):
+    pack_path = tmp_path / "templates.pack"
+    build_gitignore_pack(mirror, pack_path)
+    monkeypatch.setenv("HASTY_CODER_GITIGNORE_PACK", str(pack_path))
+    monkeypatch.delenv("HASTY_CODER_GITIGNORE_NETWORK", raising=False)
+    gitignore_pack.get_gitignore_pack.cache_clear()
+    gen_gitignore.build_default_gitignore.cache_clear()
+
+    def no_network(*args, **kwargs):
+        raise AssertionError("network should not be used")
+
+    monkeypatch.setattr(filecache._session, "get", no_network)
+    try:
+        contents = gen_gitignore.gen_gitignore_for_language("Python")
+        assert "## Global/macOS\n.DS_Store" in contents
+        assert contents.endswith("__pycache__/\n")
+        assert gen_gitignore.prefetch_gitignore_templates() == []
+    finally:
+        gitignore_pack.get_gitignore_pack.cache_clear()
+        gen_gitignore.build_default_gitignore.cache_clear()
+
+
+def test_gen_gitignore_needs_a_pack_or_network(tmp_path, monkeypatch):
+    monkeypatch.setenv("HASTY_CODER_GITIGNORE_PACK", str(tmp_path / "missing.pack"))
+    monkeypatch.delenv("HASTY_CODER_GITIGNORE_NETWORK", raising=False)
+    gitignore_pack.get_gitignore_pack.cache_clear()
+
+    def no_network(*args, **kwargs):
+        raise AssertionError("network should not be used")
+
+    monkeypatch.setattr(filecache._session, "get", no_network)
+    try:
+        assert not gen_gitignore.network_allowed()
+        assert gen_gitignore.prefetch_gitignore_templates() == []
+        with pytest.raises(
+            gen_gitignore.GitignoreTemplatesUnavailable,
+            match="HASTY_CODER_GITIGNORE_NETWORK=1",
+        ):
+            gen_gitignore.gen_gitignore_for_language("Python")
+    finally:
+        gitignore_pack.get_gitignore_pack.cache_clear()
+
+
+def test_projects_without_templates_get_an_llm_gitignore(tmp_path, monkeypatch):
+    (tmp_path / "tmp").mkdir()
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path / "tmp"))
+    monkeypatch.setenv("HASTY_CODER_GITIGNORE_PACK", str(tmp_path / "missing.pack"))
+    monkeypatch.delenv("HASTY_CODER_GITIGNORE_NETWORK", raising=False)
+    gitignore_pack.get_gitignore_pack.cache_clear()
+
+    def no_network(*args, **kwargs):
+        raise AssertionError("network should not be used")
+
+    monkeypatch.setattr(filecache._session, "get", no_network)
+    plan = SoftwareProjectPlan(
+        software_name="Shop",
+        software_stack={"programming_language": "Python"},
+        project_files={".gitignore": "Ignores build files"},
+    )
+    backend = llm.FakeBackend(responses=["__pycache__/\nENDOFFILE_ZZZ"])
+    previous = llm.set_backend(backend)
+    try:
+        project_path = implement_project_plan(plan, str(tmp_path / "projects"))
+    finally:
+        llm.set_backend(previous)
+        gitignore_pack.get_gitignore_pack.cache_clear()
+    assert len(backend.prompts) == 1
+    gitignore = (Path(project_path) / ".gitignore").read_text(encoding="utf-8")
+    assert gitignore.startswith("__pycache__/")
@@ -0,0 +1,353 @@
+import contextvars
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import orjson
+import pytest
+
+from hasty_coder import llm
+from hasty_coder.llm import (
+    BackendPool,
+    CompletionResult,
+    FakeBackend,
+    OpenAIHTTPBackend,
+    PoolMember,
+)
+
+
+def test_fake_backend_json_retry():
+    backend = FakeBackend(responses=['{"a": ', "1,}"])
+    assert llm.complete("prompt", as_json=True, backend=backend) == {"a": 1}
+    assert backend.prompts == ["prompt", 'prompt{"a": ']
+
+
+def test_fake_backend_applies_stop_sequences():
+    backend = FakeBackend(responses=["some code\n```\nmore text"])
+    assert llm.complete("prompt", stop=["```"], backend=backend) == "some code"
+
+
+def test_set_backend():
+    backend = FakeBackend(responses=["hello"])
+    previous = llm.set_backend(backend)
+    try:
+        assert llm.complete("prompt") == "hello"
+    finally:
+        llm.set_backend(previous)
+
+
+class CompletionsHandler(BaseHTTPRequestHandler):
+    rate_limit_count = 0
+    requests_seen = []
+
+    def do_POST(self):  # noqa
+        body = orjson.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.requests_seen.append((self.path, self.headers["Authorization"], body))
+        if CompletionsHandler.rate_limit_count:
+            CompletionsHandler.rate_limit_count -= 1
+            self.send_response(429)
+            self.end_headers()
+            return
+        response = orjson.dumps(
+            {
+                "choices": [{"text": f"echo: {body['prompt']}"}],
+                "usage": {"prompt_tokens": 3, "completion_tokens": 4},
+            }
+        )
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args):  # noqa
+        pass
+
+
+@pytest.fixture(name="completions_server")
+def completions_server_fixture():
+    CompletionsHandler.requests_seen = []
+    CompletionsHandler.rate_limit_count = 0
+    server = HTTPServer(("127.0.0.1", 0), CompletionsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/v1"
+    server.shutdown()
+
+
+def test_openai_compatible_http_backend(completions_server, monkeypatch):
+    monkeypatch.setattr(llm, "RATE_LIMIT_PAUSE_SECONDS", 0)
+    CompletionsHandler.rate_limit_count = 1
+    backend = OpenAIHTTPBackend(api_key="sk-test", base_url=completions_server)
+    tokens_before = llm.token_usage.total_tokens
+
+    answer = llm.complete("hi", temperature=0.5, stop=["END"], backend=backend)
+
+    assert answer == "echo: hi"
+    assert llm.token_usage.total_tokens - tokens_before == 7
+    assert len(CompletionsHandler.requests_seen) == 2
+    path, auth, body = CompletionsHandler.requests_seen[-1]
+    assert path == "/v1/completions"
+    assert auth == "Bearer sk-test"
+    assert body["temperature"] == 0.5
+    assert body["stop"] == ["END"]
+
+
+def test_fair_limiter_takes_turns_between_groups():
+    limiter = llm.FairLimiter(max_concurrent=1)
+    limiter.acquire("a")
+    admitted = []
+    admitted_changed = threading.Condition()
+
+    def wait_for_slot(group):
+        limiter.acquire(group)
+        with admitted_changed:
+            admitted.append(group)
+            admitted_changed.notify_all()
+
+    def queued():
+        # pylint: disable=protected-access
+        return sum(len(events) for events in limiter._waiting.values())
+
+    threads = []
+    for group in ["a", "a", "a", "b"]:
+        threads.append(threading.Thread(target=wait_for_slot, args=(group,)))
+        threads[-1].start()
+        while queued() < len(threads):
+            time.sleep(0.001)
+
+    for expected_count in range(1, len(threads) + 1):
+        limiter.release()
+        with admitted_changed:
+            assert admitted_changed.wait_for(
+                lambda n=expected_count: len(admitted) == n, timeout=5
+            )
+    for thread in threads:
+        thread.join()
+
+    # "b" queued last but doesn't wait behind all of "a"
+    assert admitted == ["a", "b", "a", "a"]
+    assert limiter.active == 1
+
+
+def test_limited_completions_count_tokens_per_group():
+    limiter = llm.FairLimiter(max_concurrent=2)
+    previous = llm.set_limiter(limiter)
+    backend = FakeBackend(responses=lambda prompt: prompt.upper())
+    group = ("test", "tokens")
+
+    def complete_in_group(prompt):
+        llm.completion_group.set(group)
+        return llm.complete(prompt, temperature=0.5, backend=backend)
+
+    try:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            answers = list(
+                executor.map(
+                    lambda p: contextvars.copy_context().run(complete_in_group, p),
+                    ["one", "two", "three"],
+                )
+            )
+    finally:
+        llm.set_limiter(previous)
+
+    assert answers == ["ONE", "TWO", "THREE"]
+    assert limiter.active == 0
+    usage = llm.group_token_usage(group)
+    assert usage.prompt_tokens > 0
+    assert usage.completion_tokens > 0
+    assert llm.completion_group.get() is None
+
+
+@pytest.fixture(name="start_stub_server")
+def start_stub_server_fixture():
+    """Start completion servers that answer with `status`, each recording its own requests."""
+    servers = []
+
+    def start_stub_server(status=200):
+        handler = type(
+            "StubHandler",
+            (CompletionsHandler,),
+            {"requests_seen": [], "rate_limit_count": 0, "status": status},
+        )
+
+        def do_post(self):
+            if self.status == 200:
+                CompletionsHandler.do_POST(self)
+                return
+            self.requests_seen.append((self.path, self.headers["Authorization"], {}))
+            self.rfile.read(int(self.headers["Content-Length"]))
+            self.send_response(self.status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        handler.do_POST = do_post
+        server = HTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return handler, f"http://127.0.0.1:{server.server_port}/v1"
+
+    yield start_stub_server
+    for server in servers:
+        server.shutdown()
+
+
+def test_backend_pool_spreads_requests_over_least_loaded(start_stub_server):
+    handlers, members = [], []
+    for key in ["sk-a", "sk-b", "sk-c"]:
+        handler, url = start_stub_server()
+        handlers.append(handler)
+        members.append(OpenAIHTTPBackend(api_key=key, base_url=url))
+    pool = BackendPool(members)
+
+    for i in range(6):
+        assert llm.complete(f"hi {i}", temperature=0.5, backend=pool) == f"echo: hi {i}"
+
+    assert [len(h.requests_seen) for h in handlers] == [2, 2, 2]
+    assert {h.requests_seen[0][1] for h in handlers} == {
+        "Bearer sk-a",
+        "Bearer sk-b",
+        "Bearer sk-c",
+    }
+    assert all(m.in_flight == 0 for m in pool.members)
+
+
+def test_backend_pool_fails_over_and_ejects(start_stub_server, monkeypatch):
+    monkeypatch.setattr(llm, "RATE_LIMIT_PAUSE_SECONDS", 0)
+    broken, broken_url = start_stub_server(status=500)
+    limited, limited_url = start_stub_server(status=429)
+    healthy, healthy_url = start_stub_server()
+    pool = BackendPool(
+        [
+            PoolMember(OpenAIHTTPBackend(base_url=broken_url), weight=10),
+            PoolMember(OpenAIHTTPBackend(base_url=limited_url), weight=5),
+            OpenAIHTTPBackend(base_url=healthy_url),
+        ],
+        max_failures=2,
+    )
+
+    for i in range(5):
+        assert llm.complete(f"hi {i}", temperature=0.5, backend=pool) == f"echo: hi {i}"
+
+    # every request succeeded on its first llm.complete attempt by failing over inside the pool
+    assert len(healthy.requests_seen) == 5
+    # rate limited once then ejected. failed twice in a row then ejected
+    assert len(limited.requests_seen) == 1
+    assert len(broken.requests_seen) == 2
+    broken_member, limited_member, _ = pool.members
+    assert broken_member.failures == 2
+    assert broken_member.is_ejected(time.monotonic())
+    assert limited_member.is_ejected(time.monotonic())
+
+
+def test_backend_pool_raises_when_every_member_fails(start_stub_server):
+    _, url_a = start_stub_server(status=500)
+    _, url_b = start_stub_server(status=503)
+    pool = BackendPool(
+        [OpenAIHTTPBackend(base_url=url_a), OpenAIHTTPBackend(base_url=url_b)]
+    )
+    with pytest.raises(llm.CompletionError, match="error from"):
+        llm.complete("hi", backend=pool)
+
+
+def test_backend_pool_raises_bad_requests_without_failing_over(start_stub_server):
+    rejecting, rejecting_url = start_stub_server(status=400)
+    healthy, healthy_url = start_stub_server()
+    pool = BackendPool(
+        [
+            PoolMember(OpenAIHTTPBackend(base_url=rejecting_url), weight=10),
+            OpenAIHTTPBackend(base_url=healthy_url),
+        ],
+        max_failures=1,
+    )
+    for _ in range(3):
+        with pytest.raises(llm.BadRequestError, match="400 error from"):
+            llm.complete("a prompt that is too long", backend=pool)
+
+    assert len(rejecting.requests_seen) == 3
+    assert healthy.requests_seen == []
+    now = time.monotonic()
+    for member in pool.members:
+        assert (member.failures, member.in_flight) == (0, 0)
+        assert not member.is_ejected(now)
+
+
+def test_backend_pool_fails_over_from_rejected_keys(start_stub_server):
+    revoked, revoked_url = start_stub_server(status=401)
+    healthy, healthy_url = start_stub_server()
+    pool = BackendPool(
+        [
+            PoolMember(OpenAIHTTPBackend(base_url=revoked_url), weight=10),
+            OpenAIHTTPBackend(base_url=healthy_url),
+        ],
+        max_failures=2,
+    )
+    for i in range(4):
+        assert llm.complete(f"hi {i}", temperature=0.5, backend=pool) == f"echo: hi {i}"
+
+    assert len(revoked.requests_seen) == 2
+    assert len(healthy.requests_seen) == 4
+    revoked_member, _ = pool.members
+    assert revoked_member.failures == 2
+    assert revoked_member.is_ejected(time.monotonic())
+
+
+def test_backend_pool_weighted_routing_respects_limits():
+    release = threading.Event()
+
+    def slow(prompt):
+        release.wait(timeout=5)
+        return "slow"
+
+    slow_member = PoolMember(FakeBackend(responses=slow), weight=1000, max_concurrent=1)
+    fast_member = PoolMember(FakeBackend(responses=["fast"]), weight=1)
+    pool = BackendPool(
+        [slow_member, fast_member], routing="weighted", rng=random.Random(0)
+    )
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        slow_answer = executor.submit(pool.complete, "first")
+        while slow_member.in_flight == 0:
+            time.sleep(0.001)
+        # the heavy member is at its limit
+        assert pool.complete("second").text == "fast"
+        release.set()
+        assert slow_answer.result().text == "slow"
+
+    for i in range(50):
+        pool.complete(f"prompt {i}")
+    assert fast_member.requests < 5
+
+
+def test_backend_pool_from_env(monkeypatch):
+    monkeypatch.delenv("HASTY_CODER_POOL", raising=False)
+    monkeypatch.setenv("OPENAI_API_KEYS", "sk-a, sk-b,")
+    pool = BackendPool.from_env()
+    assert [m.backend.api_key for m in pool.members] == ["sk-a", "sk-b"]
+
+    monkeypatch.setenv(
+        "HASTY_CODER_POOL",
+        '[{"base_url": "http://localhost:8000/v1", "weight": 2, "max_concurrent": 4},'
+        ' {"api_key": "sk-c"}]',
+    )
+    local, remote = BackendPool.from_env().members
+    assert (local.backend.base_url, local.weight, local.max_concurrent) == (
+        "http://localhost:8000/v1",
+        2,
+        4,
+    )
+    assert remote.backend.api_key == "sk-c"
+
+
+def test_cached_json_answers_are_not_shared():
+    llm.clear_completion_cache()
+    backend = OpenAIHTTPBackend(api_key="sk-test", base_url="http://127.0.0.1:9")
+    monkey_results = iter([CompletionResult(text='{"files": ["a.py"]}')])
+    backend.complete = lambda *args, **kwargs: next(monkey_results)
+
+    first = llm.complete("plan", as_json=True, backend=backend)
+    first["files"].append("mutated.py")
+    second = llm.complete("plan", as_json=True, backend=backend)
+    second["files"].clear()
+    assert llm.complete("plan", as_json=True, backend=backend) == {"files": ["a.py"]}
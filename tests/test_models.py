@@ -1,4 +1,4 @@
-from hasty_coder.models import SoftwareStack
+from hasty_coder.models import SoftwareProjectPlan, SoftwareStack
 
 
 def test_software_stack_as_markdown():
@@ -18,3 +18,78 @@ def test_software_stack_as_markdown():
 - Testing Tooling: pytest, Jest
     """
     assert markdown.strip() == expected_markdown.strip()
+
+
+def test_project_plan_dict_round_trip():
+    plan = SoftwareProjectPlan(
+        software_name="Shop",
+        features={"Carts": "hold things"},
+        software_stack=SoftwareStack(primary_programming_language="Python"),
+        project_files={"shop.py": "the shop"},
+    )
+    assert SoftwareProjectPlan.from_dict(plan.to_dict()) == plan
+
+
+def make_stack():
+    return SoftwareStack(
+        primary_programming_language="Python",
+        secondary_programming_languages=[],
+        primary_framework="Flask",
+        secondary_frameworks=[],
+        testing_tooling=["pytest"],
+    )
+
+
+def test_project_plan_json_round_trip():
+    plan = SoftwareProjectPlan(
+        software_name="Shop",
+        todo=["build it"],
+        software_stack=make_stack(),
+        project_files={"shop.py": "the shop"},
+    )
+    loaded = SoftwareProjectPlan.from_json(plan.to_json())
+    assert loaded == plan
+    assert isinstance(loaded.software_stack, SoftwareStack)
+    assert loaded.as_markdown() == plan.as_markdown()
+
+
+def test_markdown_is_cached_until_a_field_changes():
+    plan = SoftwareProjectPlan(software_name="Shop", software_stack=make_stack())
+    markdown = plan.as_markdown()
+    assert plan.as_markdown() is markdown
+    assert plan.as_markdown(excluded_sections=["software_stack"]) != markdown
+
+    plan.tagline = "Buy things"
+    assert "Buy things" in plan.as_markdown()
+
+    markdown = plan.as_markdown()
+    plan.software_stack.primary_framework = "Django"
+    assert plan.as_markdown() is not markdown
+    assert "Django" in plan.as_markdown()
+
+
+def test_markdown_is_refreshed_after_in_place_changes():
+    plan = SoftwareProjectPlan(
+        software_name="Shop",
+        software_stack={"framework": "Flask"},
+        project_files={"shop.py": "the shop"},
+        todo=["build it"],
+    )
+    markdown = plan.as_markdown()
+    assert plan.as_markdown() is markdown
+
+    plan.software_stack["framework"] = "Django"
+    plan.project_files["cart.py"] = "the cart"
+    plan.todo.append("test it")
+    markdown = plan.as_markdown()
+    assert "Django" in markdown
+    assert "`cart.py` - the cart" in markdown
+    assert "test it" in markdown
+
+
+def test_markdown_is_refreshed_after_in_place_changes_to_the_stack():
+    plan = SoftwareProjectPlan(software_name="Shop", software_stack=make_stack())
+    markdown = plan.as_markdown()
+    plan.software_stack.secondary_programming_languages.append("Rust")
+    assert plan.as_markdown() is not markdown
+    assert "Rust" in plan.as_markdown()
@@ -0,0 +1,70 @@
+import os
+
+from hasty_coder.project_map import ProjectMap
+from hasty_coder.tasklib.describe_project import get_project_files_and_descriptions
+
+
+def _make_project(tmp_path):
+    project_path = tmp_path / "project"
+    (project_path / "pkg").mkdir(parents=True)
+    (project_path / "pkg" / "core.py").write_text(
+        '"""Core logic."""\n\ndef run(args):\n    pass\n', encoding="utf-8"
+    )
+    (project_path / "notes.txt").write_text("notes", encoding="utf-8")
+    (project_path / "build").mkdir()
+    (project_path / "build" / "out.py").write_text("", encoding="utf-8")
+    return project_path
+
+
+def test_project_map_contents(tmp_path):
+    project_path = _make_project(tmp_path)
+    project_map = ProjectMap(project_path, map_path=str(tmp_path / "map.gz"))
+    assert sorted(project_map.refresh()) == [
+        "notes.txt",
+        os.path.join("pkg", "core.py"),
+    ]
+    assert project_map.file_paths() == ["notes.txt", os.path.join("pkg", "core.py")]
+    info = project_map.files[os.path.join("pkg", "core.py")]
+    assert info.docstring == "Core logic."
+    assert info.symbols == ["def run(args)"]
+
+
+def test_project_map_is_persisted_and_incremental(tmp_path, monkeypatch):
+    project_path = _make_project(tmp_path)
+    map_path = str(tmp_path / "map.gz")
+    ProjectMap(project_path, map_path=map_path).refresh()
+
+    project_map = ProjectMap(project_path, map_path=map_path)
+    opened = []
+    real_open = open
+
+    def tracking_open(path, *args, **kwargs):
+        opened.append(str(path))
+        return real_open(path, *args, **kwargs)
+
+    monkeypatch.setattr("builtins.open", tracking_open)
+    assert project_map.refresh() == []
+    assert not any(str(project_path) in path for path in opened)
+
+    (project_path / "pkg" / "extra.py").write_text('"""Extra."""\n', encoding="utf-8")
+    os.remove(project_path / "notes.txt")
+    assert project_map.refresh() == [os.path.join("pkg", "extra.py")]
+    assert "notes.txt" not in project_map.files
+
+
+def test_gitignore_change_relists_subdirectories(tmp_path):
+    project_path = _make_project(tmp_path)
+    project_map = ProjectMap(project_path, map_path=str(tmp_path / "map.gz"))
+    project_map.refresh()
+    (project_path / ".gitignore").write_text("core.py\n", encoding="utf-8")
+    project_map.refresh()
+    assert os.path.join("pkg", "core.py") not in project_map.files
+
+
+def test_get_project_files_and_descriptions(tmp_path, monkeypatch):
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path / "tmp"))
+    project_path = _make_project(tmp_path)
+    assert get_project_files_and_descriptions(project_path) == {
+        "notes.txt": "",
+        os.path.join("pkg", "core.py"): "Core logic.",
+    }
@@ -0,0 +1,108 @@
+import random
+
+import pytest
+
+from hasty_coder import llm
+from hasty_coder.prompt_reuse import ReuseCache
+
+TAGLINE_PROMPT = (
+    "Shop Keeper is a command line tool that keeps track of the stock of a small shop, "
+    "warns when items run low and prints a report of the week's sales. "
+    "Write a clever and witty tagline for the project."
+)
+
+
+@pytest.fixture(name="reuse_cache")
+def reuse_cache_fixture(tmp_path, monkeypatch):
+    (tmp_path / "tmp").mkdir()
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path / "tmp"))
+    reuse_cache = ReuseCache(min_answers=2, max_answers=3, rng=random.Random(0))
+    previous = llm.set_reuse_cache(reuse_cache)
+    yield reuse_cache
+    llm.set_reuse_cache(previous)
+
+
+def counting_backend():
+    answers = iter(f"answer {i}" for i in range(100))
+    return llm.FakeBackend(responses=lambda prompt: next(answers))
+
+
+def test_fixed_prompt_samples_earlier_answers(reuse_cache):
+    backend = counting_backend()
+    answers = [
+        llm.complete(
+            "write a bio", temperature=0.9, backend=backend, reuse_family="bio"
+        )
+        for _ in range(20)
+    ]
+    assert answers[:2] == ["answer 0", "answer 1"]
+    assert set(answers) == {"answer 0", "answer 1"}
+    assert len(backend.prompts) == 2
+    assert reuse_cache.calls_saved == 18
+
+
+def test_near_identical_prompts_share_answers(reuse_cache):
+    backend = counting_backend()
+    for _ in range(2):
+        llm.complete(TAGLINE_PROMPT, temperature=0.9, backend=backend, reuse_family="t")
+    similar = TAGLINE_PROMPT.replace("small shop", "tiny shop")
+    assert llm.complete(
+        similar, temperature=0.9, backend=backend, reuse_family="t"
+    ) in {"answer 0", "answer 1"}
+    assert len(backend.prompts) == 2
+
+    different = "Write a witty tagline for a weather app that only forecasts rain."
+    assert (
+        llm.complete(different, temperature=0.9, backend=backend, reuse_family="t")
+        == "answer 2"
+    )
+
+
+def test_reuse_is_opt_in(reuse_cache):
+    backend = counting_backend()
+    for _ in range(3):
+        llm.complete("write a bio", temperature=0.9, backend=backend)
+        llm.complete("write a bio", temperature=0, backend=backend, reuse_family="bio")
+    # no family, or not sampled
+    assert len(backend.prompts) == 6
+    assert reuse_cache.calls_saved == 0
+
+
+def test_json_answers_are_copies(tmp_path):
+    reuse_cache = ReuseCache(min_answers=1, cache_dir=str(tmp_path))
+    answer = {"features": ["search"]}
+    reuse_cache.add("features-json", "list the features", answer)
+    answer["features"].append("changed by the caller")
+    reused = reuse_cache.get("features-json", "list the features")
+    assert reused == {"features": ["search"]}
+    reused["features"].clear()
+    assert reuse_cache.get("features-json", "list the features") == {
+        "features": ["search"]
+    }
+
+
+def test_pools_are_bounded_and_saved(reuse_cache):
+    for i in range(5):
+        reuse_cache.add("bio", "write a bio", f"bio {i}")
+    for i in range(40):
+        reuse_cache.add("bio", f"prompt number {i} about {i * 7919}", "x")
+
+    reloaded = ReuseCache(min_answers=3, max_answers=3)
+    # the oldest prompt fell out of the pool
+    assert reloaded.get("bio", "write a bio") is None
+    assert len(reloaded._pool("bio")) == 32  # pylint: disable=protected-access
+    assert reloaded.get("bio", "prompt number 39 about 308841") is None
+    reloaded.add("bio", "prompt number 39 about 308841", "y")
+    reloaded.add("bio", "prompt number 39 about 308841", "z")
+    assert reloaded.get("bio", "prompt number 39 about 308841") in {"x", "y", "z"}
+
+    reuse_cache.add("bio", "a new bio", "one")
+    for i in range(5):
+        reuse_cache.add("bio", "a new bio", f"more {i}")
+    assert ReuseCache()._pool("bio")[
+        "a new bio"
+    ].answers == [  # pylint: disable=protected-access
+        "more 2",
+        "more 3",
+        "more 4",
+    ]
@@ -0,0 +1,115 @@
+from hasty_coder import main, search_index
+from hasty_coder.project_map import ProjectMap
+from hasty_coder.search_index import ProjectSearchIndex, search_terms
+from hasty_coder.tasklib.describe_project import fill_in_project_plan_from_path
+
+PROJECT_FILES = {
+    "billing/invoices.py": '"""Create and send invoices."""\n\ndef send_invoice(invoice_id):\n    pass\n',
+    "billing/taxes.py": '"""Tax rates by region."""\n\nclass TaxTable:\n    def rate_for(self, region):\n        pass\n',
+    "users/accounts.py": '"""User accounts and passwords."""\n\ndef reset_password(user):\n    pass\n',
+    "README.md": "# Example\n",
+}
+
+
+def _make_project(tmp_path):
+    project_path = tmp_path / "project"
+    (project_path / ".git").mkdir(parents=True)
+    for rel_path, contents in PROJECT_FILES.items():
+        (project_path / rel_path).parent.mkdir(parents=True, exist_ok=True)
+        (project_path / rel_path).write_text(contents, encoding="utf-8")
+    return project_path
+
+
+def _make_index(tmp_path):
+    project_map = ProjectMap(_make_project(tmp_path), map_path=str(tmp_path / "map.gz"))
+    project_map.refresh()
+    return ProjectSearchIndex(project_map)
+
+
+def test_search_terms():
+    assert search_terms("billing/TaxTable.rate_for(self)") == [
+        "billing",
+        "tax",
+        "table",
+        "rate",
+    ]
+
+
+def test_search_ranks_relevant_files_first(tmp_path):
+    index = _make_index(tmp_path)
+
+    results = index.search("send a tax invoice")
+    assert [rel_path for rel_path, _ in results][:2] == [
+        "billing/invoices.py",
+        "billing/taxes.py",
+    ]
+    assert index.describe("billing/taxes.py") == (
+        "Tax rates by region. Defines `class TaxTable`, `def rate_for(self, region)`"
+    )
+
+
+def test_search_follows_project_changes(tmp_path):
+    index = _make_index(tmp_path)
+    assert index.search("login") == []
+    accounts = tmp_path / "project" / "users" / "accounts.py"
+    accounts.write_text('"""Login sessions."""\n', encoding="utf-8")
+    assert index.project_map.refresh() == ["users/accounts.py"]
+    assert index.search("login")[0][0] == "users/accounts.py"
+
+
+def test_relevant_files_respects_budget(tmp_path):
+    index = _make_index(tmp_path)
+    files = index.relevant_files("billing", exclude={"billing/invoices.py"})
+    assert list(files) == ["billing/taxes.py"]
+    assert index.relevant_files("billing", max_tokens=5) == {}
+
+
+def test_fill_in_project_plan_with_relevant_files(tmp_path, monkeypatch):
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path / "tmp"))
+    project_path = _make_project(tmp_path)
+    plan = fill_in_project_plan_from_path(
+        str(project_path / "billing" / "refunds.py"), relevant_to="refund an invoice"
+    )
+    assert list(plan.project_files)[0] == "billing/invoices.py"
+    assert "users/accounts.py" not in plan.project_files
+
+
+def test_write_file_without_description_lists_relevant_files(tmp_path, monkeypatch):
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path / "tmp"))
+    project_path = _make_project(tmp_path)
+    plans = []
+
+    def fake_generate_file_contents(path, project_plan):
+        plans.append(project_plan)
+        return ""
+
+    monkeypatch.setattr(main, "generate_file_contents", fake_generate_file_contents)
+    main.write_file(str(project_path / "billing" / "refunds.py"), description=None)
+
+    project_files = plans[0].project_files
+    assert "billing/invoices.py" in project_files
+    assert "users/accounts.py" not in project_files
+
+
+def test_terms_are_persisted(tmp_path, monkeypatch):
+    index = _make_index(tmp_path)
+    assert index.search("invoice")[0][0] == "billing/invoices.py"
+
+    computed = []
+    real_file_terms = search_index._file_terms
+
+    def counting_file_terms(rel_path, info):
+        computed.append(rel_path)
+        return real_file_terms(rel_path, info)
+
+    monkeypatch.setattr(search_index, "_file_terms", counting_file_terms)
+    accounts = tmp_path / "project" / "users" / "accounts.py"
+    accounts.write_text('"""Login sessions."""\n', encoding="utf-8")
+    project_map = ProjectMap(tmp_path / "project", map_path=str(tmp_path / "map.gz"))
+    project_map.refresh()
+    reloaded = ProjectSearchIndex(project_map)
+
+    assert reloaded.search("login")[0][0] == "users/accounts.py"
+    assert reloaded.search("invoice")[0][0] == "billing/invoices.py"
+    # only the changed file was indexed again
+    assert computed == ["users/accounts.py"]
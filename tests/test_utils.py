@@ -0,0 +1,30 @@
+import threading
+import time
+
+from hasty_coder.utils import parallel_imap_unordered
+
+
+def test_parallel_imap_unordered_bounds_work_in_flight():
+    lock = threading.Lock()
+    state = {"running": 0, "max_running": 0, "pulled": 0}
+
+    def items():
+        for i in range(20):
+            state["pulled"] += 1
+            yield i
+
+    def work(i):
+        with lock:
+            state["running"] += 1
+            state["max_running"] = max(state["max_running"], state["running"])
+        time.sleep(0.001)
+        with lock:
+            state["running"] -= 1
+        return i * 2
+
+    results = parallel_imap_unordered(work, items(), max_workers=2, max_pending=3)
+    first = next(results)
+    assert state["pulled"] <= 4
+    rest = list(results)
+    assert sorted([first] + rest) == [(i, i * 2) for i in range(20)]
+    assert state["max_running"] <= 2
@@ -0,0 +1,158 @@
+import multiprocessing
+import time
+
+from hasty_coder import llm
+from hasty_coder.workqueue import (
+    WorkQueue,
+    comments_task,
+    enqueue_comments,
+    enqueue_review,
+    review_comments,
+    run_worker,
+)
+
+
+def square(payload):
+    return payload["n"] ** 2
+
+
+def flaky(payload):
+    if payload["n"] % 2:
+        raise ValueError("odd")
+    return payload["n"]
+
+
+def test_lease_complete(tmp_path):
+    with WorkQueue(str(tmp_path / "q.db")) as queue:
+        assert queue.enqueue("square", [{"n": 1}, {"n": 2}]) == 2
+        job = queue.lease("a")
+        assert job.payload == {"n": 1}
+        assert queue.lease("b").payload == {"n": 2}
+        assert queue.lease("c") is None
+        queue.complete(job.id, 1, "a")
+        assert queue.results() == [({"n": 1}, 1)]
+        assert queue.counts() == {"done": 1, "leased": 1}
+
+
+def test_failed_jobs_are_retried(tmp_path):
+    with WorkQueue(str(tmp_path / "q.db")) as queue:
+        queue.enqueue("square", [{"n": 1}], max_attempts=2)
+        queue.fail(queue.lease("a").id, "boom", "a")
+        job = queue.lease("a")
+        assert job.attempts == 2
+        queue.fail(job.id, "boom", "a")
+        assert queue.lease("a") is None
+        assert queue.counts() == {"failed": 1}
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    with WorkQueue(str(tmp_path / "q.db"), lease_seconds=0.05) as queue:
+        queue.enqueue("square", [{"n": 1}])
+        first = queue.lease("a")
+        time.sleep(0.1)
+        second = queue.lease("b")
+        assert second.id == first.id
+        assert second.attempts == 2
+        # the first worker's lease is gone, so it can't finish or requeue the job
+        assert not queue.complete(first.id, 1, "a")
+        assert not queue.fail(first.id, "boom", "a")
+        assert queue.counts() == {"leased": 1}
+        assert queue.complete(second.id, 1, "b")
+        assert queue.results() == [({"n": 1}, 1)]
+
+
+def test_expired_leases_use_up_attempts(tmp_path):
+    with WorkQueue(str(tmp_path / "q.db"), lease_seconds=0.01) as queue:
+        queue.enqueue("square", [{"n": 1}], max_attempts=2)
+        leases = 0
+        while queue.lease(f"worker-{leases}") is not None:
+            leases += 1
+            time.sleep(0.02)
+        assert leases == 2
+        assert queue.counts() == {"failed": 1}
+
+
+def test_run_worker_records_failures(tmp_path):
+    queue_path = str(tmp_path / "q.db")
+    with WorkQueue(queue_path) as queue:
+        queue.enqueue("flaky", [{"n": n} for n in range(4)], max_attempts=2)
+    assert run_worker(queue_path, handlers={"flaky": flaky}, poll_seconds=0.01) == 2
+    with WorkQueue(queue_path) as queue:
+        assert [result for _, result in queue.results()] == [0, 2]
+        assert queue.counts() == {"done": 2, "failed": 2}
+
+
+def _drain(queue_path):
+    return run_worker(queue_path, handlers={"square": square}, poll_seconds=0.01)
+
+
+def test_multiple_worker_processes(tmp_path):
+    queue_path = str(tmp_path / "q.db")
+    with WorkQueue(queue_path) as queue:
+        queue.enqueue("square", [{"n": n} for n in range(200)])
+
+    with multiprocessing.get_context("fork").Pool(4) as pool:
+        processed = pool.map(_drain, [queue_path] * 4)
+
+    assert sum(processed) == 200
+    with WorkQueue(queue_path) as queue:
+        results = queue.results("square")
+    assert sorted(result for _, result in results) == [n**2 for n in range(200)]
+
+
+DUPLICATED_CODE = """
+def total(prices):
+    result = 0
+    for price in prices:
+        result += price
+    return result
+"""
+
+
+def _write_duplicated_project(tmp_path):
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+    (project_path / "cart.py").write_text(DUPLICATED_CODE, encoding="utf-8")
+    (project_path / "orders.py").write_text(
+        "\n" * 10 + DUPLICATED_CODE.replace("prices", "amounts"), encoding="utf-8"
+    )
+    return project_path
+
+
+def test_duplicate_reviews_are_queued_once(tmp_path):
+    project_path = _write_duplicated_project(tmp_path)
+    queue_path = str(tmp_path / "q.db")
+    assert enqueue_review(queue_path, str(project_path)) == 1
+
+    with WorkQueue(queue_path) as queue:
+        job = queue.lease("a")
+    assert len(job.payload["duplicates"]) == 1
+    located = review_comments(
+        job.payload, [(job.payload["start_line"] + 3, "off by one")]
+    )
+    assert sorted((path.rsplit("/", 1)[-1], line) for path, line, _ in located) == [
+        ("cart.py", 5),
+        ("orders.py", 15),
+    ]
+
+
+def test_duplicate_comments_are_queued_once(tmp_path):
+    project_path = _write_duplicated_project(tmp_path)
+    (project_path / "orders.py").write_text(DUPLICATED_CODE, encoding="utf-8")
+    queue_path = str(tmp_path / "q.db")
+    assert enqueue_comments(queue_path, str(project_path)) == 1
+
+    with WorkQueue(queue_path) as queue:
+        job = queue.lease("a")
+    backend = llm.FakeBackend(responses=['{"2": "Add up the prices."}'])
+    previous = llm.set_backend(backend)
+    try:
+        edits = comments_task(job.payload)
+    finally:
+        llm.set_backend(previous)
+    assert len(backend.prompts) == 1
+    assert sorted(edit[0].rsplit("/", 1)[-1] for edit in edits) == [
+        "cart.py",
+        "orders.py",
+    ]
+    assert all("Add up the prices." in edit[4] for edit in edits)